@@ -11,6 +11,8 @@ import logging
 from collections import defaultdict
 import json
 
+from ..retrieval.fusion import ResultFusion
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -337,7 +339,8 @@ class KnowledgeGraphRetriever:
         return sorted(similar_entities, key=lambda x: x[1], reverse=True)[:top_k]
 
 class HybridRetriever:
-    def __init__(self, vector_retriever, graph_retriever, fusion_strategy: str = 'weighted'):
+    def __init__(self, vector_retriever, graph_retriever, fusion_strategy: str = 'weighted',
+                 rrf_k: float = 0.0, normalization: Optional[str] = None):
         """
         Hybrid retriever combining vector and graph-based approaches
         
@@ -345,10 +348,15 @@ class HybridRetriever:
             vector_retriever: Multi-vector retriever
             graph_retriever: Knowledge graph retriever
             fusion_strategy: Strategy for fusing results ('weighted', 'reciprocal_rank', 'comb_sum')
+            rrf_k: Constant for reciprocal rank fusion; 0 keeps the original 1/rank weighting
+            normalization: Score normalization for weighted and comb_sum fusion ('minmax',
+                'zscore' or None); None keeps the original raw-score fusion
         """
         self.vector_retriever = vector_retriever
         self.graph_retriever = graph_retriever
         self.fusion_strategy = fusion_strategy
+        self.rrf_k = rrf_k
+        self.normalization = normalization
     
     def retrieve(self, query: str, k: int = 10, 
                 vector_weight: float = 0.7, graph_weight: float = 0.3) -> List[RetrievalResult]:
@@ -382,118 +390,52 @@ class HybridRetriever:
     def _weighted_fusion(self, vector_results: List[RetrievalResult], 
                         graph_results: List[RetrievalResult], 
                         vector_weight: float, graph_weight: float, k: int) -> List[RetrievalResult]:
-        """Weighted fusion of results"""
-        all_results = {}
-        
-        # Add vector results
-        for result in vector_results:
-            doc_id = result.document_id
-            if doc_id in all_results:
-                all_results[doc_id].score += result.score * vector_weight
-            else:
-                all_results[doc_id] = RetrievalResult(
-                    document_id=doc_id,
-                    content=result.content,
-                    score=result.score * vector_weight,
-                    source=result.source,
-                    metadata=result.metadata
-                )
-        
-        # Add graph results
-        for result in graph_results:
-            doc_id = result.document_id
-            if doc_id in all_results:
-                all_results[doc_id].score += result.score * graph_weight
-            else:
-                all_results[doc_id] = RetrievalResult(
-                    document_id=doc_id,
-                    content=result.content,
-                    score=result.score * graph_weight,
-                    source=result.source,
-                    metadata=result.metadata
-                )
-        
-        # Sort by combined score
-        sorted_results = sorted(all_results.values(), key=lambda x: x.score, reverse=True)
-        return sorted_results[:k]
+        """Weighted fusion of normalized scores"""
+        fusion = ResultFusion(method='weighted', normalization=self.normalization)
+        return self._fuse(fusion, vector_results, graph_results, k, 
+                          weights=[vector_weight, graph_weight], require_content=False)
     
     def _reciprocal_rank_fusion(self, vector_results: List[RetrievalResult], 
                                graph_results: List[RetrievalResult], k: int) -> List[RetrievalResult]:
         """Reciprocal rank fusion"""
-        doc_scores = {}
-        
-        # Vector results
-        for i, result in enumerate(vector_results):
-            doc_id = result.document_id
-            score = 1 / (i + 1)  # Reciprocal rank
-            if doc_id in doc_scores:
-                doc_scores[doc_id] += score
-            else:
-                doc_scores[doc_id] = score
-        
-        # Graph results
-        for i, result in enumerate(graph_results):
-            doc_id = result.document_id
-            score = 1 / (i + 1)  # Reciprocal rank
-            if doc_id in doc_scores:
-                doc_scores[doc_id] += score
-            else:
-                doc_scores[doc_id] = score
-        
-        # Sort by combined score
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        
-        # Return top k results
-        results = []
-        for doc_id, score in sorted_docs[:k]:
-            # Find the original result to get content
-            original_result = next((r for r in vector_results if r.document_id == doc_id), None)
-            if original_result:
-                results.append(RetrievalResult(
-                    document_id=doc_id,
-                    content=original_result.content,
-                    score=score,
-                    source=original_result.source,
-                    metadata=original_result.metadata
-                ))
-        
-        return results
+        fusion = ResultFusion(method='rrf', k=self.rrf_k)
+        return self._fuse(fusion, vector_results, graph_results, k)
     
     def _comb_sum_fusion(self, vector_results: List[RetrievalResult], 
                         graph_results: List[RetrievalResult], k: int) -> List[RetrievalResult]:
         """Combination sum fusion"""
-        doc_scores = {}
-        
-        # Vector results
-        for result in vector_results:
-            doc_id = result.document_id
-            if doc_id in doc_scores:
-                doc_scores[doc_id] += result.score
-            else:
-                doc_scores[doc_id] = result.score
-        
-        # Graph results
-        for result in graph_results:
-            doc_id = result.document_id
-            if doc_id in doc_scores:
-                doc_scores[doc_id] += result.score
-            else:
-                doc_scores[doc_id] = result.score
-        
-        # Sort by combined score
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
+        fusion = ResultFusion(method='comb_sum', normalization=self.normalization)
+        return self._fuse(fusion, vector_results, graph_results, k)
+    
+    def _fuse(self, fusion: ResultFusion, vector_results: List[RetrievalResult], 
+             graph_results: List[RetrievalResult], k: int, 
+             weights: Optional[List[float]] = None, 
+             require_content: bool = True) -> List[RetrievalResult]:
+        """Fuse vector and graph results by document ID"""
+        fused = fusion.fuse(
+            [[r.document_id for r in vector_results], [r.document_id for r in graph_results]],
+            scores=[[r.score for r in vector_results], [r.score for r in graph_results]],
+            weights=weights
+        )
         
-        # Return top k results
         results = []
-        for doc_id, score in sorted_docs[:k]:
-            original_result = next((r for r in vector_results if r.document_id == doc_id), None)
-            if original_result:
-                results.append(RetrievalResult(
-                    document_id=doc_id,
-                    content=original_result.content,
-                    score=score,
-                    source=original_result.source,
-                    metadata=original_result.metadata
-                ))
+        for doc_id, score, (vector_idx, graph_idx) in zip(fused.ids, fused.scores, fused.positions):
+            if vector_idx >= 0:
+                original_result = vector_results[vector_idx]
+            elif require_content:
+                # Graph-only hits carry no content to generate from
+                continue
+            else:
+                original_result = graph_results[graph_idx]
+            
+            results.append(RetrievalResult(
+                document_id=doc_id,
+                content=original_result.content,
+                score=float(score),
+                source=original_result.source,
+                metadata=original_result.metadata
+            ))
+            if len(results) >= k:
+                break
         
         return results
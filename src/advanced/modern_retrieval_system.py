@@ -27,6 +27,9 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import networkx as nx
 
+from ..retrieval.fusion import ResultFusion
+from ..retrieval.embedding_pool import EmbeddingWorkerPool
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -53,6 +56,8 @@ class RetrievalConfig:
     
     # Performance
     batch_size: int = 32
+    embedding_workers: int = 0  # Worker processes for document encoding; 0 encodes in-process
+    embedding_threads_per_worker: int = 1
     max_concurrent_searches: int = 10
     cache_ttl: int = 3600
 
@@ -84,6 +89,15 @@ class ModernRetrievalSystem:
             # Dense embedding model
             self.embedding_model = SentenceTransformer(self.config.embedding_model)
             
+            # Multi-process pool for bulk document encoding
+            self.embedding_pool = None
+            if self.config.embedding_workers > 0:
+                self.embedding_pool = EmbeddingWorkerPool(
+                    self.config.embedding_model,
+                    num_workers=self.config.embedding_workers,
+                    threads_per_worker=self.config.embedding_threads_per_worker
+                )
+            
             # Cross-encoder for reranking
             if self.config.enable_reranking:
                 self.cross_encoder = CrossEncoder(self.config.cross_encoder_model)
@@ -157,12 +171,18 @@ class ModernRetrievalSystem:
             metadatas = [doc.get('metadata', {}) for doc in documents]
             
             # Generate embeddings
-            embeddings = self.embedding_model.encode(
-                contents,
-                batch_size=self.config.batch_size,
-                show_progress_bar=True,
-                convert_to_numpy=True
-            )
+            if self.embedding_pool is not None:
+                loop = asyncio.get_running_loop()
+                embeddings = await loop.run_in_executor(
+                    None, lambda: self.embedding_pool.encode(contents, batch_size=self.config.batch_size)
+                )
+            else:
+                embeddings = self.embedding_model.encode(
+                    contents,
+                    batch_size=self.config.batch_size,
+                    show_progress_bar=True,
+                    convert_to_numpy=True
+                )
             
             # Build FAISS index
             if self.faiss_index is None:
@@ -459,39 +479,7 @@ class ModernRetrievalSystem:
     def _reciprocal_rank_fusion(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Apply reciprocal rank fusion to combine results"""
         try:
-            # Group results by content
-            content_scores = {}
-            
-            for result in results:
-                content = result['content']
-                method = result['method']
-                score = result['score']
-                rank = result.get('rank', 1)
-                
-                if content not in content_scores:
-                    content_scores[content] = {
-                        'content': content,
-                        'metadata': result['metadata'],
-                        'fusion_score': 0.0,
-                        'methods': [],
-                        'scores': {}
-                    }
-                
-                # Reciprocal rank fusion score
-                rrf_score = 1.0 / (60 + rank)  # k=60 is a common choice
-                content_scores[content]['fusion_score'] += rrf_score
-                content_scores[content]['methods'].append(method)
-                content_scores[content]['scores'][method] = score
-            
-            # Sort by fusion score
-            sorted_results = sorted(
-                content_scores.values(),
-                key=lambda x: x['fusion_score'],
-                reverse=True
-            )
-            
-            return sorted_results
-            
+            return self._fuse_by_document(results, ResultFusion(method='rrf', k=60.0))
         except Exception as e:
             self.logger.error(f"Reciprocal rank fusion error: {e}")
             return results
@@ -499,44 +487,56 @@ class ModernRetrievalSystem:
     def _weighted_fusion(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Apply weighted fusion to combine results"""
         try:
-            # Group results by content
-            content_scores = {}
-            
-            for result in results:
-                content = result['content']
-                method = result['method']
-                score = result['score']
-                
-                if content not in content_scores:
-                    content_scores[content] = {
-                        'content': content,
-                        'metadata': result['metadata'],
-                        'fusion_score': 0.0,
-                        'methods': [],
-                        'scores': {}
-                    }
-                
-                # Apply method-specific weights
-                weight = self._get_method_weight(method)
-                weighted_score = score * weight
-                
-                content_scores[content]['fusion_score'] += weighted_score
-                content_scores[content]['methods'].append(method)
-                content_scores[content]['scores'][method] = score
-            
-            # Sort by fusion score
-            sorted_results = sorted(
-                content_scores.values(),
-                key=lambda x: x['fusion_score'],
-                reverse=True
+            return self._fuse_by_document(
+                results,
+                # Raw scores, as before fusion was shared
+                ResultFusion(method='weighted', normalization=None),
+                use_method_weights=True
             )
-            
-            return sorted_results
-            
         except Exception as e:
             self.logger.error(f"Weighted fusion error: {e}")
             return results
     
+    def _fuse_by_document(
+        self, 
+        results: List[Dict[str, Any]], 
+        fusion: ResultFusion, 
+        use_method_weights: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Fuse per-method rankings keyed by document index"""
+        # Each method returns its results best first; keep them as separate ranked lists
+        by_method: Dict[str, List[Dict[str, Any]]] = {}
+        for result in results:
+            by_method.setdefault(result['method'], []).append(result)
+        
+        methods = list(by_method.keys())
+        ranked_lists = [by_method[method] for method in methods]
+        fused = fusion.fuse(
+            [[str(result['index']) for result in ranked] for ranked in ranked_lists],
+            scores=[[result['score'] for result in ranked] for ranked in ranked_lists],
+            weights=[self._get_method_weight(method) for method in methods] if use_method_weights else None
+        )
+        
+        fused_results = []
+        for doc_id, fusion_score, positions in zip(fused.ids, fused.scores, fused.positions):
+            matched = [
+                (method, ranked[position])
+                for method, ranked, position in zip(methods, ranked_lists, positions)
+                if position >= 0
+            ]
+            first = matched[0][1]
+            fused_results.append({
+                'content': first['content'],
+                'metadata': first['metadata'],
+                'index': first['index'],
+                'score': float(fusion_score),
+                'fusion_score': float(fusion_score),
+                'methods': [method for method, _ in matched],
+                'scores': {method: result['score'] for method, result in matched}
+            })
+        
+        return fused_results
+    
     def _get_method_weight(self, method: str) -> float:
         """Get weight for different retrieval methods"""
         weights = {
@@ -22,10 +22,11 @@ from .models import (
 from ..generation.rag_generator import RAGGenerator
 from ..generation.llm_manager import LLMManager
 from ..generation.prompt_manager import PromptManager
+from ..generation.semantic_cache import SemanticResponseCache
 from ..retrieval.embedding_generator import EmbeddingGenerator
 from ..retrieval.vector_store import VectorStore
 from ..retrieval.hybrid_search import HybridRetriever
-from ..retrieval.reranker import Reranker, CohereReranker
+from ..retrieval.reranker import Reranker, CascadeReranker, CohereReranker
 from ..data_processing.document_processor import DocumentProcessor
 
 # Configure logging
@@ -90,18 +91,62 @@ async def startup_event():
         # Initialize components
         llm_manager = LLMManager(
             openai_api_key=openai_api_key,
-            anthropic_api_key=anthropic_api_key
+            anthropic_api_key=anthropic_api_key,
+            max_concurrency_per_model=int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "64")),
+            max_connections_per_provider=int(os.getenv("LLM_MAX_CONNECTIONS_PER_PROVIDER", "256")),
+            model_deadlines={
+                name.strip(): float(seconds)
+                for name, seconds in (
+                    entry.rsplit(":", 1) for entry in os.getenv("LLM_MODEL_DEADLINES", "").split(",") if entry.strip()
+                )
+            },
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            recovery_timeout=float(os.getenv("LLM_BREAKER_RECOVERY_SECONDS", "30")),
+            latency_slo=float(os.getenv("LLM_LATENCY_SLO")) if os.getenv("LLM_LATENCY_SLO") else None,
+            hedge=os.getenv("LLM_HEDGE", "False").lower() == "true",
+            hedge_delay=float(os.getenv("LLM_HEDGE_DELAY", "2.0"))
         )
         
         embedding_generator = EmbeddingGenerator(
             model_name=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
-            openai_api_key=openai_api_key
+            openai_api_key=openai_api_key,
+            cache_max_bytes=int(os.getenv("EMBEDDING_MEMORY_CACHE_MB", "64")) * 1024 * 1024,
+            num_workers=int(os.getenv("EMBEDDING_WORKERS", "0")),
+            threads_per_worker=int(os.getenv("EMBEDDING_THREADS_PER_WORKER", "1")),
+            openai_max_concurrency=int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", "8")),
+            openai_tokens_per_minute=int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000")),
+            onnx_model_dir=os.getenv("EMBEDDING_ONNX_DIR") or None,
+            onnx_quantize=os.getenv("EMBEDDING_ONNX_QUANTIZE", "True").lower() == "true",
+            reduction_method=os.getenv("EMBEDDING_REDUCTION") or None,
+            reduced_dimension=int(os.getenv("EMBEDDING_REDUCED_DIM")) if os.getenv("EMBEDDING_REDUCED_DIM") else None,
+            reducer_path=os.getenv("EMBEDDING_REDUCER_PATH") or None,
+            persistent_cache_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            persistent_cache_max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024")) * 1024 * 1024
         )
         
+        # Stored vectors must all share one width, so the service never runs with a reducer
+        # that would start projecting part-way through the corpus
+        if embedding_generator.reducer is not None and not embedding_generator.reducer_fitted:
+            raise RuntimeError(
+                f"EMBEDDING_REDUCTION={os.getenv('EMBEDDING_REDUCTION')} needs a fitted reducer at "
+                f"EMBEDDING_REDUCER_PATH ({os.getenv('EMBEDDING_REDUCER_PATH') or 'not set'}); "
+                "fit one with EmbeddingGenerator.fit_dimension_reducer on a corpus sample"
+            )
+        
+        # Compressed storage is only offered by the memmap backend
+        vector_db_type = os.getenv("VECTOR_DB_TYPE", "chroma")
+        vector_store_options = {}
+        if vector_db_type == "memmap" and os.getenv("VECTOR_COMPRESSION"):
+            vector_store_options["compression"] = os.getenv("VECTOR_COMPRESSION")
+            vector_store_options["min_training_rows"] = int(os.getenv("VECTOR_COMPRESSION_MIN_TRAINING_ROWS", "10000"))
+        elif os.getenv("VECTOR_COMPRESSION"):
+            logger.warning(f"VECTOR_COMPRESSION is ignored by the {vector_db_type} backend")
+        
         vector_store = VectorStore(
-            vector_db_type=os.getenv("VECTOR_DB_TYPE", "chroma"),
+            vector_db_type=vector_db_type,
             persist_directory=os.getenv("VECTOR_DB_PATH", "./chroma_db"),
-            collection_name=os.getenv("COLLECTION_NAME", "documents")
+            collection_name=os.getenv("COLLECTION_NAME", "documents"),
+            **vector_store_options
         )
         
         # Initialize hybrid retriever (will be updated when documents are added)
@@ -109,7 +154,13 @@ async def startup_event():
             vector_store=vector_store,
             documents=[],  # Will be populated when documents are added
             alpha=float(os.getenv("VECTOR_WEIGHT", "0.7")),
-            bm25_weight=float(os.getenv("BM25_WEIGHT", "0.3"))
+            bm25_weight=float(os.getenv("BM25_WEIGHT", "0.3")),
+            fusion_method=os.getenv("HYBRID_FUSION_METHOD", "rrf"),
+            rrf_k=float(os.getenv("RRF_K", "0")),
+            concurrent_search=os.getenv("HYBRID_CONCURRENT_SEARCH", "False").lower() == "true",
+            vector_timeout=float(os.getenv("VECTOR_SEARCH_TIMEOUT")) if os.getenv("VECTOR_SEARCH_TIMEOUT") else None,
+            bm25_timeout=float(os.getenv("BM25_SEARCH_TIMEOUT")) if os.getenv("BM25_SEARCH_TIMEOUT") else None,
+            max_search_workers=int(os.getenv("HYBRID_SEARCH_WORKERS", "8"))
         )
         
         # Initialize reranker if API key is available
@@ -122,18 +173,49 @@ async def startup_event():
                 logger.warning(f"Failed to initialize Cohere reranker: {e}")
         else:
             try:
-                reranker = Reranker()
+                reranker = Reranker(
+                    batch_window_ms=float(os.getenv("RERANK_BATCH_WINDOW_MS")) if os.getenv("RERANK_BATCH_WINDOW_MS") else None,
+                    max_batch_pairs=int(os.getenv("RERANK_MAX_BATCH_PAIRS", "64")),
+                    max_length=int(os.getenv("RERANK_MAX_LENGTH", "512")),
+                    quantize_int8=os.getenv("RERANK_QUANTIZE_INT8", "False").lower() == "true",
+                    intra_op_threads=int(os.getenv("RERANK_INTRA_OP_THREADS")) if os.getenv("RERANK_INTRA_OP_THREADS") else None,
+                    inter_op_threads=int(os.getenv("RERANK_INTER_OP_THREADS")) if os.getenv("RERANK_INTER_OP_THREADS") else None,
+                    min_rank_correlation=float(os.getenv("RERANK_MIN_RANK_CORRELATION", "0.95"))
+                )
+                if os.getenv("RERANK_CASCADE", "False").lower() == "true":
+                    reranker = CascadeReranker(
+                        reranker,
+                        embedding_generator=embedding_generator,
+                        margin=float(os.getenv("RERANK_CASCADE_MARGIN", "0.3"))
+                    )
                 logger.info("Local reranker initialized")
             except Exception as e:
                 logger.warning(f"Failed to initialize local reranker: {e}")
         
+        # Semantic cache answering paraphrased queries
+        response_cache = None
+        if os.getenv("SEMANTIC_CACHE", "False").lower() == "true":
+            try:
+                response_cache = SemanticResponseCache(
+                    embedding_generator,
+                    similarity_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+                    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+                    false_hit_sample_rate=float(os.getenv("SEMANTIC_CACHE_SAMPLE_RATE", "0.02"))
+                )
+                logger.info("Semantic response cache initialized")
+            except Exception as e:
+                logger.warning(f"Failed to initialize semantic response cache: {e}")
+        
         # Initialize RAG generator
         rag_generator = RAGGenerator(
             llm_manager=llm_manager,
             embedding_generator=embedding_generator,
             hybrid_retriever=hybrid_retriever,
             reranker=reranker,
-            use_reranking=reranker is not None
+            use_reranking=reranker is not None,
+            response_cache=response_cache,
+            context_token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET")) if os.getenv("CONTEXT_TOKEN_BUDGET") else None,
+            duplicate_threshold=float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
         )
         
         logger.info("RAG system initialized successfully")
@@ -142,6 +224,18 @@ async def startup_event():
         logger.error(f"Failed to initialize RAG system: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled LLM and embedding connections, stop search and rerank threads and persist in-process indexes."""
+    if rag_generator is not None:
+        await rag_generator.llm_manager.aclose()
+        rag_generator.embedding_generator.close()
+        # The Cohere reranker holds no threads and has nothing to close
+        if isinstance(rag_generator.reranker, (Reranker, CascadeReranker)):
+            rag_generator.reranker.close()
+        rag_generator.hybrid_retriever.close()
+        rag_generator.hybrid_retriever.vector_store.close()
+
 @app.get("/", response_model=Dict[str, str])
 async def root():
     """Root endpoint with basic information."""
@@ -202,7 +296,7 @@ async def query_rag_system(
 ):
     """Query the RAG system."""
     try:
-        result = rag_gen.generate_answer(
+        result = await rag_gen.agenerate_answer(
             query=request.question,
             prompt_type=request.prompt_type.value,
             top_k=request.top_k,
@@ -227,8 +321,8 @@ async def query_rag_system_stream(
 ):
     """Query the RAG system with streaming response."""
     try:
-        def generate_stream():
-            for chunk in rag_gen.generate_streaming_answer(
+        async def generate_stream():
+            async for chunk in rag_gen.agenerate_streaming_answer(
                 query=request.question,
                 prompt_type=request.prompt_type.value,
                 top_k=request.top_k,
@@ -263,7 +357,7 @@ async def conversational_query(
             for msg in request.conversation_history
         ])
         
-        result = rag_gen.generate_answer(
+        result = await rag_gen.agenerate_answer(
             query=request.message,
             prompt_type="conversation",
             top_k=request.top_k,
@@ -297,7 +391,7 @@ async def batch_query(
         
         for query in request.queries:
             try:
-                result = rag_gen.generate_answer(
+                result = await rag_gen.agenerate_answer(
                     query=query,
                     prompt_type=request.prompt_type.value,
                     top_k=request.top_k,
@@ -373,8 +467,8 @@ async def upload_documents(
             metadatas=metadatas
         )
         
-        # Update hybrid retriever with new documents
-        rag_gen.hybrid_retriever.update_documents(texts)
+        # Update hybrid retriever with new documents, keyed by the vector store IDs
+        rag_gen.hybrid_retriever.update_documents(texts, ids=ids)
         
         return DocumentUploadResponse(
             success=True,
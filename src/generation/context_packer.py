@@ -0,0 +1,174 @@
+"""
+Token-budget context packing for RAG prompts.
+
+Passages are added in relevance order until a token budget for the target
+model is filled, with the last passage cut at a sentence boundary (or at a
+token boundary when even one sentence does not fit).  Near-duplicate
+passages, measured by word-shingle Jaccard similarity, are dropped so they do
+not spend the budget twice.  Token counts come from the model's tiktoken
+encoding, loaded once per model, and are memoized per passage.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
+import logging
+
+from ..retrieval.tokenization import get_encoding
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return set(words)
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    """Fills a token budget with relevance-ordered, de-duplicated passages."""
+
+    def __init__(
+        self,
+        model_name: str = "gpt-4",
+        token_budget: int = 1000,
+        duplicate_threshold: float = 0.8,
+        min_trim_tokens: int = 32,
+        count_cache_size: int = 50000
+    ):
+        """
+        Initialize the packer.
+
+        Args:
+            model_name: Target model, used to pick the tokenizer
+            token_budget: Maximum tokens of packed context
+            duplicate_threshold: Word-shingle Jaccard similarity at which a
+                passage counts as a near-duplicate of one already packed
+            min_trim_tokens: Smallest remaining budget worth filling with a
+                truncated passage
+            count_cache_size: Passages whose token counts are memoized
+        """
+        self.model_name = str(model_name)
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.min_trim_tokens = min_trim_tokens
+        self.encoding = get_encoding(self.model_name)
+        self.count_tokens = lru_cache(maxsize=count_cache_size)(self._count_tokens)
+        self.stats = {"requests": 0, "tokens": 0, "passages": 0, "duplicates_dropped": 0,
+                      "truncated": 0, "over_budget_dropped": 0}
+
+    def _count_tokens(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def _truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of ``text`` within ``max_tokens``."""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max_tokens * 4]
+
+    def _trim(self, text: str, max_tokens: int) -> str:
+        """Cut text to whole sentences within ``max_tokens``, or to a token boundary."""
+        kept: List[str] = []
+        used = 0
+        for sentence in _SENTENCE_END.split(text):
+            # Sentences are counted separately (plus one for the joining space) rather than
+            # memoizing every growing prefix
+            cost = self._count_tokens(sentence) + (1 if kept else 0)
+            if used + cost > max_tokens:
+                break
+            kept.append(sentence)
+            used += cost
+        if kept:
+            return " ".join(kept)
+        return self._truncate_tokens(text, max(max_tokens - 1, 0)).rstrip() + "..."
+
+    def pack(self, documents: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the context string for a prompt.
+
+        Args:
+            documents: Retrieved documents, most relevant first; each passage keeps
+                its position as its ``Source i`` label so it matches the sources list
+
+        Returns:
+            The context and a report with token count, packed source numbers,
+            dropped duplicates and whether the last passage was truncated
+        """
+        parts: List[str] = []
+        packed_shingles: List[set] = []
+        packed_sources: List[int] = []
+        used = 0
+        duplicates = 0
+        truncated = False
+        over_budget = 0
+
+        for i, doc in enumerate(documents, 1):
+            doc_text = doc.get("document", "")
+            if not doc_text:
+                continue
+
+            shingles = _shingles(doc_text)
+            if any(_jaccard(shingles, other) >= self.duplicate_threshold for other in packed_shingles):
+                duplicates += 1
+                continue
+
+            header = f"Source {i}:\n"
+            # Parts are joined with a newline after each passage's own trailing newline
+            overhead = self.count_tokens(header) + 2
+            remaining = self.token_budget - used - overhead
+            if truncated or remaining < 1:
+                over_budget += 1
+                continue
+
+            cost = self.count_tokens(doc_text)
+            if cost > remaining:
+                if remaining < self.min_trim_tokens:
+                    over_budget += 1
+                    continue
+                doc_text = self._trim(doc_text, remaining)
+                cost = self.count_tokens(doc_text)
+                truncated = True
+
+            parts.append(f"{header}{doc_text}\n")
+            packed_shingles.append(shingles)
+            packed_sources.append(i)
+            used += cost + overhead
+
+        context = "\n".join(parts)
+        self.stats["requests"] += 1
+        self.stats["tokens"] += used
+        self.stats["passages"] += len(parts)
+        self.stats["duplicates_dropped"] += duplicates
+        self.stats["truncated"] += int(truncated)
+        self.stats["over_budget_dropped"] += over_budget
+
+        return context, {
+            "tokens": used,
+            "sources": packed_sources,
+            "duplicates_dropped": duplicates,
+            "over_budget_dropped": over_budget,
+            "truncated": truncated
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get packing statistics."""
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "model_name": self.model_name,
+            "token_budget": self.token_budget,
+            "tokenizer": self.encoding.name if self.encoding is not None else "estimate",
+            "mean_tokens": self.stats["tokens"] / requests if requests else 0.0
+        }
@@ -4,8 +4,17 @@ LLM management module with support for multiple providers and fallback systems.
 
 import os
 import time
+import asyncio
+import threading
 import logging
-from typing import Dict, Any, Optional, List, Union, Generator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Union, Generator, AsyncGenerator, Tuple
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
 from langchain_openai import ChatOpenAI, OpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain.schema import BaseMessage, HumanMessage, SystemMessage
@@ -44,6 +53,161 @@ class LLMCallbackHandler(BaseCallbackHandler):
         }
 
 
+class QueueTimeStats:
+    """Rolling queue-time samples and in-flight counts for one model."""
+    
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.waiting = 0
+        self.in_flight = 0
+    
+    def record(self, queue_time: float):
+        self.samples.append(queue_time)
+        self.requests += 1
+    
+    def summary(self) -> Dict[str, Any]:
+        samples = np.asarray(self.samples) * 1000.0 if self.samples else np.zeros(1)
+        return {
+            "requests": self.requests,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "mean_queue_ms": float(samples.mean()),
+            "p50_queue_ms": float(np.percentile(samples, 50)),
+            "p95_queue_ms": float(np.percentile(samples, 95)),
+            "max_queue_ms": float(samples.max())
+        }
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a model is skipped because its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker that opens after consecutive failures or latency SLO breaches.
+    
+    An open breaker rejects calls until ``recovery_timeout`` has passed, then
+    lets a single probe through (half-open); the probe's outcome closes or
+    re-opens it. ``allow`` hands out a token that the call passes back when it
+    finishes, so a call admitted before the breaker opened cannot close it or
+    free the probe slot. Latencies of completed calls are kept for
+    percentile-based hedging delays.
+    """
+    
+    # Token of calls admitted while the breaker is closed; each probe gets its own
+    CLOSED_CALL = object()
+    
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        latency_slo: Optional[float] = None,
+        window: int = 200
+    ):
+        """
+        Initialize the breaker.
+        
+        Args:
+            failure_threshold: Consecutive bad calls (errors, timeouts or SLO
+                breaches) that open the breaker
+            recovery_timeout: Seconds an open breaker rejects calls before probing
+            latency_slo: Calls slower than this many seconds count as bad; None disables
+            window: Number of recent latencies kept
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.latency_slo = latency_slo
+        self.latencies = deque(maxlen=window)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.stats = {"successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+        self._probe = None
+        self._lock = threading.Lock()
+    
+    def allow(self) -> Optional[object]:
+        """
+        Admit a call if the breaker lets one through now.
+        
+        Returns:
+            A token to pass to record_success, record_failure or
+            record_cancelled, or None if the call is rejected
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return self.CLOSED_CALL
+            if self.state == "half_open" and self._probe is None:
+                self._probe = object()
+                return self._probe
+            self.stats["rejected"] += 1
+            return None
+    
+    def record_success(self, latency: float, token: Optional[object] = CLOSED_CALL):
+        """Record a completed call; one slower than the SLO counts as a failure."""
+        with self._lock:
+            self.latencies.append(latency)
+            if self.latency_slo is not None and latency > self.latency_slo:
+                self.stats["slow_calls"] += 1
+                self._record_bad_call(token)
+                return
+            self.stats["successes"] += 1
+            if token is self._probe and token is not None:
+                self._probe = None
+                self.state = "closed"
+                self.consecutive_failures = 0
+            elif self.state == "closed":
+                self.consecutive_failures = 0
+    
+    def record_failure(self, token: Optional[object] = CLOSED_CALL):
+        """Record an error or a missed deadline."""
+        with self._lock:
+            self.stats["failures"] += 1
+            self._record_bad_call(token)
+    
+    def record_cancelled(self, token: Optional[object] = CLOSED_CALL):
+        """Release the probe slot of a call abandoned without an outcome."""
+        with self._lock:
+            if token is self._probe:
+                self._probe = None
+    
+    def _record_bad_call(self, token: Optional[object]):
+        # Only the probe decides a half-open breaker, and an open one is already open
+        if token is self._probe and token is not None:
+            self._probe = None
+        elif self.state != "closed":
+            return
+        self.consecutive_failures += 1
+        if token is not self.CLOSED_CALL or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+    
+    def latency_percentile(self, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Latency percentile in seconds, or None with fewer than ``min_samples`` calls."""
+        with self._lock:
+            if len(self.latencies) < min_samples:
+                return None
+            return float(np.percentile(self.latencies, percentile))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state and counters."""
+        p95 = self.latency_percentile(95, min_samples=1)
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "p95_latency": p95
+        }
+
+
+# LangChain message types mapped to provider chat roles
+MESSAGE_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
 class LLMManager:
     """Manages multiple LLM providers with fallback support."""
     
@@ -55,7 +219,16 @@ class LLMManager:
         fallback_model: str = "claude-3-sonnet-20240229",
         temperature: float = 0.1,
         max_tokens: int = 1000,
-        timeout: int = 30
+        timeout: int = 30,
+        max_concurrency_per_model: int = 64,
+        max_connections_per_provider: int = 256,
+        model_deadlines: Optional[Dict[str, float]] = None,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        latency_slo: Optional[float] = None,
+        hedge: bool = False,
+        hedge_delay: float = 2.0,
+        hedge_percentile: float = 95.0
     ):
         """
         Initialize LLM manager.
@@ -68,12 +241,49 @@ class LLMManager:
             temperature: Temperature for generation
             max_tokens: Maximum tokens to generate
             timeout: Request timeout in seconds
+            max_concurrency_per_model: Async generations in flight per model;
+                further calls wait in a queue
+            max_connections_per_provider: Size of each provider's pooled
+                HTTP connection pool for async calls
+            model_deadlines: Seconds each model gets before the next one is
+                tried, by model name; ``timeout`` for models not listed
+            failure_threshold: Consecutive failures or SLO breaches that open
+                a model's circuit breaker
+            recovery_timeout: Seconds a model is skipped once its breaker opens
+            latency_slo: Calls slower than this many seconds count against the breaker
+            hedge: Also send the request to the next model if the first has not
+                answered within the hedge delay; the first answer wins
+            hedge_delay: Hedge delay used until a model has enough latency samples
+            hedge_percentile: Latency percentile of the first model used as the hedge delay
         """
         self.primary_model = primary_model
         self.fallback_model = fallback_model
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self.max_connections_per_provider = max_connections_per_provider
+        self.api_keys = {"openai": openai_api_key, "anthropic": anthropic_api_key}
+        
+        # Async clients and semaphores are bound to an event loop; kept per loop, created on first use
+        self._loop_state: Dict[asyncio.AbstractEventLoop, Tuple[Dict[str, Any], Dict[str, asyncio.Semaphore]]] = {}
+        self._loop_state_lock = threading.Lock()
+        self.queue_stats: Dict[str, QueueTimeStats] = {}
+        
+        self.model_deadlines = model_deadlines or {}
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_stats = {"hedged_requests": 0, "hedge_wins": 0}
+        # generate() may race models from many threads at once
+        self._hedge_stats_lock = threading.Lock()
+        self._breaker_settings = {
+            "failure_threshold": failure_threshold,
+            "recovery_timeout": recovery_timeout,
+            "latency_slo": latency_slo
+        }
+        # Sync calls run here so a hung model can be abandoned at its deadline
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
         
         # Initialize models
         self.models = {}
@@ -90,6 +300,8 @@ class LLMManager:
         if not self.models:
             raise ValueError("At least one API key must be provided")
         
+        self.breakers = {name: CircuitBreaker(**self._breaker_settings) for name in self.models}
+        
         logger.info(f"LLM Manager initialized with models: {list(self.models.keys())}")
     
     def _init_openai_models(self, api_key: str):
@@ -155,6 +367,22 @@ class LLMManager:
         except Exception as e:
             logger.error(f"Error initializing Anthropic models: {e}")
     
+    def _models_to_try(self, model_name: Optional[str], use_fallback: bool) -> List[str]:
+        """Requested or primary model, followed by the fallback if requested."""
+        # Determine which model to use
+        if model_name and model_name in self.models:
+            models_to_try = [model_name]
+        elif self.primary_model in self.models:
+            models_to_try = [self.primary_model]
+        else:
+            models_to_try = list(self.models.keys())
+        
+        # Add fallback model if requested
+        if use_fallback and self.fallback_model in self.models and self.fallback_model not in models_to_try:
+            models_to_try.append(self.fallback_model)
+        
+        return models_to_try
+    
     def generate(
         self,
         prompt: Union[str, List[BaseMessage]],
@@ -165,6 +393,10 @@ class LLMManager:
         """
         Generate text using the specified or primary model.
         
+        Each model gets its deadline before the fallback is tried, models with
+        an open circuit breaker are skipped, and with hedging enabled the
+        fallback is started once the primary runs past its hedge delay.
+        
         Args:
             prompt: Input prompt or messages
             model_name: Specific model to use (optional)
@@ -174,58 +406,31 @@ class LLMManager:
         Returns:
             Dictionary with generated text and metadata
         """
-        # Determine which model to use
-        if model_name and model_name in self.models:
-            models_to_try = [model_name]
-        elif self.primary_model in self.models:
-            models_to_try = [self.primary_model]
-        else:
-            models_to_try = list(self.models.keys())
-        
-        # Add fallback model if requested
-        if use_fallback and self.fallback_model in self.models and self.fallback_model not in models_to_try:
-            models_to_try.append(self.fallback_model)
-        
-        last_error = None
+        # Prepare generation parameters
+        generation_kwargs = {
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+        }
         
-        for model_name in models_to_try:
-            try:
-                logger.info(f"Attempting generation with model: {model_name}")
-                
-                # Prepare generation parameters
-                generation_kwargs = {
-                    "temperature": kwargs.get("temperature", self.temperature),
-                    "max_tokens": kwargs.get("max_tokens", self.max_tokens),
-                }
-                
-                # Generate response
-                if isinstance(prompt, str):
-                    response = self.models[model_name].generate([prompt], **generation_kwargs)
-                else:
-                    response = self.models[model_name].generate(prompt, **generation_kwargs)
-                
-                # Extract generated text
-                if hasattr(response, 'generations') and response.generations:
-                    generated_text = response.generations[0][0].text
-                else:
-                    generated_text = str(response)
-                
-                # Get callback stats
-                stats = self.callback_handler.get_stats()
-                
-                return {
-                    "text": generated_text,
-                    "model_used": model_name,
-                    "success": True,
-                    "tokens_used": stats.get("tokens_used", 0),
-                    "duration": stats.get("duration", 0),
-                    "error": None
-                }
-                
-            except Exception as e:
-                last_error = e
-                logger.warning(f"Model {model_name} failed: {e}")
-                continue
+        try:
+            model_name, generated_text, latency = self._race(
+                self._models_to_try(model_name, use_fallback), prompt, generation_kwargs
+            )
+            
+            # Get callback stats
+            stats = self.callback_handler.get_stats()
+            
+            return {
+                "text": generated_text,
+                "model_used": model_name,
+                "success": True,
+                "tokens_used": stats.get("tokens_used", 0),
+                "duration": latency,
+                "error": None
+            }
+            
+        except Exception as e:
+            last_error = e
         
         # If all models failed
         error_msg = f"All models failed. Last error: {last_error}"
@@ -240,6 +445,142 @@ class LLMManager:
             "error": error_msg
         }
     
+    def _invoke(
+        self,
+        model_name: str,
+        prompt: Union[str, List[BaseMessage]],
+        generation_kwargs: Dict[str, Any],
+        started: Optional[List[float]] = None
+    ) -> str:
+        """
+        Run one blocking LangChain generation and return its text.
+        
+        If given, ``started`` receives the time the call began, which for a call
+        queued in the executor is later than when it was submitted.
+        """
+        if started is not None:
+            started.append(time.perf_counter())
+        logger.info(f"Attempting generation with model: {model_name}")
+        
+        # Generate response
+        if isinstance(prompt, str):
+            response = self.models[model_name].generate([prompt], **generation_kwargs)
+        else:
+            response = self.models[model_name].generate(prompt, **generation_kwargs)
+        
+        # Extract generated text
+        if hasattr(response, 'generations') and response.generations:
+            return response.generations[0][0].text
+        return str(response)
+    
+    def _count_hedge(self, key: str):
+        with self._hedge_stats_lock:
+            self.hedge_stats[key] += 1
+    
+    def _deadline(self, model_name: str) -> float:
+        return self.model_deadlines.get(model_name, self.timeout)
+    
+    def _next_hedge_delay(self, model_name: str) -> float:
+        """Delay before hedging a call to this model: its latency percentile, capped by its deadline."""
+        observed = self.breakers[model_name].latency_percentile(self.hedge_percentile)
+        delay = observed if observed is not None else self.hedge_delay
+        return min(delay, self._deadline(model_name))
+    
+    def _race(
+        self,
+        candidates: List[str],
+        prompt: Union[str, List[BaseMessage]],
+        generation_kwargs: Dict[str, Any]
+    ) -> Tuple[str, str, float]:
+        """
+        Try models in order under their deadlines and breakers; the first answer wins.
+        
+        The next model starts when every running call has failed or missed its
+        deadline, or, with hedging, once the latest call has run past its hedge
+        delay. Deadlines count from when a call leaves the executor queue. A
+        call still queued a full deadline after submission is cancelled without
+        charging its breaker; abandoned calls that did start keep running and
+        report their real outcome to the breaker when they finish.
+        
+        Returns:
+            Winning model name, generated text and call latency
+        """
+        queue = list(candidates)
+        # future -> (model, submitted, hedged, breaker token, start time once the call began)
+        running: Dict[Any, Tuple[str, float, bool, object, List[float]]] = {}
+        settled = set()
+        settle_lock = threading.Lock()
+        last_error: Exception = RuntimeError("No models available")
+        next_start = 0.0
+        
+        def settle(future, model: str, token: object, started: List[float], timed_out: bool = False):
+            # Each call reports to its breaker once: on completion, or at its deadline
+            with settle_lock:
+                if future in settled:
+                    return
+                settled.add(future)
+            breaker = self.breakers[model]
+            if future.cancelled():
+                breaker.record_cancelled(token)
+            elif timed_out or future.exception() is not None:
+                breaker.record_failure(token)
+            else:
+                breaker.record_success(time.perf_counter() - started[0], token)
+        
+        while queue or running:
+            now = time.perf_counter()
+            if queue and (not running or (self.hedge and now >= next_start)):
+                model = queue.pop(0)
+                token = self.breakers[model].allow()
+                if token is None:
+                    last_error = CircuitOpenError(f"Circuit open for model {model}")
+                    logger.warning(f"Skipping model {model}: circuit open")
+                    continue
+                hedged = bool(running)
+                if hedged:
+                    self._count_hedge("hedged_requests")
+                    logger.info(f"Hedging request to {model}")
+                started = []
+                future = self._executor.submit(self._invoke, model, prompt, generation_kwargs, started)
+                running[future] = (model, now, hedged, token, started)
+                future.add_done_callback(lambda f, m=model, c=token, s=started: settle(f, m, c, s))
+                next_start = now + self._next_hedge_delay(model)
+                continue
+            
+            wake = min(
+                (started[0] if started else submitted) + self._deadline(model)
+                for model, submitted, _, _, started in running.values()
+            )
+            if self.hedge and queue:
+                wake = min(wake, next_start)
+            done, _ = wait(list(running), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                model, _, hedged, _, started = running.pop(future)
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    logger.warning(f"Model {model} failed: {last_error}")
+                    continue
+                if hedged:
+                    self._count_hedge("hedge_wins")
+                return model, future.result(), time.perf_counter() - started[0]
+            
+            now = time.perf_counter()
+            for future, (model, submitted, _, token, started) in list(running.items()):
+                deadline = self._deadline(model)
+                if not started and now - submitted >= deadline and future.cancel():
+                    # Never reached the provider; cancel() settles it without a breaker failure
+                    running.pop(future)
+                    last_error = TimeoutError(f"Model {model} waited {deadline:.1f}s for a free worker")
+                    logger.warning(str(last_error))
+                elif started and now - started[0] >= deadline:
+                    running.pop(future)
+                    settle(future, model, token, started, timed_out=True)
+                    last_error = TimeoutError(f"Model {model} missed its {deadline:.1f}s deadline")
+                    logger.warning(str(last_error))
+        
+        raise last_error
+    
     def generate_stream(
         self,
         prompt: Union[str, List[BaseMessage]],
@@ -290,6 +631,305 @@ class LLMManager:
             logger.error(f"Error in streaming generation: {e}")
             yield f"Error: {e}"
     
+    def _loop_resources(self) -> Tuple[Dict[str, Any], Dict[str, asyncio.Semaphore]]:
+        """Async clients and semaphores of the running event loop, by provider and model."""
+        loop = asyncio.get_running_loop()
+        with self._loop_state_lock:
+            # Clients of loops closed without aclose() cannot be used or closed any more
+            for stale in [other for other in self._loop_state if other.is_closed()]:
+                del self._loop_state[stale]
+            return self._loop_state.setdefault(loop, ({}, {}))
+    
+    def _provider(self, model_name: str) -> str:
+        return "anthropic" if isinstance(self.models[model_name], ChatAnthropic) else "openai"
+    
+    def _async_client(self, provider: str):
+        """Provider SDK client sharing one pooled, keep-alive HTTP connection pool."""
+        clients, _ = self._loop_resources()
+        if provider not in clients:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections_per_provider,
+                    max_keepalive_connections=self.max_connections_per_provider
+                ),
+                timeout=self.timeout
+            )
+            client_class = AsyncAnthropic if provider == "anthropic" else AsyncOpenAI
+            clients[provider] = client_class(
+                api_key=self.api_keys[provider], http_client=http_client, timeout=self.timeout
+            )
+        return clients[provider]
+    
+    @asynccontextmanager
+    async def _model_slot(self, model_name: str):
+        """Wait for one of the model's concurrency slots; yields the time spent queued."""
+        _, semaphores = self._loop_resources()
+        if model_name not in semaphores:
+            semaphores[model_name] = asyncio.Semaphore(self.max_concurrency_per_model)
+        semaphore = semaphores[model_name]
+        stats = self.queue_stats.setdefault(model_name, QueueTimeStats())
+        
+        queued_at = time.perf_counter()
+        stats.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+        queue_time = time.perf_counter() - queued_at
+        stats.record(queue_time)
+        
+        stats.in_flight += 1
+        try:
+            yield queue_time
+        finally:
+            stats.in_flight -= 1
+            semaphore.release()
+    
+    @staticmethod
+    def _to_chat_messages(prompt: Union[str, List[BaseMessage]]) -> List[Dict[str, str]]:
+        if isinstance(prompt, str):
+            return [{"role": "user", "content": prompt}]
+        return [{"role": MESSAGE_ROLES.get(message.type, "user"), "content": message.content} for message in prompt]
+    
+    def _request_params(self, model_name: str, prompt: Union[str, List[BaseMessage]], **kwargs) -> Tuple[str, Dict[str, Any]]:
+        """Build provider request arguments; returns the request kind and its parameters."""
+        params = {
+            "model": model_name,
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens)
+        }
+        messages = self._to_chat_messages(prompt)
+        model = self.models[model_name]
+        
+        if isinstance(model, ChatAnthropic):
+            system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+            params["messages"] = [m for m in messages if m["role"] != "system"]
+            if system:
+                params["system"] = system
+            return "anthropic", params
+        if isinstance(model, ChatOpenAI):
+            params["messages"] = messages
+            return "chat", params
+        # Text completion models take a single prompt string
+        params["prompt"] = "\n\n".join(m["content"] for m in messages)
+        return "completion", params
+    
+    @staticmethod
+    def _anthropic_messages(client):
+        # Older SDK releases expose the Messages API under beta
+        return client.messages if hasattr(client, "messages") else client.beta.messages
+    
+    async def _acomplete(self, model_name: str, prompt: Union[str, List[BaseMessage]], **kwargs) -> Tuple[str, int]:
+        """Run one non-streaming completion; returns the text and total tokens."""
+        kind, params = self._request_params(model_name, prompt, **kwargs)
+        client = self._async_client(self._provider(model_name))
+        
+        if kind == "anthropic":
+            response = await self._anthropic_messages(client).create(**params)
+            text = "".join(block.text for block in response.content if getattr(block, "type", "text") == "text")
+            usage = response.usage
+            return text, (usage.input_tokens + usage.output_tokens) if usage else 0
+        if kind == "chat":
+            response = await client.chat.completions.create(**params)
+            text = response.choices[0].message.content or ""
+        else:
+            response = await client.completions.create(**params)
+            text = response.choices[0].text
+        return text, response.usage.total_tokens if response.usage else 0
+    
+    async def agenerate(
+        self,
+        prompt: Union[str, List[BaseMessage]],
+        model_name: Optional[str] = None,
+        use_fallback: bool = True,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Generate text without blocking the event loop.
+        
+        Requests go through the provider's pooled async client and wait for
+        a per-model concurrency slot; the wait is reported as ``queue_time``.
+        
+        Args:
+            prompt: Input prompt or messages
+            model_name: Specific model to use (optional)
+            use_fallback: Whether to use fallback if primary fails
+            **kwargs: Additional generation parameters
+            
+        Returns:
+            Dictionary with generated text and metadata, as returned by generate
+        """
+        try:
+            model_name, (text, tokens_used, latency, queue_time) = await self._arace(
+                self._models_to_try(model_name, use_fallback), prompt, kwargs
+            )
+            
+            return {
+                "text": text,
+                "model_used": model_name,
+                "success": True,
+                "tokens_used": tokens_used,
+                "duration": latency,
+                "queue_time": queue_time,
+                "error": None
+            }
+            
+        except Exception as e:
+            last_error = e
+        
+        error_msg = f"All models failed. Last error: {last_error}"
+        logger.error(error_msg)
+        
+        return {
+            "text": "I apologize, but I'm unable to generate a response at this time. Please try again later.",
+            "model_used": None,
+            "success": False,
+            "tokens_used": 0,
+            "duration": 0,
+            "queue_time": 0.0,
+            "error": error_msg
+        }
+    
+    async def _attempt(
+        self,
+        model_name: str,
+        prompt: Union[str, List[BaseMessage]],
+        kwargs: Dict[str, Any],
+        token: object
+    ) -> Tuple[str, int, float, float]:
+        """One async call under the model's concurrency slot, deadline and breaker token."""
+        breaker = self.breakers[model_name]
+        deadline = self._deadline(model_name)
+        try:
+            async with self._model_slot(model_name) as queue_time:
+                logger.info(f"Attempting async generation with model: {model_name}")
+                start = time.perf_counter()
+                text, tokens_used = await asyncio.wait_for(
+                    self._acomplete(model_name, prompt, **kwargs), deadline
+                )
+        except asyncio.CancelledError:
+            # Lost a hedge race: no outcome to report
+            breaker.record_cancelled(token)
+            raise
+        except asyncio.TimeoutError:
+            breaker.record_failure(token)
+            raise TimeoutError(f"Model {model_name} missed its {deadline:.1f}s deadline")
+        except Exception:
+            breaker.record_failure(token)
+            raise
+        
+        latency = time.perf_counter() - start
+        breaker.record_success(latency, token)
+        return text, tokens_used, latency, queue_time
+    
+    async def _arace(
+        self,
+        candidates: List[str],
+        prompt: Union[str, List[BaseMessage]],
+        kwargs: Dict[str, Any]
+    ) -> Tuple[str, Tuple[str, int, float, float]]:
+        """Async counterpart of _race; losing calls are cancelled."""
+        queue = list(candidates)
+        running: Dict[asyncio.Task, Tuple[str, bool]] = {}
+        last_error: Exception = RuntimeError("No models available")
+        next_start = 0.0
+        
+        try:
+            while queue or running:
+                now = time.perf_counter()
+                if queue and (not running or (self.hedge and now >= next_start)):
+                    model = queue.pop(0)
+                    token = self.breakers[model].allow()
+                    if token is None:
+                        last_error = CircuitOpenError(f"Circuit open for model {model}")
+                        logger.warning(f"Skipping model {model}: circuit open")
+                        continue
+                    hedged = bool(running)
+                    if hedged:
+                        self._count_hedge("hedged_requests")
+                        logger.info(f"Hedging request to {model}")
+                    running[asyncio.ensure_future(self._attempt(model, prompt, kwargs, token))] = (model, hedged)
+                    next_start = now + self._next_hedge_delay(model)
+                    continue
+                
+                timeout = max(0.0, next_start - now) if self.hedge and queue else None
+                done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    model, hedged = running.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        logger.warning(f"Model {model} failed: {last_error}")
+                        continue
+                    if hedged:
+                        self._count_hedge("hedge_wins")
+                    return model, task.result()
+            
+            raise last_error
+        finally:
+            for task in running:
+                task.cancel()
+    
+    async def astream(
+        self,
+        prompt: Union[str, List[BaseMessage]],
+        model_name: Optional[str] = None,
+        **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream generated text without blocking the event loop.
+        
+        The model's concurrency slot is held until the stream finishes.
+        
+        Args:
+            prompt: Input prompt or messages
+            model_name: Specific model to use (optional)
+            **kwargs: Additional generation parameters
+            
+        Yields:
+            Generated text chunks
+        """
+        if not (model_name and model_name in self.models):
+            if self.primary_model not in self.models:
+                raise ValueError("No suitable model available")
+            model_name = self.primary_model
+        
+        try:
+            kind, params = self._request_params(model_name, prompt, **kwargs)
+            client = self._async_client(self._provider(model_name))
+            
+            async with self._model_slot(model_name):
+                if kind == "anthropic":
+                    stream = await self._anthropic_messages(client).create(stream=True, **params)
+                    async for event in stream:
+                        if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                            yield event.delta.text
+                elif kind == "chat":
+                    stream = await client.chat.completions.create(stream=True, **params)
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                else:
+                    stream = await client.completions.create(stream=True, **params)
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].text:
+                            yield chunk.choices[0].text
+                        
+        except Exception as e:
+            logger.error(f"Error in async streaming generation: {e}")
+            yield f"Error: {e}"
+    
+    async def aclose(self):
+        """Close the pooled async HTTP clients of the running event loop."""
+        with self._loop_state_lock:
+            clients, _ = self._loop_state.pop(asyncio.get_running_loop(), ({}, {}))
+        for client in clients.values():
+            await client.close()
+    
+    def get_queue_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue-time and in-flight statistics for async generation, per model."""
+        return {model_name: stats.summary() for model_name, stats in self.queue_stats.items()}
+    
     def get_available_models(self) -> List[str]:
         """Get list of available models."""
         return list(self.models.keys())
@@ -335,10 +975,16 @@ class LLMManager:
     
     def get_stats(self) -> Dict[str, Any]:
         """Get overall statistics for the LLM manager."""
+        with self._hedge_stats_lock:
+            hedge_stats = dict(self.hedge_stats)
         return {
             "available_models": self.get_available_models(),
             "primary_model": self.primary_model,
             "fallback_model": self.fallback_model,
-            "callback_stats": self.callback_handler.get_stats()
+            "callback_stats": self.callback_handler.get_stats(),
+            "max_concurrency_per_model": self.max_concurrency_per_model,
+            "queue_stats": self.get_queue_stats(),
+            "breakers": {name: breaker.get_stats() for name, breaker in self.breakers.items()},
+            "hedging": {"enabled": self.hedge, **hedge_stats}
         }
 
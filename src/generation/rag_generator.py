@@ -3,13 +3,16 @@ Main RAG generator that combines retrieval and generation components.
 """
 
 import time
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, AsyncGenerator, Tuple
 from .llm_manager import LLMManager
 from .prompt_manager import PromptManager
+from .semantic_cache import SemanticResponseCache
+from .context_packer import ContextPacker
 from ..retrieval.embedding_generator import EmbeddingGenerator
 from ..retrieval.hybrid_search import HybridRetriever
-from ..retrieval.reranker import Reranker, CohereReranker
+from ..retrieval.reranker import Reranker, CascadeReranker, CohereReranker
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +26,13 @@ class RAGGenerator:
         embedding_generator: EmbeddingGenerator,
         hybrid_retriever: HybridRetriever,
         prompt_manager: Optional[PromptManager] = None,
-        reranker: Optional[Union[Reranker, CohereReranker]] = None,
+        reranker: Optional[Union[Reranker, CascadeReranker, CohereReranker]] = None,
         use_reranking: bool = True,
-        max_context_length: int = 4000
+        max_context_length: int = 4000,
+        response_cache: Optional[SemanticResponseCache] = None,
+        context_token_budget: Optional[int] = None,
+        context_model: Optional[str] = None,
+        duplicate_threshold: float = 0.8
     ):
         """
         Initialize RAG generator.
@@ -37,7 +44,16 @@ class RAGGenerator:
             prompt_manager: Prompt manager for different query types
             reranker: Optional reranker for improving results
             use_reranking: Whether to use reranking
-            max_context_length: Maximum context length for generation
+            max_context_length: Maximum context length in characters; sets the
+                token budget (at about four characters per token) when
+                context_token_budget is not given
+            response_cache: Optional semantic cache answering paraphrases of
+                earlier queries without retrieval or generation
+            context_token_budget: Maximum tokens of retrieved context per prompt
+            context_model: Model whose tokenizer counts context tokens; the LLM
+                manager's primary model by default
+            duplicate_threshold: Word-shingle Jaccard similarity at which a
+                passage is dropped as a near-duplicate
         """
         self.llm_manager = llm_manager
         self.embedding_generator = embedding_generator
@@ -46,6 +62,12 @@ class RAGGenerator:
         self.reranker = reranker
         self.use_reranking = use_reranking and reranker is not None
         self.max_context_length = max_context_length
+        self.response_cache = response_cache
+        self.context_packer = ContextPacker(
+            model_name=context_model or getattr(llm_manager, "primary_model", "gpt-4"),
+            token_budget=context_token_budget or max_context_length // 4,
+            duplicate_threshold=duplicate_threshold
+        )
         
         logger.info(f"RAG Generator initialized with reranking: {self.use_reranking}")
     
@@ -77,51 +99,16 @@ class RAGGenerator:
         start_time = time.time()
         
         try:
-            # Step 1: Generate query embedding
-            logger.info("Generating query embedding")
-            query_embedding = self.embedding_generator.generate_embeddings(query)
+            # Answer paraphrases of earlier queries from the semantic cache
+            cache_options = {"top_k": top_k, "rerank_top_k": rerank_top_k, **generation_kwargs}
+            hit, sampled_hit = self._cache_lookup(query, prompt_type, system_role, cache_options)
+            if hit is not None:
+                return self._cached_response(hit, include_sources, start_time)
             
-            # Step 2: Retrieve relevant documents
-            logger.info(f"Retrieving top {top_k} documents")
-            retrieved_docs = self.hybrid_retriever.hybrid_search(
-                query=query,
-                query_embedding=query_embedding,
-                k=top_k
-            )
-            
-            if not retrieved_docs:
-                return {
-                    "answer": "I couldn't find any relevant information to answer your question.",
-                    "sources": [],
-                    "confidence": 0.0,
-                    "retrieval_time": time.time() - start_time,
-                    "generation_time": 0.0,
-                    "total_time": time.time() - start_time,
-                    "model_used": None,
-                    "tokens_used": 0,
-                    "error": None
-                }
-            
-            # Step 3: Rerank documents if enabled
-            if self.use_reranking and len(retrieved_docs) > rerank_top_k:
-                logger.info(f"Reranking documents to top {rerank_top_k}")
-                if hasattr(self.reranker, 'rerank_with_metadata'):
-                    reranked_docs = self.reranker.rerank_with_metadata(
-                        query=query,
-                        search_results=retrieved_docs,
-                        top_k=rerank_top_k
-                    )
-                else:
-                    # Fallback for basic reranker
-                    doc_texts = [doc.get("document", "") for doc in retrieved_docs]
-                    reranked_docs = self.reranker.rerank(query, doc_texts, top_k=rerank_top_k)
-                    # Convert back to full format
-                    reranked_docs = [
-                        {**doc, "document": reranked_doc["document"], "relevance_score": reranked_doc["relevance_score"]}
-                        for doc, reranked_doc in zip(retrieved_docs, reranked_docs)
-                    ]
-            else:
-                reranked_docs = retrieved_docs[:rerank_top_k]
+            # Steps 1-3: Embed the query, retrieve and rerank
+            reranked_docs = self._retrieve_documents(query, top_k, rerank_top_k)
+            if not reranked_docs:
+                return self._no_results_response(start_time)
             
             # Step 4: Prepare context
             context = self._prepare_context(reranked_docs)
@@ -131,23 +118,7 @@ class RAGGenerator:
             generation_start = time.time()
             
             # Format prompt with context
-            if prompt_type in ["conversation"]:
-                # For conversation, we need additional parameters
-                formatted_prompt = self.prompt_manager.format_with_system_message(
-                    prompt_type=prompt_type,
-                    system_role=system_role,
-                    context=context,
-                    question=query,
-                    conversation_history="",  # Could be enhanced with actual history
-                    message=query
-                )
-            else:
-                formatted_prompt = self.prompt_manager.format_with_system_message(
-                    prompt_type=prompt_type,
-                    system_role=system_role,
-                    context=context,
-                    question=query
-                )
+            formatted_prompt = self._format_prompt(prompt_type, system_role, context, query)
             
             # Generate response
             response = self.llm_manager.generate(
@@ -155,42 +126,264 @@ class RAGGenerator:
                 **generation_kwargs
             )
             
-            generation_time = time.time() - generation_start
-            total_time = time.time() - start_time
+            result = self._build_response(
+                response, reranked_docs, include_sources, start_time, generation_start
+            )
+            self._cache_update(query, prompt_type, system_role, cache_options, include_sources, result, sampled_hit)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in RAG generation: {e}")
+            return self._error_response(e, start_time)
+    
+    async def agenerate_answer(
+        self,
+        query: str,
+        prompt_type: str = "qa",
+        top_k: int = 5,
+        rerank_top_k: int = 3,
+        include_sources: bool = True,
+        system_role: str = "assistant",
+        **generation_kwargs
+    ) -> Dict[str, Any]:
+        """
+        Generate an answer using RAG without blocking the event loop.
+        
+        Retrieval and reranking run in the default executor; generation awaits
+        the LLM manager's async path. Arguments and result match generate_answer,
+        plus the LLM ``queue_time``.
+        """
+        start_time = time.time()
+        
+        try:
+            loop = asyncio.get_running_loop()
+            cache_options = {"top_k": top_k, "rerank_top_k": rerank_top_k, **generation_kwargs}
+            hit, sampled_hit = await loop.run_in_executor(
+                None, self._cache_lookup, query, prompt_type, system_role, cache_options
+            )
+            if hit is not None:
+                return self._cached_response(hit, include_sources, start_time)
+            
+            reranked_docs = await loop.run_in_executor(
+                None, self._retrieve_documents, query, top_k, rerank_top_k
+            )
+            if not reranked_docs:
+                return self._no_results_response(start_time)
             
-            # Step 6: Prepare sources if requested
-            sources = []
-            if include_sources:
-                sources = self._extract_sources(reranked_docs)
+            context = self._prepare_context(reranked_docs)
             
-            # Step 7: Calculate confidence
-            confidence = self._calculate_confidence(reranked_docs, response)
+            logger.info("Generating answer")
+            generation_start = time.time()
+            formatted_prompt = self._format_prompt(prompt_type, system_role, context, query)
+            response = await self.llm_manager.agenerate(
+                prompt=formatted_prompt,
+                **generation_kwargs
+            )
             
-            return {
-                "answer": response["text"],
-                "sources": sources,
-                "confidence": confidence,
-                "retrieval_time": generation_start - start_time,
-                "generation_time": generation_time,
-                "total_time": total_time,
-                "model_used": response.get("model_used"),
-                "tokens_used": response.get("tokens_used", 0),
-                "error": response.get("error")
-            }
+            result = self._build_response(
+                response, reranked_docs, include_sources, start_time, generation_start
+            )
+            result["queue_time"] = response.get("queue_time", 0.0)
+            await loop.run_in_executor(
+                None, self._cache_update, query, prompt_type, system_role, cache_options,
+                include_sources, result, sampled_hit
+            )
+            return result
             
         except Exception as e:
             logger.error(f"Error in RAG generation: {e}")
-            return {
-                "answer": f"I encountered an error while processing your request: {str(e)}",
-                "sources": [],
-                "confidence": 0.0,
-                "retrieval_time": 0.0,
-                "generation_time": 0.0,
-                "total_time": time.time() - start_time,
-                "model_used": None,
-                "tokens_used": 0,
-                "error": str(e)
-            }
+            return self._error_response(e, start_time)
+    
+    def _cache_lookup(
+        self,
+        query: str,
+        prompt_type: str,
+        system_role: str,
+        options: Dict[str, Any]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Look the query up in the semantic cache.
+        
+        Only answers produced with the same retrieval depth and generation
+        options (model, max tokens, temperature, ...) can be served.
+        
+        Returns:
+            (hit to serve, hit sampled for a false-hit check); at most one is set
+        """
+        if self.response_cache is None:
+            return None, None
+        try:
+            hit = self.response_cache.lookup(
+                query, prompt_type, system_role, self.hybrid_retriever.corpus_version, options
+            )
+        except Exception as e:
+            logger.error(f"Error in semantic cache lookup: {e}")
+            return None, None
+        if hit is not None and self.response_cache.should_sample():
+            # Regenerate this one and compare it with the cached answer
+            return None, hit
+        return hit, None
+    
+    def _cache_update(
+        self,
+        query: str,
+        prompt_type: str,
+        system_role: str,
+        options: Dict[str, Any],
+        include_sources: bool,
+        result: Dict[str, Any],
+        sampled_hit: Optional[Dict[str, Any]] = None
+    ):
+        """Store a fresh answer, or use it to check a sampled hit."""
+        # Failed answers are never cached; answers without sources cannot serve later requests for them
+        if self.response_cache is None or result.get("error") or not include_sources:
+            return
+        try:
+            if sampled_hit is None:
+                self.response_cache.store(
+                    query, prompt_type, system_role, result, self.hybrid_retriever.corpus_version, options
+                )
+            elif self.response_cache.check_hit(query, sampled_hit, result):
+                # check_hit dropped the wrong entry; give this query its own
+                self.response_cache.store(
+                    query, prompt_type, system_role, result, self.hybrid_retriever.corpus_version, options
+                )
+        except Exception as e:
+            logger.error(f"Error updating semantic cache: {e}")
+    
+    @staticmethod
+    def _cached_response(hit: Dict[str, Any], include_sources: bool, start_time: float) -> Dict[str, Any]:
+        """Serve a cached answer with timings and usage of this request."""
+        result = dict(hit["result"])
+        result.update({
+            "sources": result.get("sources", []) if include_sources else [],
+            "retrieval_time": 0.0,
+            "generation_time": 0.0,
+            "total_time": time.time() - start_time,
+            "tokens_used": 0,
+            "cached": True,
+            "cache_similarity": hit["similarity"]
+        })
+        return result
+    
+    def _retrieve_documents(self, query: str, top_k: int, rerank_top_k: int) -> List[Dict[str, Any]]:
+        """Embed the query, run hybrid search and rerank down to ``rerank_top_k`` documents."""
+        # Step 1: Generate query embedding
+        logger.info("Generating query embedding")
+        query_embedding = self.embedding_generator.generate_embeddings(query)
+        
+        # Step 2: Retrieve relevant documents
+        logger.info(f"Retrieving top {top_k} documents")
+        retrieved_docs = self.hybrid_retriever.hybrid_search(
+            query=query,
+            query_embedding=query_embedding,
+            k=top_k
+        )
+        
+        if not retrieved_docs:
+            return []
+        
+        # Step 3: Rerank documents if enabled
+        if self.use_reranking and len(retrieved_docs) > rerank_top_k:
+            logger.info(f"Reranking documents to top {rerank_top_k}")
+            if hasattr(self.reranker, 'rerank_with_metadata'):
+                # The cascade's cheap first stage reuses the query embedding
+                rerank_kwargs = {"query_embedding": query_embedding} if isinstance(self.reranker, CascadeReranker) else {}
+                return self.reranker.rerank_with_metadata(
+                    query=query,
+                    search_results=retrieved_docs,
+                    top_k=rerank_top_k,
+                    **rerank_kwargs
+                )
+            # Fallback for basic reranker
+            doc_texts = [doc.get("document", "") for doc in retrieved_docs]
+            reranked_docs = self.reranker.rerank(query, doc_texts, top_k=rerank_top_k)
+            # Convert back to full format
+            return [
+                {**doc, "document": reranked_doc["document"], "relevance_score": reranked_doc["relevance_score"]}
+                for doc, reranked_doc in zip(retrieved_docs, reranked_docs)
+            ]
+        
+        return retrieved_docs[:rerank_top_k]
+    
+    def _format_prompt(self, prompt_type: str, system_role: str, context: str, query: str):
+        """Format the prompt for a query and its context."""
+        if prompt_type in ["conversation"]:
+            # For conversation, we need additional parameters
+            return self.prompt_manager.format_with_system_message(
+                prompt_type=prompt_type,
+                system_role=system_role,
+                context=context,
+                question=query,
+                conversation_history="",  # Could be enhanced with actual history
+                message=query
+            )
+        return self.prompt_manager.format_with_system_message(
+            prompt_type=prompt_type,
+            system_role=system_role,
+            context=context,
+            question=query
+        )
+    
+    def _build_response(
+        self,
+        response: Dict[str, Any],
+        documents: List[Dict[str, Any]],
+        include_sources: bool,
+        start_time: float,
+        generation_start: float
+    ) -> Dict[str, Any]:
+        """Assemble the answer payload from an LLM response and its source documents."""
+        generation_time = time.time() - generation_start
+        total_time = time.time() - start_time
+        
+        # Prepare sources if requested
+        sources = []
+        if include_sources:
+            sources = self._extract_sources(documents)
+        
+        # Calculate confidence
+        confidence = self._calculate_confidence(documents, response)
+        
+        return {
+            "answer": response["text"],
+            "sources": sources,
+            "confidence": confidence,
+            "retrieval_time": generation_start - start_time,
+            "generation_time": generation_time,
+            "total_time": total_time,
+            "model_used": response.get("model_used"),
+            "tokens_used": response.get("tokens_used", 0),
+            "error": response.get("error")
+        }
+    
+    @staticmethod
+    def _no_results_response(start_time: float) -> Dict[str, Any]:
+        return {
+            "answer": "I couldn't find any relevant information to answer your question.",
+            "sources": [],
+            "confidence": 0.0,
+            "retrieval_time": time.time() - start_time,
+            "generation_time": 0.0,
+            "total_time": time.time() - start_time,
+            "model_used": None,
+            "tokens_used": 0,
+            "error": None
+        }
+    
+    @staticmethod
+    def _error_response(error: Exception, start_time: float) -> Dict[str, Any]:
+        return {
+            "answer": f"I encountered an error while processing your request: {str(error)}",
+            "sources": [],
+            "confidence": 0.0,
+            "retrieval_time": 0.0,
+            "generation_time": 0.0,
+            "total_time": time.time() - start_time,
+            "model_used": None,
+            "tokens_used": 0,
+            "error": str(error)
+        }
     
     def generate_streaming_answer(
         self,
@@ -216,39 +409,11 @@ class RAGGenerator:
             Dictionary with answer chunks and metadata
         """
         try:
-            # Step 1: Generate query embedding
-            query_embedding = self.embedding_generator.generate_embeddings(query)
-            
-            # Step 2: Retrieve relevant documents
-            retrieved_docs = self.hybrid_retriever.hybrid_search(
-                query=query,
-                query_embedding=query_embedding,
-                k=top_k
-            )
-            
-            if not retrieved_docs:
-                yield {
-                    "type": "error",
-                    "content": "I couldn't find any relevant information to answer your question.",
-                    "sources": [],
-                    "confidence": 0.0
-                }
+            reranked_docs = self._retrieve_documents(query, top_k, rerank_top_k)
+            if not reranked_docs:
+                yield self._no_results_chunk()
                 return
             
-            # Step 3: Rerank documents if enabled
-            if self.use_reranking and len(retrieved_docs) > rerank_top_k:
-                if hasattr(self.reranker, 'rerank_with_metadata'):
-                    reranked_docs = self.reranker.rerank_with_metadata(
-                        query=query,
-                        search_results=retrieved_docs,
-                        top_k=rerank_top_k
-                    )
-                else:
-                    doc_texts = [doc.get("document", "") for doc in retrieved_docs]
-                    reranked_docs = self.reranker.rerank(query, doc_texts, top_k=rerank_top_k)
-            else:
-                reranked_docs = retrieved_docs[:rerank_top_k]
-            
             # Step 4: Prepare context
             context = self._prepare_context(reranked_docs)
             
@@ -285,21 +450,77 @@ class RAGGenerator:
                 "content": f"I encountered an error while processing your request: {str(e)}"
             }
     
-    def _prepare_context(self, documents: List[Dict[str, Any]]) -> str:
-        """Prepare context from retrieved documents."""
-        context_parts = []
-        
-        for i, doc in enumerate(documents, 1):
-            doc_text = doc.get("document", "")
-            if doc_text:
-                context_parts.append(f"Source {i}:\n{doc_text}\n")
-        
-        context = "\n".join(context_parts)
-        
-        # Truncate if too long
-        if len(context) > self.max_context_length:
-            context = context[:self.max_context_length] + "..."
+    async def agenerate_streaming_answer(
+        self,
+        query: str,
+        prompt_type: str = "qa",
+        top_k: int = 5,
+        rerank_top_k: int = 3,
+        system_role: str = "assistant",
+        **generation_kwargs
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream an answer using RAG without blocking the event loop.
         
+        Yields the same chunks as generate_streaming_answer.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            reranked_docs = await loop.run_in_executor(
+                None, self._retrieve_documents, query, top_k, rerank_top_k
+            )
+            if not reranked_docs:
+                yield self._no_results_chunk()
+                return
+            
+            context = self._prepare_context(reranked_docs)
+            formatted_prompt = self.prompt_manager.format_with_system_message(
+                prompt_type=prompt_type,
+                system_role=system_role,
+                context=context,
+                question=query
+            )
+            
+            yield {
+                "type": "sources",
+                "content": self._extract_sources(reranked_docs),
+                "confidence": self._calculate_confidence(reranked_docs, {"text": ""})
+            }
+            
+            async for chunk in self.llm_manager.astream(
+                prompt=formatted_prompt,
+                **generation_kwargs
+            ):
+                yield {
+                    "type": "content",
+                    "content": chunk
+                }
+            
+            yield {"type": "done"}
+            
+        except Exception as e:
+            logger.error(f"Error in streaming RAG generation: {e}")
+            yield {
+                "type": "error",
+                "content": f"I encountered an error while processing your request: {str(e)}"
+            }
+    
+    @staticmethod
+    def _no_results_chunk() -> Dict[str, Any]:
+        return {
+            "type": "error",
+            "content": "I couldn't find any relevant information to answer your question.",
+            "sources": [],
+            "confidence": 0.0
+        }
+    
+    def _prepare_context(self, documents: List[Dict[str, Any]]) -> str:
+        """Pack retrieved documents into the context token budget, most relevant first."""
+        context, report = self.context_packer.pack(documents)
+        logger.info(
+            f"Packed {len(report['sources'])} of {len(documents)} documents into {report['tokens']} tokens "
+            f"({report['duplicates_dropped']} near-duplicates dropped, truncated={report['truncated']})"
+        )
         return context
     
     def _extract_sources(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -354,6 +575,8 @@ class RAGGenerator:
             "embedding_stats": self.embedding_generator.get_cache_stats(),
             "retriever_stats": self.hybrid_retriever.get_stats(),
             "reranking_enabled": self.use_reranking,
-            "max_context_length": self.max_context_length
+            "max_context_length": self.max_context_length,
+            "context_packing": self.context_packer.get_stats(),
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None
         }
 
@@ -0,0 +1,242 @@
+"""
+Semantic response cache for RAG answers.
+
+Incoming queries are embedded with the existing EmbeddingGenerator and
+matched against earlier queries in a small in-memory FAISS index, so a
+paraphrase ("pricing?" / "how much does it cost?") above a cosine similarity
+threshold returns the stored answer without retrieval, reranking or an LLM
+call.  Entries are scoped by prompt type, system role and the retrieval and
+generation options of the request (model, length, temperature, depth), and
+the whole cache is dropped when the corpus version changes.  A sample of hits is regenerated
+and compared with the cached answer to estimate the false-hit rate; an entry
+found to give a false hit is dropped.
+"""
+
+import json
+import time
+import uuid
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+
+from ..retrieval.local_index import FaissIndex
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticResponseCache:
+    """Answers keyed by query embedding, looked up by nearest neighbour within a scope."""
+
+    def __init__(
+        self,
+        embedding_generator,
+        similarity_threshold: float = 0.92,
+        max_entries: int = 10000,
+        false_hit_sample_rate: float = 0.02,
+        false_hit_threshold: float = 0.8,
+        max_false_hit_samples: int = 100
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            embedding_generator: EmbeddingGenerator used for queries and answers
+            similarity_threshold: Minimum cosine similarity between a query and a
+                cached query for a hit
+            max_entries: Maximum cached answers; least recently used are evicted
+            false_hit_sample_rate: Fraction of hits that are regenerated and
+                compared with the cached answer
+            false_hit_threshold: A sampled hit whose cached and fresh answers
+                have a lower cosine similarity counts as a false hit
+            max_false_hit_samples: Recent false hits kept for inspection
+        """
+        self.embedding_generator = embedding_generator
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.false_hit_sample_rate = false_hit_sample_rate
+        self.false_hit_threshold = false_hit_threshold
+
+        # Exact search: the cache is small, and evictions would leave HNSW
+        # tombstones whose compaction rebuilds the graph on the request thread
+        self.index = FaissIndex(collection_name="semantic_cache", index_type="flat")
+        self.corpus_version = None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "sampled_hits": 0,
+            "false_hits": 0
+        }
+        self.false_hit_samples = deque(maxlen=max_false_hit_samples)
+
+    @staticmethod
+    def _scope(prompt_type: str, system_role: str, options: Optional[Dict[str, Any]] = None) -> str:
+        return f"{prompt_type}:{system_role}:{json.dumps(options or {}, sort_keys=True, default=str)}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        return np.asarray(self.embedding_generator.generate_embeddings(text), dtype=np.float32).reshape(-1)
+
+    def _check_version(self, corpus_version):
+        """Drop every entry when the corpus has changed since they were stored. Caller holds the lock."""
+        if corpus_version != self.corpus_version:
+            if self._entries:
+                logger.info(f"Corpus version changed to {corpus_version}; invalidating semantic cache")
+            self._clear()
+            self.corpus_version = corpus_version
+
+    def _clear(self) -> int:
+        """Drop every entry. Caller holds the lock."""
+        entry_ids = list(self._entries)
+        self._entries.clear()
+        if entry_ids:
+            self.stats["invalidations"] += 1
+            self.index.delete(entry_ids)
+        return len(entry_ids)
+
+    def lookup(
+        self,
+        query: str,
+        prompt_type: str,
+        system_role: str,
+        corpus_version=None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a query or a paraphrase of it.
+
+        Args:
+            query: Incoming query
+            prompt_type: Prompt type the answer was generated with
+            system_role: System role the answer was generated with
+            corpus_version: Current corpus version; a change invalidates the cache
+            options: Retrieval and generation parameters of the request, e.g.
+                model name, max tokens, temperature and top-k; only answers
+                stored with the same options can hit
+
+        Returns:
+            Dict with the entry ``id``, the cached ``query`` and ``result`` and the
+            ``similarity``, or None on a miss
+        """
+        embedding = self._embed(query)
+        with self._lock:
+            self._check_version(corpus_version)
+        # Entries dropped after this search are no longer in _entries, so they miss below
+        match = self.index.search(embedding, n_results=1,
+                                  filter_metadata={"scope": self._scope(prompt_type, system_role, options)})
+        similarity = 1.0 - match["distances"][0] if match["ids"] else 0.0
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry = self._entries.get(match["ids"][0]) if match["ids"] else None
+            if entry is None or similarity < self.similarity_threshold:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(match["ids"][0])
+            self.stats["hits"] += 1
+
+        return {"id": match["ids"][0], "query": entry["query"], "result": entry["result"], "similarity": similarity}
+
+    def store(
+        self,
+        query: str,
+        prompt_type: str,
+        system_role: str,
+        result: Dict[str, Any],
+        corpus_version=None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Cache an answer for a query.
+
+        Returns:
+            The new entry ID
+        """
+        entry_id = uuid.uuid4().hex
+        scope = self._scope(prompt_type, system_role, options)
+        embedding = self._embed(query)
+
+        # Checked and added together, so an invalidation cannot land in between
+        evicted: List[str] = []
+        with self._lock:
+            self._check_version(corpus_version)
+            self.index.add([query], [embedding], [{"scope": scope}], [entry_id])
+            self._entries[entry_id] = {"query": query, "result": dict(result), "created": time.time()}
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self.stats["stores"] += 1
+            self.stats["evictions"] += len(evicted)
+            if evicted:
+                self.index.delete(evicted)
+        return entry_id
+
+    def should_sample(self) -> bool:
+        """Whether a hit should be regenerated to check it."""
+        return random.random() < self.false_hit_sample_rate
+
+    def check_hit(self, query: str, hit: Dict[str, Any], fresh_result: Dict[str, Any]) -> bool:
+        """
+        Compare a sampled hit's cached answer with a freshly generated one.
+
+        A false hit's entry is dropped, so it stops answering paraphrases that
+        land near it.
+
+        Args:
+            query: Query that produced the hit
+            hit: Result of lookup
+            fresh_result: Answer generated for ``query`` without the cache
+
+        Returns:
+            True if the hit was false
+        """
+        cached_answer = hit["result"].get("answer", "")
+        fresh_answer = fresh_result.get("answer", "")
+        vectors = np.stack([self._embed(cached_answer), self._embed(fresh_answer)])
+        norms = np.linalg.norm(vectors, axis=1)
+        answer_similarity = float(vectors[0] @ vectors[1] / max(norms[0] * norms[1], 1e-12))
+
+        false_hit = answer_similarity < self.false_hit_threshold
+        with self._lock:
+            self.stats["sampled_hits"] += 1
+            if false_hit:
+                self.stats["false_hits"] += 1
+                self.false_hit_samples.append({
+                    "query": query,
+                    "cached_query": hit["query"],
+                    "query_similarity": hit["similarity"],
+                    "answer_similarity": answer_similarity
+                })
+                if self._entries.pop(hit["id"], None) is not None:
+                    self.index.delete([hit["id"]])
+        if false_hit:
+            logger.warning(
+                f"Semantic cache false hit: '{query}' matched '{hit['query']}' "
+                f"(query similarity {hit['similarity']:.3f}, answer similarity {answer_similarity:.3f})"
+            )
+        return false_hit
+
+    def invalidate(self) -> int:
+        """Drop every cached answer; returns the number removed."""
+        with self._lock:
+            return self._clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate and false-hit statistics."""
+        lookups = self.stats["lookups"]
+        sampled = self.stats["sampled_hits"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "corpus_version": self.corpus_version,
+            "similarity_threshold": self.similarity_threshold,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "false_hit_rate": self.stats["false_hits"] / sampled if sampled else 0.0,
+            "recent_false_hits": list(self.false_hit_samples)
+        }
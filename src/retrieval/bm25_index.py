@@ -0,0 +1,418 @@
+"""
+Incremental inverted-index BM25 engine.
+
+Documents are appended to a posting buffer, so indexing new documents costs
+O(new tokens) instead of rebuilding the whole model.  On the next query the
+buffer is sealed into an immutable CSR segment of term frequencies (terms x
+documents); small segments are merged log-structured style so the number of
+segments stays logarithmic in corpus size.  Deletes are tombstoned and
+corpus statistics (IDF, average document length) are recomputed lazily on
+the first query after the index changes.
+
+Scoring only touches the CSR rows of the query terms: the BM25 saturation is
+applied to those postings and the queries' IDF weights are folded in with a
+single sparse matrix product per segment (one row per query, so batches of
+queries share the work), followed by an ``argpartition`` top-k over the
+candidate documents.
+"""
+
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterable, Tuple
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Segment:
+    """Immutable block of term frequencies for a contiguous range of documents."""
+    doc_offset: int
+    tf: sparse.csr_matrix
+
+    @property
+    def num_docs(self) -> int:
+        return self.tf.shape[1]
+
+
+class BM25Index:
+    """Okapi BM25 over CSR posting segments with tombstoned deletes."""
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        compaction_threshold: float = 0.2,
+        merge_factor: float = 2.0
+    ):
+        """
+        Initialize an empty BM25 index.
+
+        Args:
+            k1: Term frequency saturation parameter
+            b: Document length normalization parameter
+            epsilon: Floor for negative IDF values, as a fraction of the average IDF
+            compaction_threshold: Fraction of tombstoned documents that triggers
+                purging dead postings
+            merge_factor: A new segment is merged into its predecessor while it
+                holds at least 1/merge_factor of the predecessor's postings
+        """
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.compaction_threshold = compaction_threshold
+        self.merge_factor = merge_factor
+
+        # Vocabulary and document frequencies, indexed by term id
+        self._vocab: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+
+        # Sealed segments plus the buffer of postings not yet sealed
+        self._segments: List[_Segment] = []
+        self._pending_offset = 0
+        self._pending_terms = array('I')
+        self._pending_docs = array('I')
+        self._pending_tfs = array('I')
+
+        # Per-document state, indexed by document position
+        self._doc_len = np.zeros(0, dtype=np.float64)
+        self._live = np.zeros(0, dtype=bool)
+        self._num_docs = 0
+        self._num_deleted = 0
+        self._num_unpurged = 0
+        self._total_len = 0.0
+
+        # Lazily recomputed statistics
+        self._idf = np.zeros(0, dtype=np.float64)
+        self._avgdl = 0.0
+        self._stats_dirty = True
+
+        self._lock = threading.RLock()
+
+    @property
+    def num_docs(self) -> int:
+        """Number of document positions, including tombstoned ones."""
+        return self._num_docs
+
+    @property
+    def num_live_docs(self) -> int:
+        """Number of documents that have not been deleted."""
+        return self._num_docs - self._num_deleted
+
+    def _ensure_doc_capacity(self, size: int):
+        """Grow per-document arrays geometrically so appends stay amortized O(1)."""
+        capacity = len(self._doc_len)
+        if size <= capacity:
+            return
+        new_capacity = max(size, 2 * capacity, 1024)
+        doc_len = np.zeros(new_capacity, dtype=np.float64)
+        doc_len[:capacity] = self._doc_len
+        live = np.zeros(new_capacity, dtype=bool)
+        live[:capacity] = self._live
+        self._doc_len = doc_len
+        self._live = live
+
+    def _ensure_term_capacity(self, size: int):
+        """Grow the document frequency array geometrically."""
+        capacity = len(self._df)
+        if size <= capacity:
+            return
+        df = np.zeros(max(size, 2 * capacity, 1024), dtype=np.int64)
+        df[:capacity] = self._df
+        self._df = df
+
+    def add(self, tokenized_documents: Iterable[List[str]]) -> List[int]:
+        """
+        Append documents to the index.
+
+        Args:
+            tokenized_documents: Documents as lists of tokens
+
+        Returns:
+            Positions assigned to the new documents
+        """
+        with self._lock:
+            positions = []
+            for tokens in tokenized_documents:
+                doc_id = self._num_docs
+                self._ensure_doc_capacity(doc_id + 1)
+
+                term_freqs: Dict[str, int] = {}
+                for token in tokens:
+                    term_freqs[token] = term_freqs.get(token, 0) + 1
+
+                for term, tf in term_freqs.items():
+                    term_id = self._vocab.get(term)
+                    if term_id is None:
+                        term_id = len(self._vocab)
+                        self._vocab[term] = term_id
+                        self._ensure_term_capacity(term_id + 1)
+                    self._pending_terms.append(term_id)
+                    self._pending_docs.append(doc_id - self._pending_offset)
+                    self._pending_tfs.append(tf)
+                    self._df[term_id] += 1
+
+                self._doc_len[doc_id] = len(tokens)
+                self._live[doc_id] = True
+                self._total_len += len(tokens)
+                self._num_docs += 1
+                positions.append(doc_id)
+
+            if positions:
+                self._stats_dirty = True
+            return positions
+
+    def delete(self, positions: Iterable[int]) -> int:
+        """
+        Tombstone documents by position.
+
+        Document frequencies keep counting tombstoned postings until the
+        index is compacted, which happens automatically once the share of
+        deleted documents exceeds ``compaction_threshold``.
+
+        Returns:
+            Number of documents that were deleted
+        """
+        with self._lock:
+            deleted = 0
+            for position in positions:
+                if 0 <= position < self._num_docs and self._live[position]:
+                    self._live[position] = False
+                    self._total_len -= self._doc_len[position]
+                    self._num_deleted += 1
+                    self._num_unpurged += 1
+                    deleted += 1
+
+            if deleted:
+                self._stats_dirty = True
+                if self._num_unpurged > self.compaction_threshold * self._num_docs:
+                    self.compact()
+            return deleted
+
+    def _seal_pending(self):
+        """Turn the posting buffer into a CSR segment and merge small segments."""
+        num_pending = self._num_docs - self._pending_offset
+        if num_pending == 0:
+            return
+
+        tf = sparse.csr_matrix(
+            (
+                np.frombuffer(self._pending_tfs, dtype=np.uintc).astype(np.float32),
+                (
+                    np.frombuffer(self._pending_terms, dtype=np.uintc),
+                    np.frombuffer(self._pending_docs, dtype=np.uintc)
+                )
+            ),
+            shape=(len(self._vocab), num_pending)
+        )
+        self._segments.append(_Segment(doc_offset=self._pending_offset, tf=tf))
+        self._pending_offset = self._num_docs
+        self._pending_terms = array('I')
+        self._pending_docs = array('I')
+        self._pending_tfs = array('I')
+
+        while (
+            len(self._segments) > 1
+            and self._segments[-1].tf.nnz * self.merge_factor >= self._segments[-2].tf.nnz
+        ):
+            last = self._segments.pop()
+            previous = self._segments.pop()
+            self._segments.append(self._merge_segments([previous, last], purge=False))
+
+    def _merge_segments(self, segments: List[_Segment], purge: bool) -> _Segment:
+        """Merge adjacent segments, optionally dropping tombstoned postings."""
+        doc_offset = segments[0].doc_offset
+        rows, cols, data = [], [], []
+        for segment in segments:
+            coo = segment.tf.tocoo()
+            rows.append(coo.row)
+            cols.append(coo.col + (segment.doc_offset - doc_offset))
+            data.append(coo.data)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        data = np.concatenate(data)
+
+        if purge:
+            keep = self._live[cols + doc_offset]
+            rows, cols, data = rows[keep], cols[keep], data[keep]
+
+        num_docs = sum(segment.num_docs for segment in segments)
+        tf = sparse.csr_matrix((data, (rows, cols)), shape=(len(self._vocab), num_docs))
+        return _Segment(doc_offset=doc_offset, tf=tf)
+
+    def compact(self):
+        """Merge all segments, purge tombstoned postings and recompute document frequencies."""
+        with self._lock:
+            self._seal_pending()
+            if self._segments:
+                merged = self._merge_segments(self._segments, purge=True)
+                self._segments = [merged]
+                self._df[:len(self._vocab)] = np.diff(merged.tf.indptr)
+            self._num_unpurged = 0
+            self._stats_dirty = True
+            logger.info(f"Compacted BM25 index with {self._num_deleted} tombstoned documents")
+
+    def _refresh_stats(self):
+        """Seal pending postings and recompute IDF and avgdl if the index changed."""
+        self._seal_pending()
+        if not self._stats_dirty:
+            return
+
+        num_live = self.num_live_docs
+        self._avgdl = self._total_len / num_live if num_live else 0.0
+
+        df = self._df[:len(self._vocab)].astype(np.float64)
+        idf = np.log(np.maximum(num_live - df, 0.0) + 0.5) - np.log(df + 0.5)
+        present = df > 0
+        if present.any():
+            # Same negative-IDF flooring as rank_bm25's BM25Okapi
+            floor = self.epsilon * float(idf[present].mean())
+            idf[idf < 0] = floor
+        self._idf = idf
+        self._stats_dirty = False
+
+    def _query_matrix(self, queries: List[List[str]]) -> Tuple[np.ndarray, sparse.csr_matrix]:
+        """
+        Build the IDF-weighted query matrix over the union of query terms.
+
+        Returns:
+            Tuple of (term ids, matrix of shape queries x term ids)
+        """
+        columns: Dict[int, int] = {}
+        rows, cols, data = [], [], []
+        for row, query_tokens in enumerate(queries):
+            for token in query_tokens:
+                term_id = self._vocab.get(token)
+                if term_id is None:
+                    continue
+                col = columns.setdefault(term_id, len(columns))
+                rows.append(row)
+                cols.append(col)
+                data.append(self._idf[term_id])
+
+        term_ids = np.fromiter(columns.keys(), dtype=np.int64, count=len(columns))
+        # Duplicate (row, col) entries are summed, which weights repeated query terms
+        query_matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), (rows, cols)),
+            shape=(len(queries), len(columns))
+        )
+        return term_ids, query_matrix
+
+    def _saturate(self, segment: _Segment, term_ids: np.ndarray) -> sparse.csr_matrix:
+        """Slice the segment rows for ``term_ids`` and apply BM25 tf saturation."""
+        rows = segment.tf[term_ids]
+        docs = rows.indices + segment.doc_offset
+        tf = rows.data.astype(np.float64)
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len[docs] / (self._avgdl or 1.0))
+        saturated = tf * (self.k1 + 1) / (tf + norm)
+        return sparse.csr_matrix((saturated, rows.indices, rows.indptr), shape=rows.shape)
+
+    def _candidate_scores(self, queries: List[List[str]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score only documents that appear in the postings of the query terms.
+
+        All queries are scored together with one sparse matrix product per
+        segment.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+        term_ids, query_matrix = self._query_matrix(queries)
+        if not len(term_ids) or not self.num_live_docs:
+            return [empty for _ in queries]
+
+        positions = [[] for _ in queries]
+        scores = [[] for _ in queries]
+        for segment in self._segments:
+            in_segment = term_ids < segment.tf.shape[0]
+            if not in_segment.any():
+                continue
+            segment_scores = query_matrix[:, in_segment] @ self._saturate(segment, term_ids[in_segment])
+            for row in range(len(queries)):
+                start, end = segment_scores.indptr[row], segment_scores.indptr[row + 1]
+                if start == end:
+                    continue
+                positions[row].append(segment_scores.indices[start:end].astype(np.int64) + segment.doc_offset)
+                scores[row].append(segment_scores.data[start:end])
+
+        candidates = []
+        for row_positions, row_scores in zip(positions, scores):
+            if not row_positions:
+                candidates.append(empty)
+                continue
+            row_positions = np.concatenate(row_positions)
+            row_scores = np.concatenate(row_scores)
+            live = self._live[row_positions]
+            candidates.append((row_positions[live], row_scores[live]))
+        return candidates
+
+    def _select_top_k(
+        self,
+        positions: np.ndarray,
+        scores: np.ndarray,
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Keep the ``k`` best positive candidates, sorted by descending score then position."""
+        positive = scores > 0
+        positions, scores = positions[positive], scores[positive]
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+            positions, scores = positions[top], scores[top]
+        order = np.lexsort((positions, -scores))
+        return positions[order], scores[order]
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """
+        Score every document position against a tokenized query.
+
+        Tombstoned documents always score zero.  Prefer ``top_k`` when only
+        the best documents are needed, since it never materializes a dense
+        score array.
+        """
+        with self._lock:
+            self._refresh_stats()
+            scores = np.zeros(self._num_docs, dtype=np.float64)
+            positions, candidate_scores = self._candidate_scores([query_tokens])[0]
+            scores[positions] = candidate_scores
+            return scores
+
+    def top_k(self, query_tokens: List[str], k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the ``k`` best documents with a positive score.
+
+        Returns:
+            Tuple of (positions, scores) sorted by descending score
+        """
+        return self.batch_top_k([query_tokens], k)[0]
+
+    def batch_top_k(
+        self,
+        queries: List[List[str]],
+        k: int = 5
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get the ``k`` best documents for each of several tokenized queries.
+
+        Returns:
+            One (positions, scores) tuple per query, sorted by descending score
+        """
+        with self._lock:
+            self._refresh_stats()
+            candidates = self._candidate_scores(queries)
+        return [self._select_top_k(positions, scores, k) for positions, scores in candidates]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics."""
+        with self._lock:
+            self._refresh_stats()
+            return {
+                "num_docs": self._num_docs,
+                "num_live_docs": self.num_live_docs,
+                "num_deleted_docs": self._num_deleted,
+                "vocabulary_size": len(self._vocab),
+                "num_segments": len(self._segments),
+                "num_postings": int(sum(segment.tf.nnz for segment in self._segments)),
+                "avgdl": self._avgdl
+            }
@@ -0,0 +1,191 @@
+"""
+Dimension reduction for stored and query embeddings.
+
+``PCAReducer`` projects onto the top principal components of a sample;
+``MatryoshkaReducer`` keeps the leading dimensions of models trained with
+Matryoshka representation learning.  Both re-normalize their output so
+cosine scores stay comparable.  ``recall_vs_dimension`` measures how much of
+the full-width exact top-k each candidate dimension keeps, to pick the
+smallest one that preserves retrieval quality.
+"""
+
+import os
+from typing import List, Dict, Any, Optional, Sequence
+import numpy as np
+import logging
+
+from .quantization import recall_at_k
+
+logger = logging.getLogger(__name__)
+
+REDUCTION_METHODS = ("pca", "matryoshka")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class PCAReducer:
+    """Projection onto the leading principal components of a sample."""
+
+    method = "pca"
+
+    def __init__(self, target_dimension: int):
+        """
+        Initialize the reducer.
+
+        Args:
+            target_dimension: Output dimension
+        """
+        self.target_dimension = target_dimension
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+        self.explained_variance_ratio = 0.0
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.components is not None
+
+    def fit(self, vectors: np.ndarray) -> "PCAReducer":
+        """Learn the mean and principal components from a sample of embeddings."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.target_dimension > min(vectors.shape):
+            raise ValueError(
+                f"Cannot fit {self.target_dimension} components from a {vectors.shape[0]}x{vectors.shape[1]} sample"
+            )
+        self.mean = vectors.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.target_dimension], dtype=np.float32)
+        variance = singular_values ** 2
+        total = variance.sum()
+        self.explained_variance_ratio = float(variance[:self.target_dimension].sum() / total) if total > 0 else 0.0
+        return self
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Project and re-normalize embeddings."""
+        if not self.is_fitted:
+            raise RuntimeError("PCA reducer must be fitted before use")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalize((vectors - self.mean) @ self.components.T)
+
+    def save(self, path: str):
+        """Atomically write the fitted projection to an .npz file."""
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            mean=self.mean,
+            components=self.components,
+            explained_variance_ratio=self.explained_variance_ratio
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAReducer":
+        """Load a projection written by save."""
+        with np.load(path) as data:
+            reducer = cls(int(data["components"].shape[0]))
+            reducer.mean = data["mean"]
+            reducer.components = data["components"]
+            reducer.explained_variance_ratio = float(data["explained_variance_ratio"])
+        return reducer
+
+
+class MatryoshkaReducer:
+    """Truncation to the leading dimensions of a Matryoshka-trained model."""
+
+    method = "matryoshka"
+    is_fitted = True
+
+    def __init__(self, target_dimension: int):
+        """
+        Initialize the reducer.
+
+        Args:
+            target_dimension: Number of leading dimensions to keep
+        """
+        self.target_dimension = target_dimension
+
+    def fit(self, vectors: np.ndarray) -> "MatryoshkaReducer":
+        return self
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Truncate and re-normalize embeddings."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalize(vectors[:, :self.target_dimension])
+
+
+def create_reducer(method: str, target_dimension: int):
+    """
+    Create an unfitted reducer.
+
+    Args:
+        method: 'pca' or 'matryoshka'
+        target_dimension: Output dimension
+
+    Returns:
+        PCAReducer or MatryoshkaReducer
+    """
+    if method == "pca":
+        return PCAReducer(target_dimension)
+    if method == "matryoshka":
+        return MatryoshkaReducer(target_dimension)
+    raise ValueError(f"Unsupported reduction method: {method}")
+
+
+def _exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_vs_dimension(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    dimensions: Sequence[int],
+    method: str = "pca",
+    k: int = 10,
+    fit_sample: Optional[np.ndarray] = None
+) -> List[Dict[str, Any]]:
+    """
+    Measure how well each reduced dimension preserves full-width retrieval.
+
+    Args:
+        corpus: Full-width document embeddings
+        queries: Full-width query embeddings
+        dimensions: Candidate output dimensions
+        method: 'pca' or 'matryoshka'
+        k: Cutoff for recall against the full-width exact top-k
+        fit_sample: Embeddings to fit PCA on; the corpus by default
+
+    Returns:
+        One row per dimension with recall@k, bytes per float32 vector and, for
+        PCA, the explained variance ratio
+    """
+    corpus = _normalize(np.asarray(corpus, dtype=np.float32))
+    queries = _normalize(np.asarray(queries, dtype=np.float32))
+    truth = _exact_top_k(corpus, queries, k)
+    sample = corpus if fit_sample is None else np.asarray(fit_sample, dtype=np.float32)
+
+    report = []
+    for dimension in sorted(dimensions):
+        reducer = create_reducer(method, dimension).fit(sample)
+        reduced_ids = _exact_top_k(reducer.transform(corpus), reducer.transform(queries), k)
+        row = {
+            "dimension": dimension,
+            "recall_at_k": recall_at_k(reduced_ids, truth, k),
+            "bytes_per_vector": dimension * 4
+        }
+        if method == "pca":
+            row["explained_variance_ratio"] = reducer.explained_variance_ratio
+        report.append(row)
+        logger.info(f"{method} dimension {dimension}: recall@{k} {row['recall_at_k']:.4f}")
+    return report
+
+
+def choose_dimension(report: List[Dict[str, Any]], min_recall: float = 0.95) -> Optional[int]:
+    """Smallest dimension in a recall_vs_dimension report reaching ``min_recall``."""
+    passing = [row["dimension"] for row in report if row["recall_at_k"] >= min_recall]
+    return min(passing) if passing else None
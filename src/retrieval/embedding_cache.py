@@ -0,0 +1,374 @@
+"""
+Embedding caches.
+
+``SegmentedLRUCache`` is the in-process cache: a segmented LRU bounded in
+bytes, where new entries wait in a probationary segment and only entries hit
+again move to a protected one, so a one-off bulk ingest cannot flush hot
+query embeddings.
+
+``PersistentEmbeddingCache`` is content-addressed on disk: embeddings are
+keyed by (model name, SHA-256 of the text) and stored as raw float32 blobs in
+a single SQLite file, so every worker process and every restart shares them.
+The file is kept under a byte budget by evicting the least recently used
+entries.  Reads only note access times in memory; they are written in
+batches, with the next write or once enough have accumulated, so a cache hit
+never costs a write transaction.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Sequence, Hashable, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_digest(text: str) -> bytes:
+    """SHA-256 digest of a text, stable across processes and restarts."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class SegmentedLRUCache:
+    """Thread-safe segmented LRU of numpy arrays with O(1) operations, sized in bytes."""
+
+    def __init__(self, max_bytes: int, max_entries: Optional[int] = None, protected_fraction: float = 0.8):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Upper bound on the total bytes of cached arrays
+            max_entries: Optional upper bound on the number of entries
+            protected_fraction: Share of max_bytes reserved for entries hit at
+                least twice; the rest holds new entries on probation
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.protected_bytes_limit = int(max_bytes * protected_fraction)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._probation: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._protected: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._probation_bytes = 0
+        self._protected_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """Total bytes of cached arrays."""
+        return self._probation_bytes + self._protected_bytes
+
+    def __len__(self) -> int:
+        return len(self._probation) + len(self._protected)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._protected or key in self._probation
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return a cached array and refresh its recency, or None on a miss."""
+        with self._lock:
+            value = self._protected.get(key)
+            if value is not None:
+                self._protected.move_to_end(key)
+                self.hits += 1
+                return value
+
+            value = self._probation.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+
+            # A second hit promotes to the protected segment
+            self._probation_bytes -= value.nbytes
+            self._protected[key] = value
+            self._protected_bytes += value.nbytes
+            while self._protected_bytes > self.protected_bytes_limit and len(self._protected) > 1:
+                demoted_key, demoted = self._protected.popitem(last=False)
+                self._protected_bytes -= demoted.nbytes
+                self._probation[demoted_key] = demoted
+                self._probation_bytes += demoted.nbytes
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        """Insert or replace an entry, evicting from the probation tail when over budget."""
+        value = np.asarray(value)
+        with self._lock:
+            if key in self._protected:
+                self._protected_bytes += value.nbytes - self._protected[key].nbytes
+                self._protected[key] = value
+                self._protected.move_to_end(key)
+            else:
+                previous = self._probation.pop(key, None)
+                if previous is not None:
+                    self._probation_bytes -= previous.nbytes
+                self._probation[key] = value
+                self._probation_bytes += value.nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._over_budget():
+            segment = self._probation if self._probation else self._protected
+            _, evicted = segment.popitem(last=False)
+            if segment is self._probation:
+                self._probation_bytes -= evicted.nbytes
+            else:
+                self._protected_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _over_budget(self) -> bool:
+        if not len(self):
+            return False
+        if self.max_entries is not None and len(self) > self.max_entries:
+            return True
+        return self.nbytes > self.max_bytes
+
+    def clear(self):
+        """Drop every entry; counters are kept."""
+        with self._lock:
+            self._probation.clear()
+            self._protected.clear()
+            self._probation_bytes = 0
+            self._protected_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "protected_entries": len(self._protected),
+            "probation_entries": len(self._probation),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class PersistentEmbeddingCache:
+    """Size-bounded on-disk embedding cache shared across processes."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 1 << 30,
+        evict_fraction: float = 0.1,
+        touch_flush_every: int = 1000
+    ):
+        """
+        Open or create the cache file.
+
+        Args:
+            path: SQLite file path
+            max_bytes: Upper bound on stored embedding bytes
+            evict_fraction: Fraction of max_bytes freed below the bound on each
+                eviction, so evictions happen in batches rather than per insert
+            touch_flush_every: Buffered access-time updates that trigger a
+                write on the read path
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_fraction = evict_fraction
+        self.touch_flush_every = touch_flush_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending_touches: Dict[Tuple[str, bytes], float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, digest)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access);
+            CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('total_bytes', 0);
+        """)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up embeddings for several texts.
+
+        Args:
+            model: Model name the embeddings were produced with
+            texts: Texts to look up
+
+        Returns:
+            Mapping from index in ``texts`` to its cached embedding
+        """
+        digests = [text_digest(text) for text in texts]
+        positions: Dict[bytes, List[int]] = {}
+        for i, digest in enumerate(digests):
+            positions.setdefault(digest, []).append(i)
+
+        found: Dict[int, np.ndarray] = {}
+        unique = list(positions.keys())
+        with self._lock:
+            try:
+                for start in range(0, len(unique), _LOOKUP_CHUNK):
+                    chunk = unique[start:start + _LOOKUP_CHUNK]
+                    rows = self._conn.execute(
+                        f"SELECT digest, vector FROM embeddings WHERE model = ? "
+                        f"AND digest IN ({','.join('?' * len(chunk))})",
+                        [model, *chunk]
+                    ).fetchall()
+                    for digest, vector in rows:
+                        embedding = np.frombuffer(vector, dtype=np.float32)
+                        for i in positions[digest]:
+                            found[i] = embedding
+
+                    now = time.time()
+                    for digest, _ in rows:
+                        self._pending_touches[(model, digest)] = now
+            except sqlite3.Error as e:
+                logger.error(f"Error reading embedding cache: {e}")
+                return {}
+
+            if len(self._pending_touches) >= self.touch_flush_every:
+                try:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    self._flush_touches()
+                    self._conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    logger.error(f"Error recording embedding cache access times: {e}")
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: Sequence[str], embeddings: np.ndarray):
+        """
+        Store embeddings, evicting least recently used entries past the byte budget.
+
+        Args:
+            model: Model name the embeddings were produced with
+            texts: Texts the embeddings belong to
+            embeddings: One embedding per text
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        entries = {text_digest(text): embedding.tobytes() for text, embedding in zip(texts, embeddings)}
+        if not entries:
+            return
+
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                added = 0
+                for digest, vector in entries.items():
+                    previous = self._conn.execute(
+                        "SELECT length(vector) FROM embeddings WHERE model = ? AND digest = ?",
+                        (model, digest)
+                    ).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, digest, vector, last_access) VALUES (?, ?, ?, ?)",
+                        (model, digest, vector, now)
+                    )
+                    added += len(vector) - (previous[0] if previous else 0)
+                self._conn.execute(
+                    "UPDATE cache_meta SET value = value + ? WHERE key = 'total_bytes'", (added,)
+                )
+                # Recent reads must count before choosing what to evict
+                self._flush_touches()
+                self._evict_if_needed()
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error(f"Error writing embedding cache: {e}")
+
+    def _flush_touches(self):
+        """Write buffered access times; call inside a write transaction."""
+        if self._pending_touches:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND digest = ?",
+                ((now, model, digest) for (model, digest), now in self._pending_touches.items())
+            )
+            self._pending_touches = {}
+
+    def _evict_if_needed(self):
+        """Delete least recently used entries until under the low-water mark."""
+        total = self._conn.execute("SELECT value FROM cache_meta WHERE key = 'total_bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * (1.0 - self.evict_fraction)
+        freed = 0
+        victims = []
+        cursor = self._conn.execute("SELECT model, digest, length(vector) FROM embeddings ORDER BY last_access")
+        try:
+            for model, digest, size in cursor:
+                if total - freed <= target:
+                    break
+                victims.append((model, digest))
+                freed += size
+        finally:
+            cursor.close()
+
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND digest = ?", victims)
+        self._conn.execute("UPDATE cache_meta SET value = value - ? WHERE key = 'total_bytes'", (freed,))
+        self.evictions += len(victims)
+        logger.info(f"Evicted {len(victims)} embeddings ({freed} bytes) from the persistent cache")
+
+    def clear(self, model: Optional[str] = None):
+        """Delete every entry, or only those of one model."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if model is None:
+                self._conn.execute("DELETE FROM embeddings")
+            else:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,))
+            total = self._conn.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()[0]
+            self._conn.execute("UPDATE cache_meta SET value = ? WHERE key = 'total_bytes'", (total,))
+            self._conn.execute("COMMIT")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self._conn.execute("SELECT value FROM cache_meta WHERE key = 'total_bytes'").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """Write buffered access times and close the SQLite connection."""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._flush_touches()
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error(f"Error recording embedding cache access times: {e}")
+            self._conn.close()
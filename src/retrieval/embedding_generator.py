@@ -6,9 +6,44 @@ import numpy as np
 from typing import List, Union, Optional, Dict, Any
 from sentence_transformers import SentenceTransformer
 import openai
-from langchain_openai import OpenAIEmbeddings
 import os
+import logging
 from functools import lru_cache
+from tqdm import tqdm
+
+from .embedding_cache import SegmentedLRUCache, PersistentEmbeddingCache, text_digest
+from .embedding_pool import EmbeddingWorkerPool
+from .openai_embedding_client import AsyncOpenAIEmbeddingClient
+from .onnx_embedder import OnnxEmbedder, export_onnx_model, CONFIG_FILE as ONNX_CONFIG_FILE
+from .dimension_reduction import PCAReducer, create_reducer, recall_vs_dimension
+
+logger = logging.getLogger(__name__)
+
+
+def plan_token_batches(lengths: List[int], token_budget: int, max_batch_size: int) -> List[np.ndarray]:
+    """
+    Group texts into batches of similar length under a padded-token budget.
+    
+    Each batch pads to its longest member, so texts are sorted by length and a
+    batch holds as many as fit in ``token_budget`` at that padded length.
+    
+    Args:
+        lengths: Token length of each text
+        token_budget: Maximum of batch size times longest length per batch
+        max_batch_size: Hard cap on texts per batch
+        
+    Returns:
+        Arrays of text indices, one per batch, longest texts first
+    """
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(1, lengths[order[start]])
+        size = max(1, min(max_batch_size, token_budget // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
 
 
 class EmbeddingGenerator:
@@ -18,48 +53,144 @@ class EmbeddingGenerator:
         self, 
         model_name: str = "all-MiniLM-L6-v2",
         openai_api_key: Optional[str] = None,
-        cache_size: int = 1000
+        cache_size: Optional[int] = None,
+        cache_max_bytes: int = 64 * 1024 * 1024,
+        batch_token_budget: int = 16384,
+        max_batch_size: int = 256,
+        num_workers: int = 0,
+        threads_per_worker: int = 1,
+        openai_base_url: Optional[str] = None,
+        openai_max_concurrency: int = 8,
+        openai_tokens_per_minute: int = 1_000_000,
+        onnx_model_dir: Optional[str] = None,
+        onnx_quantize: bool = True,
+        onnx_threads: Optional[int] = None,
+        reduction_method: Optional[str] = None,
+        reduced_dimension: Optional[int] = None,
+        reducer_path: Optional[str] = None,
+        persistent_cache_path: Optional[str] = None,
+        persistent_cache_max_bytes: int = 1 << 30
     ):
         self.model_name = model_name
         self.openai_api_key = openai_api_key
-        self.cache = {}
         self.cache_size = cache_size
+        self.batch_token_budget = batch_token_budget
+        self.max_batch_size = max_batch_size
+        # Bounded by cache_max_bytes; cache_size adds an entry cap only when set
+        self.cache = SegmentedLRUCache(cache_max_bytes, max_entries=cache_size)
+        
+        # Optional on-disk cache shared by every worker and kept across restarts
+        self.persistent_cache = None
+        if persistent_cache_path:
+            self.persistent_cache = PersistentEmbeddingCache(
+                persistent_cache_path, max_bytes=persistent_cache_max_bytes
+            )
         
         # Initialize model based on type
         if model_name.startswith("text-embedding"):
             if not openai_api_key:
                 raise ValueError("OpenAI API key required for OpenAI embeddings")
-            self.model = OpenAIEmbeddings(openai_api_key=openai_api_key)
+            self.model = AsyncOpenAIEmbeddingClient(
+                openai_api_key,
+                model=model_name,
+                base_url=openai_base_url or "https://api.openai.com/v1",
+                max_concurrency=openai_max_concurrency,
+                tokens_per_minute=openai_tokens_per_minute
+            )
             self.model_type = "openai"
         else:
-            self.model = SentenceTransformer(model_name)
+            self.model = None
+            if onnx_model_dir:
+                self.model = self._load_onnx_model(onnx_model_dir, onnx_quantize, onnx_threads)
+            if self.model is None:
+                self.model = SentenceTransformer(model_name)
             self.model_type = "sentence_transformer"
+        
+        # Runtimes and quantization give slightly different vectors, so they never share cache entries
+        self.cache_namespace = model_name
+        if isinstance(self.model, OnnxEmbedder):
+            self.cache_namespace = f"{model_name}@{self.model.runtime}"
+        
+        # Optional projection applied to every embedding before it leaves the generator;
+        # a PCA reducer is loaded from reducer_path or fitted with fit_dimension_reducer,
+        # and embeddings stay at full width until it is fitted
+        self.reducer = None
+        self.reducer_path = reducer_path
+        if reduction_method == "pca" and reducer_path and os.path.exists(reducer_path):
+            self.reducer = PCAReducer.load(reducer_path)
+        elif reduction_method:
+            if not reduced_dimension:
+                raise ValueError("reduced_dimension is required with a reduction method")
+            self.reducer = create_reducer(reduction_method, reduced_dimension)
+            if not self.reducer.is_fitted:
+                logger.warning(
+                    f"No fitted {reduction_method} reducer at {reducer_path}; embeddings stay at full width "
+                    f"until fit_dimension_reducer is called"
+                )
+        
+        # Worker processes for CPU-bound bulk encoding; 0 encodes in this process.
+        # The model loaded above still sizes batches and encodes whenever the pool cannot
+        self.worker_pool = None
+        if num_workers and isinstance(self.model, OnnxEmbedder):
+            # Workers run the PyTorch model, whose vectors must not land in the ONNX cache namespace
+            logger.warning("Embedding worker pool is not used with an ONNX model; encoding in this process")
+        elif num_workers and self.model_type == "sentence_transformer":
+            self.worker_pool = EmbeddingWorkerPool(
+                model_name, num_workers=num_workers, threads_per_worker=threads_per_worker
+            )
+    
+    def _load_onnx_model(
+        self,
+        model_dir: str,
+        quantize: bool,
+        num_threads: Optional[int]
+    ) -> Optional[OnnxEmbedder]:
+        """Export the model to ONNX if needed and return the lazily loaded embedder, or None."""
+        try:
+            embedder = None
+            if os.path.exists(os.path.join(model_dir, ONNX_CONFIG_FILE)):
+                embedder = OnnxEmbedder(model_dir, num_threads=num_threads)
+                # Re-export when the model, quantization or opset changed since the last export
+                if not embedder.matches(self.model_name, quantize):
+                    embedder = None
+            if embedder is None:
+                export_onnx_model(
+                    SentenceTransformer(self.model_name), model_dir,
+                    quantize=quantize, source_model=self.model_name
+                )
+                embedder = OnnxEmbedder(model_dir, num_threads=num_threads)
+        except Exception as e:
+            logger.error(f"Error preparing ONNX model for {self.model_name}: {e}")
+            return None
+        
+        parity = embedder.parity or {}
+        if not parity.get("passed"):
+            logger.warning(
+                f"ONNX model in {model_dir} failed the parity check "
+                f"(min cosine {parity.get('min_cosine')}); using the float model"
+            )
+            return None
+        return embedder
     
     def _get_cache_key(self, text: str) -> str:
         """Generate cache key for text."""
-        return f"{self.model_name}:{hash(text)}"
+        # hash() is salted per process; a content digest is stable everywhere
+        return f"{self.cache_namespace}:{text_digest(text).hex()}"
     
     def _update_cache(self, texts: List[str], embeddings: np.ndarray):
         """Update cache with new embeddings."""
-        if len(self.cache) >= self.cache_size:
-            # Remove oldest entries (simple FIFO)
-            keys_to_remove = list(self.cache.keys())[:len(texts)]
-            for key in keys_to_remove:
-                del self.cache[key]
-        
         for text, embedding in zip(texts, embeddings):
-            cache_key = self._get_cache_key(text)
-            self.cache[cache_key] = embedding
+            self.cache.put(self._get_cache_key(text), embedding)
     
     def _get_cached_embeddings(self, texts: List[str]) -> tuple:
         """Get cached embeddings for texts."""
         cached_embeddings = {}
         uncached_texts = []
         
-        for text in texts:
-            cache_key = self._get_cache_key(text)
-            if cache_key in self.cache:
-                cached_embeddings[text] = self.cache[cache_key]
+        for text in dict.fromkeys(texts):
+            embedding = self.cache.get(self._get_cache_key(text))
+            if embedding is not None:
+                cached_embeddings[text] = embedding
             else:
                 uncached_texts.append(text)
         
@@ -69,9 +200,17 @@ class EmbeddingGenerator:
         self, 
         texts: Union[str, List[str]], 
         batch_size: int = 32,
-        show_progress: bool = True
+        show_progress: bool = True,
+        reduce: bool = True
     ) -> np.ndarray:
-        """Generate embeddings for texts."""
+        """
+        Generate embeddings for texts.
+        
+        Repeated texts are encoded once. ``batch_size`` applies to OpenAI
+        requests; local models batch by ``batch_token_budget`` instead. With a
+        dimension reducer configured, embeddings are projected unless
+        ``reduce`` is False.
+        """
         if isinstance(texts, str):
             texts = [texts]
         
@@ -81,6 +220,16 @@ class EmbeddingGenerator:
         # Check cache first
         cached_embeddings, uncached_texts = self._get_cached_embeddings(texts)
         
+        # Then the persistent cache, promoting its hits into memory
+        if uncached_texts and self.persistent_cache is not None:
+            stored = self.persistent_cache.get_many(self.cache_namespace, uncached_texts)
+            if stored:
+                stored_texts = [uncached_texts[i] for i in stored]
+                self._update_cache(stored_texts, [stored[i] for i in stored])
+                for text, i in zip(stored_texts, stored):
+                    cached_embeddings[text] = stored[i]
+                uncached_texts = [text for i, text in enumerate(uncached_texts) if i not in stored]
+        
         # Generate embeddings for uncached texts
         if uncached_texts:
             if self.model_type == "openai":
@@ -92,15 +241,27 @@ class EmbeddingGenerator:
                     uncached_texts, batch_size, show_progress
                 )
             
-            # Update cache
-            self._update_cache(uncached_texts, new_embeddings)
+            # Update cache; zero vectors are error fallbacks and must not outlive this call
+            valid = np.any(new_embeddings != 0, axis=1)
+            valid_texts = [text for text, keep in zip(uncached_texts, valid) if keep]
+            self._update_cache(valid_texts, new_embeddings[valid])
+            if self.persistent_cache is not None:
+                self.persistent_cache.put_many(self.cache_namespace, valid_texts, new_embeddings[valid])
             
             # Add to cached embeddings
             for text, embedding in zip(uncached_texts, new_embeddings):
                 cached_embeddings[text] = embedding
         
         # Return embeddings in original order
-        return np.array([cached_embeddings[text] for text in texts])
+        embeddings = np.array([cached_embeddings[text] for text in texts])
+        if reduce and self.reducer_fitted:
+            embeddings = self.reducer.transform(embeddings)
+        return embeddings
+    
+    @property
+    def reducer_fitted(self) -> bool:
+        """Whether a dimension reducer is configured and ready to project embeddings."""
+        return self.reducer is not None and self.reducer.is_fitted
     
     def _generate_openai_embeddings(
         self, 
@@ -108,20 +269,41 @@ class EmbeddingGenerator:
         batch_size: int, 
         show_progress: bool
     ) -> np.ndarray:
-        """Generate embeddings using OpenAI API."""
-        embeddings = []
+        """
+        Generate embeddings using the OpenAI API.
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
+        Raises:
+            EmbeddingRequestError: If batches still fail after retries
+        """
+        return self.model.embed_sync(texts, batch_size)
+    
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """Token length of each text, truncated to the model's maximum sequence length."""
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is not None:
             try:
-                batch_embeddings = self.model.embed_documents(batch)
-                embeddings.extend(batch_embeddings)
-            except Exception as e:
-                print(f"Error generating embeddings for batch {i//batch_size + 1}: {e}")
-                # Fill with zeros if error occurs
-                embeddings.extend([np.zeros(1536) for _ in batch])
-        
-        return np.array(embeddings)
+                input_ids = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+                return [len(ids) for ids in input_ids]
+            except Exception:
+                pass
+        # Rough estimate for models without a Hugging Face tokenizer
+        return [min(max_length, len(text) // 4 + 2) for text in texts]
+    
+    def _encode_batches(self, texts: List[str], batches: List[np.ndarray], show_progress: bool) -> np.ndarray:
+        """Encode planned batches in this process."""
+        embeddings = None
+        for batch in tqdm(batches, desc="Encoding", disable=not show_progress):
+            batch_embeddings = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        return embeddings
     
     def _generate_sentence_transformer_embeddings(
         self, 
@@ -129,37 +311,113 @@ class EmbeddingGenerator:
         batch_size: int, 
         show_progress: bool
     ) -> np.ndarray:
-        """Generate embeddings using SentenceTransformer."""
+        """Generate embeddings using SentenceTransformer, batched by token budget."""
         try:
-            embeddings = self.model.encode(
-                texts,
-                batch_size=batch_size,
-                show_progress_bar=show_progress,
-                convert_to_numpy=True
+            unique_texts = list(dict.fromkeys(texts))
+            batches = plan_token_batches(
+                self._token_lengths(unique_texts), self.batch_token_budget, self.max_batch_size
             )
-            return embeddings
+            
+            unique_embeddings = None
+            if self.worker_pool is not None and not self.worker_pool.failed:
+                try:
+                    unique_embeddings = self.worker_pool.encode(unique_texts, batches)
+                except RuntimeError as e:
+                    # The in-process model still serves requests while the pool recovers or after it fails
+                    logger.warning(f"Worker pool encoding failed, encoding in this process: {e}")
+            if unique_embeddings is None:
+                unique_embeddings = self._encode_batches(unique_texts, batches, show_progress)
+            
+            # Scatter back to the caller's order, repeating duplicates
+            position = {text: i for i, text in enumerate(unique_texts)}
+            return unique_embeddings[[position[text] for text in texts]]
         except Exception as e:
-            print(f"Error generating embeddings: {e}")
+            logger.error(f"Error generating embeddings: {e}")
             # Return zero embeddings as fallback
             return np.zeros((len(texts), self.model.get_sentence_embedding_dimension()))
     
+    def fit_dimension_reducer(self, texts: List[str]):
+        """
+        Fit the configured PCA reducer on sample texts and save it to reducer_path.
+        
+        Args:
+            texts: Representative sample of the corpus
+        """
+        if not isinstance(self.reducer, PCAReducer):
+            raise ValueError("fit_dimension_reducer requires reduction_method='pca'")
+        self.reducer.fit(self.generate_embeddings(texts, show_progress=False, reduce=False))
+        if self.reducer_path:
+            self.reducer.save(self.reducer_path)
+        logger.info(
+            f"Fitted PCA to {self.reducer.target_dimension} dimensions "
+            f"({self.reducer.explained_variance_ratio:.1%} of variance)"
+        )
+    
+    def dimension_report(
+        self,
+        corpus_texts: List[str],
+        query_texts: List[str],
+        dimensions: List[int],
+        method: str = "pca",
+        k: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Recall@k against full-width retrieval for each candidate dimension.
+        
+        Args:
+            corpus_texts: Sample documents
+            query_texts: Sample queries
+            dimensions: Candidate dimensions
+            method: 'pca' or 'matryoshka'
+            k: Recall cutoff
+            
+        Returns:
+            Report rows from recall_vs_dimension
+        """
+        corpus = self.generate_embeddings(corpus_texts, show_progress=False, reduce=False)
+        queries = self.generate_embeddings(query_texts, show_progress=False, reduce=False)
+        return recall_vs_dimension(corpus, queries, dimensions, method=method, k=k)
+    
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings."""
+        if self.reducer_fitted:
+            return self.reducer.target_dimension
         if self.model_type == "openai":
             return 1536  # OpenAI text-embedding-3-small dimension
         else:
             return self.model.get_sentence_embedding_dimension()
     
-    def clear_cache(self):
-        """Clear the embedding cache."""
+    def close(self):
+        """Stop the worker pool, close API connections and close the persistent cache."""
+        if self.model_type == "openai":
+            self.model.close()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool = None
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+            self.persistent_cache = None
+    
+    def clear_cache(self, include_persistent: bool = False):
+        """Clear the embedding cache, and optionally this model's persistent entries."""
         self.cache.clear()
+        if include_persistent and self.persistent_cache is not None:
+            self.persistent_cache.clear(self.cache_namespace)
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
-        return {
+        stats = {
             "cache_size": len(self.cache),
             "max_cache_size": self.cache_size,
             "model_name": self.model_name,
-            "model_type": self.model_type
+            "cache_namespace": self.cache_namespace,
+            "model_type": self.model_type,
+            "runtime": "onnx" if isinstance(self.model, OnnxEmbedder) else self.model_type,
+            **{f"cache_{key}": value for key, value in self.cache.get_stats().items() if key != "entries"}
         }
+        if self.persistent_cache is not None:
+            stats["persistent_cache"] = self.persistent_cache.get_stats()
+        if self.worker_pool is not None:
+            stats["worker_pool"] = self.worker_pool.get_stats()
+        return stats
 
@@ -0,0 +1,350 @@
+"""
+Multi-process sentence-transformer encoding for CPU ingestion.
+
+Each worker process loads its own copy of the model with a fixed number of
+intra-op threads, pulls batches from a task queue and writes embeddings
+straight into a shared-memory buffer owned by the caller, so only row offsets
+travel back through the result queue.  Dead workers are replaced, and the
+caller falls back to in-process encoding if the pool gives up.
+"""
+
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional, Sequence
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def _worker_main(model_name: str, num_threads: int, worker_id: int, tasks, results):
+    """Worker loop: encode batches and write them into the caller's shared buffer."""
+    # Must be set before torch is imported so its thread pools start at this size
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(num_threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        results.put(("ready", None, worker_id, model.get_sentence_embedding_dimension(), None))
+    except Exception as e:
+        results.put(("ready", None, worker_id, 0, f"{type(e).__name__}: {e}"))
+        return
+
+    attached = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        task_id, shm_name, offset, dimension, texts = task
+        # Lets the pool fail this task rather than wait forever if the process dies
+        results.put(("claim", task_id, worker_id, None, None))
+        try:
+            if attached is None or attached.name != shm_name:
+                if attached is not None:
+                    attached.close()
+                attached = shared_memory.SharedMemory(name=shm_name)
+            buffer = np.ndarray((offset + len(texts), dimension), dtype=np.float32, buffer=attached.buf)
+            buffer[offset:offset + len(texts)] = model.encode(
+                texts, batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True
+            )
+            del buffer
+            results.put(("done", task_id, worker_id, len(texts), None))
+        except Exception as e:
+            results.put(("done", task_id, worker_id, 0, f"{type(e).__name__}: {e}"))
+
+    if attached is not None:
+        attached.close()
+
+
+class EmbeddingWorkerPool:
+    """
+    Pool of model-holding worker processes sharing result buffers with the caller.
+
+    A collector thread routes replies to the ``encode`` call that submitted the
+    batch, so several calls can be in flight at once, and replaces workers that
+    die. A dead worker may have taken a batch without its claim reaching the
+    pool, so its death fails every batch not claimed by a live worker; once
+    ``max_restarts`` is used up, or a worker cannot load the model, the pool is
+    marked failed and every ``encode`` raises so the caller can encode in
+    process instead.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        num_workers: Optional[int] = None,
+        threads_per_worker: int = 1,
+        start_timeout: float = 300.0,
+        max_restarts: int = 3,
+        health_check_interval: float = 1.0
+    ):
+        """
+        Start the workers and wait until every model is loaded.
+
+        Args:
+            model_name: SentenceTransformer model name or path
+            num_workers: Worker processes; defaults to one per threads_per_worker cores
+            threads_per_worker: Intra-op threads pinned in each worker
+            start_timeout: Seconds to wait for the models to load
+            max_restarts: Dead workers replaced over the pool's lifetime before it is marked failed
+            health_check_interval: Seconds between checks for dead workers, by the
+                collector and by encode calls waiting on their batches
+        """
+        self.model_name = model_name
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.max_restarts = max_restarts
+        self.health_check_interval = health_check_interval
+        self.dimension = 0
+        self.encoded_texts = 0
+        self.restarts = 0
+        # Reason the pool stopped accepting work, if it did
+        self.failed: Optional[str] = None
+
+        # spawn gives each worker a fresh interpreter, so thread settings apply before torch loads
+        self._context = mp.get_context("spawn")
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._lock = threading.Condition()
+        self._next_task_id = 0
+        # Reply queue of the encode call waiting for each task, and the task each worker holds
+        self._waiters: Dict[int, queue.Queue] = {}
+        self._claims: Dict[int, int] = {}
+        self._ready_workers = 0
+        self._closing = False
+        self._processes = [self._spawn(worker_id) for worker_id in range(self.num_workers)]
+        self._collector = threading.Thread(target=self._collect, name="embedding-pool-collector", daemon=True)
+        self._collector.start()
+
+        with self._lock:
+            self._lock.wait_for(lambda: self._ready_workers >= self.num_workers or self.failed, start_timeout)
+            error = self.failed
+            if not error and self._ready_workers < self.num_workers:
+                error = "timed out waiting for embedding workers"
+        if error:
+            self.close()
+            raise RuntimeError(f"Embedding worker pool for {model_name} failed to start: {error}")
+
+        logger.info(
+            f"Started {self.num_workers} embedding workers for {model_name} "
+            f"with {self.threads_per_worker} threads each"
+        )
+
+    def _spawn(self, worker_id: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.model_name, self.threads_per_worker, worker_id, self._tasks, self._results),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _collect(self):
+        """Route worker replies to waiting encode calls and replace dead workers."""
+        next_check = time.monotonic() + self.health_check_interval
+        while not self._closing:
+            # Checked on a timer, not only when idle, so sustained traffic cannot starve it
+            if time.monotonic() >= next_check:
+                self._replace_dead_workers()
+                next_check = time.monotonic() + self.health_check_interval
+            try:
+                kind, task_id, worker_id, value, error = self._results.get(timeout=self.health_check_interval)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                with self._lock:
+                    if not self._closing:
+                        self._fail("result queue closed")
+                break
+
+            with self._lock:
+                if kind == "ready":
+                    if error:
+                        # A model that cannot load will not load on a respawn either
+                        self._fail(f"worker could not load {self.model_name}: {error}")
+                    else:
+                        self.dimension = value
+                        self._ready_workers += 1
+                    self._lock.notify_all()
+                elif kind == "claim":
+                    self._claims[worker_id] = task_id
+                else:
+                    if self._claims.get(worker_id) == task_id:
+                        del self._claims[worker_id]
+                    self._reply(task_id, error)
+
+    def _reply(self, task_id: int, error: Optional[str]):
+        """Hand a task result to its encode call; replies to abandoned calls are dropped."""
+        waiter = self._waiters.pop(task_id, None)
+        if waiter is not None:
+            waiter.put(error)
+
+    def _fail(self, reason: str):
+        """Stop accepting work and fail every task still in flight. Caller holds the lock."""
+        if self.failed is None:
+            self.failed = reason
+            logger.error(f"Embedding worker pool failed: {reason}")
+        for task_id in list(self._waiters):
+            self._reply(task_id, f"embedding worker pool failed: {reason}")
+
+    def _replace_dead_workers(self):
+        with self._lock:
+            if self._closing or self.failed:
+                return
+            for worker_id, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                reason = f"worker {process.pid} exited with code {process.exitcode}"
+                task_id = self._claims.pop(worker_id, None)
+                if task_id is not None:
+                    self._reply(task_id, reason)
+                # The worker may have dequeued a batch whose claim never arrived, and
+                # which batch cannot be told; fail every batch no live worker holds
+                claimed = {
+                    self._claims[other] for other, worker in enumerate(self._processes)
+                    if other in self._claims and worker.is_alive()
+                }
+                for pending in list(self._waiters):
+                    if pending not in claimed:
+                        self._reply(pending, f"{reason} before its batch could be accounted for")
+                if self.restarts >= self.max_restarts:
+                    self._fail(f"{self.restarts} workers restarted and worker {process.pid} exited again")
+                    return
+                self.restarts += 1
+                self._ready_workers -= 1
+                logger.warning(f"Embedding worker {process.pid} exited with code {process.exitcode}; restarting it")
+                self._processes[worker_id] = self._spawn(worker_id)
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        batches: Optional[List[np.ndarray]] = None,
+        batch_size: int = 64
+    ) -> np.ndarray:
+        """
+        Encode texts across the workers; safe to call from several threads at once.
+
+        Args:
+            texts: Texts to encode
+            batches: Optional index arrays grouping texts into batches, e.g. from
+                plan_token_batches; defaults to consecutive runs of batch_size
+            batch_size: Batch size when no batches are given
+
+        Returns:
+            Float32 embedding matrix in the order of ``texts``
+
+        Raises:
+            RuntimeError: If a batch fails, its worker dies or the pool has failed
+        """
+        if not len(texts):
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        if batches is None:
+            batches = [np.arange(start, min(start + batch_size, len(texts))) for start in range(0, len(texts), batch_size)]
+
+        shm = shared_memory.SharedMemory(create=True, size=len(texts) * self.dimension * 4)
+        buffer = None
+        waiter: queue.Queue = queue.Queue()
+        task_ids: List[int] = []
+        try:
+            buffer = np.ndarray((len(texts), self.dimension), dtype=np.float32, buffer=shm.buf)
+
+            # Registered under the lock so a pool failure cannot miss these tasks
+            with self._lock:
+                if self.failed:
+                    raise RuntimeError(f"Embedding worker pool failed: {self.failed}")
+                task_ids = list(range(self._next_task_id, self._next_task_id + len(batches)))
+                self._next_task_id += len(batches)
+                for task_id in task_ids:
+                    self._waiters[task_id] = waiter
+
+            # Rows are written in batch order and scattered back afterwards
+            offset = 0
+            for task_id, batch in zip(task_ids, batches):
+                self._tasks.put((task_id, shm.name, offset, self.dimension, [texts[i] for i in batch]))
+                offset += len(batch)
+
+            errors = []
+            remaining = len(task_ids)
+            while remaining:
+                try:
+                    error = waiter.get(timeout=self.health_check_interval)
+                except queue.Empty:
+                    # A reply lost with a dead worker would otherwise leave this call waiting forever
+                    self._check_health()
+                    continue
+                remaining -= 1
+                if error:
+                    errors.append(error)
+            if errors:
+                raise RuntimeError(f"{len(errors)} embedding batches failed: {errors[0]}")
+
+            embeddings = np.empty_like(buffer)
+            embeddings[np.concatenate(batches)] = buffer
+        finally:
+            with self._lock:
+                for task_id in task_ids:
+                    self._waiters.pop(task_id, None)
+            # The view must be released before the segment can be closed
+            buffer = None
+            shm.close()
+            shm.unlink()
+
+        with self._lock:
+            self.encoded_texts += len(texts)
+        return embeddings
+
+    def _check_health(self):
+        """Fail the pool if its collector stopped, else replace dead workers."""
+        if not self._collector.is_alive():
+            with self._lock:
+                self._fail("result collector stopped")
+            return
+        self._replace_dead_workers()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics."""
+        return {
+            "model_name": self.model_name,
+            "num_workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "alive_workers": sum(process.is_alive() for process in self._processes),
+            "restarts": self.restarts,
+            "failed": self.failed,
+            "encoded_texts": self.encoded_texts
+        }
+
+    def close(self, timeout: float = 10.0):
+        """Stop the workers; later encode calls raise."""
+        with self._lock:
+            self._closing = True
+            self.failed = self.failed or "pool closed"
+            for task_id in list(self._waiters):
+                self._reply(task_id, "embedding worker pool closed")
+        for process in self._processes:
+            if process.is_alive():
+                self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        if self._collector.is_alive() and self._collector is not threading.current_thread():
+            self._collector.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
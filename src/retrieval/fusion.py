@@ -0,0 +1,144 @@
+"""
+Rank fusion for combining result lists from several retrievers.
+
+Results are keyed by stable chunk IDs rather than by their text.  IDs are
+interned to dense integers once per call and all scoring runs over integer
+and float arrays, so fusing never hashes document contents and identical
+text from different sources stays distinct.
+"""
+
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence, Hashable
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ("rrf", "weighted", "comb_sum")
+NORMALIZATIONS = ("minmax", "zscore", None)
+
+
+@dataclass
+class FusedRanking:
+    """Fused ranking over the union of the input lists."""
+    ids: List[Hashable]
+    scores: np.ndarray
+    # positions[i, j] is the rank of ids[i] in input list j, or -1 if absent
+    positions: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class ResultFusion:
+    """Fuse ranked result lists with RRF, normalized weighted fusion or CombSUM."""
+
+    def __init__(
+        self,
+        method: str = "rrf",
+        k: float = 60.0,
+        normalization: Optional[str] = "minmax"
+    ):
+        """
+        Initialize the fusion engine.
+
+        Args:
+            method: 'rrf' (reciprocal rank fusion), 'weighted' (weighted sum of
+                normalized scores) or 'comb_sum' (unweighted sum of normalized scores)
+            k: RRF constant; each list contributes weight / (k + rank) with 1-based ranks
+            normalization: Score normalization for 'weighted' and 'comb_sum':
+                'minmax', 'zscore' or None for raw scores
+        """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion method: {method}")
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unsupported score normalization: {normalization}")
+        self.method = method
+        self.k = k
+        self.normalization = normalization
+
+    def fuse(
+        self,
+        ranked_ids: Sequence[Sequence[Hashable]],
+        scores: Optional[Sequence[Sequence[float]]] = None,
+        weights: Optional[Sequence[float]] = None
+    ) -> FusedRanking:
+        """
+        Fuse several ranked lists of IDs.
+
+        Args:
+            ranked_ids: One list of IDs per retriever, best first.  Repeated IDs
+                within a list only count at their best rank.
+            scores: Per-list scores aligned with ``ranked_ids`` (higher is
+                better); required for 'weighted' and 'comb_sum'
+            weights: Per-list weights; defaults to 1 for every list
+
+        Returns:
+            FusedRanking sorted by descending fused score, ties broken by first
+            appearance
+        """
+        num_lists = len(ranked_ids)
+        if weights is None:
+            weights = [1.0] * num_lists
+        if len(weights) != num_lists:
+            raise ValueError("weights must have one entry per ranked list")
+        if self.method != "rrf" and scores is None:
+            raise ValueError(f"Fusion method '{self.method}' requires scores")
+
+        # Intern IDs to dense integers in order of first appearance
+        interned: Dict[Hashable, int] = {}
+        id_arrays = []
+        for ids in ranked_ids:
+            id_arrays.append(np.fromiter(
+                (interned.setdefault(doc_id, len(interned)) for doc_id in ids),
+                dtype=np.int64,
+                count=len(ids)
+            ))
+        num_ids = len(interned)
+
+        fused = np.zeros(num_ids, dtype=np.float64)
+        positions = np.full((num_ids, num_lists), -1, dtype=np.int64)
+
+        for j, id_array in enumerate(id_arrays):
+            if not len(id_array):
+                continue
+            # Keep only the best-ranked occurrence of each ID in this list
+            _, first = np.unique(id_array, return_index=True)
+            ranks = np.sort(first)
+            members = id_array[ranks]
+            positions[members, j] = ranks
+
+            if self.method == "rrf":
+                contributions = weights[j] / (self.k + ranks + 1.0)
+            else:
+                list_scores = np.asarray(scores[j], dtype=np.float64)[ranks]
+                contributions = self._normalize(list_scores)
+                if self.method == "weighted":
+                    contributions = contributions * weights[j]
+            fused += np.bincount(members, weights=contributions, minlength=num_ids)
+
+        order = np.lexsort((np.arange(num_ids), -fused))
+        all_ids = list(interned.keys())
+        return FusedRanking(
+            ids=[all_ids[i] for i in order],
+            scores=fused[order],
+            positions=positions[order]
+        )
+
+    def _normalize(self, scores: np.ndarray) -> np.ndarray:
+        """Normalize one list's scores."""
+        if self.normalization == "minmax":
+            spread = scores.max() - scores.min()
+            return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        if self.normalization == "zscore":
+            std = scores.std()
+            return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+        return scores
+
+    def get_config(self) -> Dict[str, Any]:
+        """Get the fusion configuration."""
+        return {
+            "method": self.method,
+            "k": self.k,
+            "normalization": self.normalization
+        }
@@ -2,53 +2,101 @@
 Hybrid search implementation combining vector search and BM25.
 """
 
+import time
+import threading
 import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import List, Dict, Any, Optional, Tuple
-from rank_bm25 import BM25Okapi
 import logging
 
+from .bm25_index import BM25Index
+from .fusion import ResultFusion
+
 logger = logging.getLogger(__name__)
 
 
 class BM25Retriever:
     """BM25-based text retrieval."""
     
-    def __init__(self, documents: List[str]):
-        """Initialize BM25 retriever with documents."""
-        self.documents = documents
-        self.tokenized_docs = [doc.split() for doc in documents]
-        self.bm25 = BM25Okapi(self.tokenized_docs)
+    def __init__(
+        self, 
+        documents: List[str], 
+        ids: Optional[List[str]] = None,
+        k1: float = 1.5, 
+        b: float = 0.75
+    ):
+        """
+        Initialize BM25 retriever with documents.
+        
+        Args:
+            documents: Documents to index
+            ids: Stable chunk IDs for the documents, normally the vector store IDs;
+                positional IDs are generated when omitted
+            k1: BM25 term frequency saturation parameter
+            b: BM25 document length normalization parameter
+        """
+        self.documents: List[str] = []
+        self.doc_ids: List[str] = []
+        self.index = BM25Index(k1=k1, b=b)
+        self.add_documents(documents, ids)
         logger.info(f"BM25 retriever initialized with {len(documents)} documents")
     
+    def _tokenize(self, text: str) -> List[str]:
+        """Tokenize text for BM25."""
+        return text.split()
+    
     def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
         """Search for relevant documents using BM25."""
         try:
-            tokenized_query = query.split()
-            scores = self.bm25.get_scores(tokenized_query)
-            
-            # Get top k results
-            top_indices = np.argsort(scores)[::-1][:k]
-            
-            results = []
-            for idx in top_indices:
-                if scores[idx] > 0:  # Only include documents with positive scores
-                    results.append({
-                        "document": self.documents[idx],
-                        "score": float(scores[idx]),
-                        "index": int(idx)
-                    })
-            
-            return results
+            tokenized_query = self._tokenize(query)
+            top_indices, top_scores = self.index.top_k(tokenized_query, k=k)
+            return self._format_results(top_indices, top_scores)
         except Exception as e:
             logger.error(f"Error in BM25 search: {e}")
             return []
     
-    def add_documents(self, documents: List[str]):
+    def batch_search(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search for several queries at once, scoring them as one sparse matrix product."""
+        try:
+            tokenized_queries = [self._tokenize(query) for query in queries]
+            batch_top_k = self.index.batch_top_k(tokenized_queries, k=k)
+            return [
+                self._format_results(top_indices, top_scores)
+                for top_indices, top_scores in batch_top_k
+            ]
+        except Exception as e:
+            logger.error(f"Error in BM25 batch search: {e}")
+            return [[] for _ in queries]
+    
+    def _format_results(self, top_indices: np.ndarray, top_scores: np.ndarray) -> List[Dict[str, Any]]:
+        """Format top-k positions and scores as search results."""
+        results = []
+        for idx, score in zip(top_indices, top_scores):
+            results.append({
+                "document": self.documents[idx],
+                "score": float(score),
+                "index": int(idx),
+                "id": self.doc_ids[idx]
+            })
+        return results
+    
+    def add_documents(self, documents: List[str], ids: Optional[List[str]] = None):
         """Add new documents to the BM25 index."""
+        if ids is None:
+            ids = [f"bm25-{position}" for position in range(len(self.documents), len(self.documents) + len(documents))]
+        elif len(ids) != len(documents):
+            raise ValueError("ids must have one entry per document")
+        
         self.documents.extend(documents)
-        self.tokenized_docs.extend([doc.split() for doc in documents])
-        self.bm25 = BM25Okapi(self.tokenized_docs)
+        self.doc_ids.extend(ids)
+        self.index.add(self._tokenize(doc) for doc in documents)
         logger.info(f"Added {len(documents)} documents to BM25 index")
+    
+    def delete_documents(self, indices: List[int]) -> int:
+        """Remove documents from the BM25 index by position."""
+        deleted = self.index.delete(indices)
+        logger.info(f"Deleted {deleted} documents from BM25 index")
+        return deleted
 
 
 class HybridRetriever:
@@ -59,7 +107,15 @@ class HybridRetriever:
         vector_store,
         documents: List[str],
         alpha: float = 0.7,
-        bm25_weight: float = 0.3
+        bm25_weight: float = 0.3,
+        document_ids: Optional[List[str]] = None,
+        fusion_method: str = "rrf",
+        rrf_k: float = 0.0,
+        score_normalization: Optional[str] = "minmax",
+        concurrent_search: bool = False,
+        vector_timeout: Optional[float] = None,
+        bm25_timeout: Optional[float] = None,
+        max_search_workers: int = 8
     ):
         """
         Initialize hybrid retriever.
@@ -69,12 +125,40 @@ class HybridRetriever:
             documents: List of documents for BM25
             alpha: Weight for vector search (0-1)
             bm25_weight: Weight for BM25 search (0-1)
+            document_ids: Chunk IDs for ``documents``, matching the vector store IDs
+                so both legs fuse on the same key
+            fusion_method: 'rrf', 'weighted' or 'comb_sum' (see ResultFusion)
+            rrf_k: RRF constant; 0 keeps the original 1/rank weighting, 60 is the
+                common choice in the literature
+            score_normalization: Score normalization for 'weighted' and 'comb_sum'
+            concurrent_search: Run the vector and BM25 legs in parallel threads
+            vector_timeout: Deadline in seconds for the vector leg in concurrent mode
+            bm25_timeout: Deadline in seconds for the BM25 leg in concurrent mode
+            max_search_workers: Threads running search legs in concurrent mode;
+                a leg that hangs past its deadline keeps its thread until it returns
         """
         self.vector_store = vector_store
-        self.bm25_retriever = BM25Retriever(documents)
+        self.bm25_retriever = BM25Retriever(documents, ids=document_ids)
+        self.fusion = ResultFusion(
+            method=fusion_method,
+            k=rrf_k,
+            normalization=score_normalization
+        )
         self.alpha = alpha
         self.bm25_weight = bm25_weight
         self.documents = documents
+        self.concurrent_search = concurrent_search
+        self.vector_timeout = vector_timeout
+        self.bm25_timeout = bm25_timeout
+        self.max_search_workers = max_search_workers
+        # Threads are only started once legs are submitted
+        self._executor = ThreadPoolExecutor(max_workers=max_search_workers, thread_name_prefix="hybrid-search")
+        self.leg_timeouts = {"vector": 0, "bm25": 0}
+        # Legs still running after their deadline, holding a worker thread
+        self.abandoned_legs = {"vector": 0, "bm25": 0}
+        self._stats_lock = threading.Lock()
+        # Bumped on every corpus change so answer caches can be invalidated
+        self.corpus_version = 0
         
         # Ensure weights sum to 1
         total_weight = alpha + bm25_weight
@@ -93,15 +177,20 @@ class HybridRetriever:
     ) -> List[Dict[str, Any]]:
         """Perform hybrid search combining vector and BM25 results."""
         try:
-            # Vector search
-            vector_results = self.vector_store.search(
-                query_embedding=query_embedding,
-                n_results=k * 2,  # Get more results for fusion
-                filter_metadata=filter_metadata
-            )
-            
-            # BM25 search
-            bm25_results = self.bm25_retriever.search(query, k=k * 2)
+            if self.concurrent_search:
+                vector_results, bm25_results = self._run_legs_concurrently(
+                    query, query_embedding, k * 2, filter_metadata
+                )
+            else:
+                # Vector search
+                vector_results = self.vector_store.search(
+                    query_embedding=query_embedding,
+                    n_results=k * 2,  # Get more results for fusion
+                    filter_metadata=filter_metadata
+                )
+                
+                # BM25 search
+                bm25_results = self.bm25_retriever.search(query, k=k * 2)
             
             # Fuse results
             fused_results = self._fuse_results(
@@ -126,69 +215,149 @@ class HybridRetriever:
                 logger.error(f"Fallback vector search also failed: {fallback_error}")
                 return []
     
+    def _run_legs_concurrently(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        n_results: int,
+        filter_metadata: Optional[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Run the vector and BM25 legs at the same time.
+        
+        A leg that fails or misses its deadline contributes no results, so the
+        other leg's results are still fused.
+        """
+        executor = self._executor
+        start = time.monotonic()
+        vector_future = executor.submit(
+            self.vector_store.search,
+            query_embedding=query_embedding,
+            n_results=n_results,
+            filter_metadata=filter_metadata
+        )
+        bm25_future = executor.submit(self.bm25_retriever.search, query, k=n_results)
+        
+        vector_results = self._await_leg("vector", vector_future, self.vector_timeout, start, {})
+        bm25_results = self._await_leg("bm25", bm25_future, self.bm25_timeout, start, [])
+        
+        return vector_results, bm25_results
+    
+    def _await_leg(
+        self,
+        leg: str,
+        future: Future,
+        timeout: Optional[float],
+        start: float,
+        default: Any
+    ) -> Any:
+        """Wait for a search leg until its deadline, measured from when both legs started."""
+        remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            # A leg still queued is dropped; a running one cannot be stopped and holds its thread
+            abandoned = not future.cancel()
+            with self._stats_lock:
+                self.leg_timeouts[leg] += 1
+                if abandoned:
+                    self.abandoned_legs[leg] += 1
+            logger.warning(f"{leg} search leg missed its {timeout}s deadline; fusing without it")
+        except Exception as e:
+            logger.error(f"Error in {leg} search leg: {e}")
+        return default
+    
+    def batch_hybrid_search(
+        self,
+        queries: List[str],
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Perform hybrid search for a batch of queries.
+        
+        All query embeddings go to the vector store in one call and BM25 scores
+        the whole batch with one sparse matrix product; results are then fused
+        per query.
+        
+        Args:
+            queries: Query texts
+            query_embeddings: One embedding per query
+            k: Number of results per query
+            filter_metadata: Optional metadata filter applied to every query
+            
+        Returns:
+            One list of fused results per query, in input order
+        """
+        if len(queries) != len(query_embeddings):
+            raise ValueError("queries and query_embeddings must have the same length")
+        if not queries:
+            return []
+        
+        try:
+            vector_results = self.vector_store.batch_search(
+                query_embeddings=query_embeddings,
+                n_results=k * 2,  # Get more results for fusion
+                filter_metadata=filter_metadata
+            )
+            
+            bm25_results = self.bm25_retriever.batch_search(queries, k=k * 2)
+            
+            return [
+                self._fuse_results(query_vector_results, query_bm25_results, query)[:k]
+                for query, query_vector_results, query_bm25_results
+                in zip(queries, vector_results, bm25_results)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error in batch hybrid search: {e}")
+            # Fall back to searching queries one at a time
+            return [
+                self.hybrid_search(query, query_embedding, k, filter_metadata)
+                for query, query_embedding in zip(queries, query_embeddings)
+            ]
+    
     def _fuse_results(
         self, 
         vector_results: Dict[str, Any], 
         bm25_results: List[Dict[str, Any]], 
         query: str
     ) -> List[Dict[str, Any]]:
-        """Fuse vector and BM25 results using reciprocal rank fusion."""
-        # Create document ID to index mapping for BM25
-        doc_to_bm25_idx = {doc["document"]: idx for idx, doc in enumerate(bm25_results)}
-        
-        # Create document ID to index mapping for vector results
-        doc_to_vector_idx = {}
-        for idx, doc in enumerate(vector_results.get("documents", [])):
-            if doc not in doc_to_vector_idx:
-                doc_to_vector_idx[doc] = idx
+        """Fuse vector and BM25 results by chunk ID."""
+        vector_ids = vector_results.get("ids", [])
+        bm25_ids = [result["id"] for result in bm25_results]
         
-        # Calculate fusion scores
-        fusion_scores = {}
-        
-        # Score vector results
-        for idx, doc in enumerate(vector_results.get("documents", [])):
-            if doc in fusion_scores:
-                # Use the better score if document appears multiple times
-                current_score = fusion_scores[doc]
-                vector_score = self.alpha * (1 / (idx + 1))
-                fusion_scores[doc] = max(current_score, vector_score)
-            else:
-                fusion_scores[doc] = self.alpha * (1 / (idx + 1))
-        
-        # Score BM25 results
-        for idx, bm25_result in enumerate(bm25_results):
-            doc = bm25_result["document"]
-            bm25_score = self.bm25_weight * (1 / (idx + 1))
-            
-            if doc in fusion_scores:
-                fusion_scores[doc] += bm25_score
-            else:
-                fusion_scores[doc] = bm25_score
-        
-        # Sort by fusion score
-        sorted_docs = sorted(fusion_scores.items(), key=lambda x: x[1], reverse=True)
+        fused = self.fusion.fuse(
+            [vector_ids, bm25_ids],
+            scores=[
+                [1.0 - distance for distance in vector_results.get("distances", [])],
+                [result["score"] for result in bm25_results]
+            ],
+            weights=[self.alpha, self.bm25_weight]
+        )
         
         # Format results
         fused_results = []
-        for doc, score in sorted_docs:
+        for doc_id, score, (vector_idx, bm25_idx) in zip(fused.ids, fused.scores, fused.positions):
             result = {
-                "document": doc,
-                "fusion_score": score,
+                "id": doc_id,
+                "fusion_score": float(score),
                 "source": "hybrid"
             }
             
             # Add vector search metadata if available
-            if doc in doc_to_vector_idx:
-                vector_idx = doc_to_vector_idx[doc]
+            if vector_idx >= 0:
                 result.update({
+                    "document": vector_results.get("documents", [])[vector_idx],
                     "vector_score": vector_results.get("distances", [])[vector_idx],
                     "vector_metadata": vector_results.get("metadatas", [])[vector_idx],
-                    "vector_id": vector_results.get("ids", [])[vector_idx]
+                    "vector_id": doc_id
                 })
             
             # Add BM25 metadata if available
-            if doc in doc_to_bm25_idx:
-                bm25_idx = doc_to_bm25_idx[doc]
+            if bm25_idx >= 0:
+                result.setdefault("document", bm25_results[bm25_idx]["document"])
                 result.update({
                     "bm25_score": bm25_results[bm25_idx]["score"],
                     "bm25_index": bm25_results[bm25_idx]["index"]
@@ -211,18 +380,32 @@ class HybridRetriever:
             })
         return results
     
-    def update_documents(self, new_documents: List[str]):
+    def update_documents(self, new_documents: List[str], ids: Optional[List[str]] = None):
         """Update the document collection."""
         self.documents.extend(new_documents)
-        self.bm25_retriever.add_documents(new_documents)
+        self.bm25_retriever.add_documents(new_documents, ids=ids)
+        self.corpus_version += 1
         logger.info(f"Updated documents. Total: {len(self.documents)}")
     
+    def close(self):
+        """Stop the search-leg threads; queued legs are cancelled, running ones finish in the background."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get retriever statistics."""
+        with self._stats_lock:
+            leg_timeouts = dict(self.leg_timeouts)
+            abandoned_legs = dict(self.abandoned_legs)
         return {
             "total_documents": len(self.documents),
             "alpha": self.alpha,
             "bm25_weight": self.bm25_weight,
+            "fusion": self.fusion.get_config(),
+            "bm25_index": self.bm25_retriever.index.get_stats(),
+            "concurrent_search": self.concurrent_search,
+            "leg_timeouts": leg_timeouts,
+            "abandoned_legs": abandoned_legs,
+            "corpus_version": self.corpus_version,
             "vector_store_type": self.vector_store.vector_db_type
         }
 
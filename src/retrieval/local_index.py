@@ -0,0 +1,452 @@
+"""
+In-process approximate nearest neighbour index backed by FAISS.
+
+Vectors are L2-normalized and searched by inner product, so distances match
+the cosine distances returned by the Chroma backend.  Deletes are tombstones
+that are masked out at search time and reclaimed by rebuilding the index once
+they exceed a fraction of the stored vectors.  The index and a JSON sidecar
+holding IDs, documents and metadata are written as a versioned pair and made
+current by atomically replacing a small manifest, so a crash never leaves a
+mismatched pair.  Writes are persisted every few operations or seconds rather
+than on each call, and always on save() or close().
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+
+from .metadata_index import MetadataIndex
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+    logging.warning("faiss not available. Install with: pip install faiss-cpu")
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("hnsw", "flat")
+
+
+class FaissIndex:
+    """In-process vector index with add/search/delete, metadata filters and persistence."""
+
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        collection_name: str = "documents",
+        index_type: str = "hnsw",
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        compaction_threshold: float = 0.2,
+        exact_search_threshold: int = 2048,
+        autosave_every: int = 100,
+        autosave_interval: Optional[float] = 60.0
+    ):
+        """
+        Initialize the index, loading it from disk if a saved copy exists.
+
+        Args:
+            persist_directory: Directory for the index files; None keeps it in memory
+            collection_name: Base name of the index files
+            index_type: 'hnsw' for a graph index or 'flat' for exact search
+            hnsw_m: Graph neighbours per node for HNSW
+            ef_construction: HNSW build-time beam width
+            ef_search: HNSW query-time beam width (raised to n_results when smaller)
+            compaction_threshold: Fraction of tombstoned vectors that triggers a rebuild
+            exact_search_threshold: Filtered searches matching at most this many
+                vectors are scored exactly instead of through the graph
+            autosave_every: Adds/deletes after which the index is saved; 0 saves
+                only on save() or close()
+            autosave_interval: Seconds after which the next add/delete saves
+                the index; None disables the time trigger
+        """
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss is required for the faiss vector store backend")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index_type}")
+
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.compaction_threshold = compaction_threshold
+        self.exact_search_threshold = exact_search_threshold
+        self.autosave_every = autosave_every
+        self.autosave_interval = autosave_interval
+
+        self.dimension: Optional[int] = None
+        self._index = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_position: Dict[str, int] = {}
+        # Live flags grow geometrically; _live is a view of the first _num_stored
+        self._live_buffer = np.zeros(0, dtype=bool)
+        self._num_stored = 0
+        self._metadata_index = MetadataIndex()
+        self._lock = threading.RLock()
+
+        self._version = 0
+        self._pending_writes = 0
+        self._last_save = time.monotonic()
+
+        if persist_directory and os.path.exists(self._manifest_path):
+            self.load()
+
+    @property
+    def _live(self) -> np.ndarray:
+        return self._live_buffer[:self._num_stored]
+
+    def _reset_live(self, live: np.ndarray):
+        self._live_buffer = np.array(live, dtype=bool)
+        self._num_stored = len(self._live_buffer)
+
+    def _append_live(self, count: int):
+        """Mark ``count`` new rows live, doubling the buffer when it is full."""
+        needed = self._num_stored + count
+        if needed > len(self._live_buffer):
+            grown = np.zeros(max(needed, 2 * len(self._live_buffer), 1024), dtype=bool)
+            grown[:self._num_stored] = self._live
+            self._live_buffer = grown
+        self._live_buffer[self._num_stored:needed] = True
+        self._num_stored = needed
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.manifest.json")
+
+    def _index_path(self, version: int) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.{version}.faiss")
+
+    def _sidecar_path(self, version: int) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.{version}.json")
+
+    def _create_index(self, dimension: int):
+        """Create an empty FAISS index of the configured type."""
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+            return index
+        return faiss.IndexFlatIP(dimension)
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        """Convert to a contiguous float32 matrix of unit-length rows."""
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+        return np.ascontiguousarray(vectors)
+
+    def add(
+        self,
+        documents: List[str],
+        embeddings,
+        metadatas: List[Dict[str, Any]],
+        ids: List[str]
+    ) -> List[str]:
+        """
+        Add documents; an existing ID is replaced by the new entry.
+
+        Args:
+            documents: Document texts
+            embeddings: One embedding per document
+            metadatas: One metadata dict per document
+            ids: One ID per document; if an ID repeats, its last entry wins
+
+        Returns:
+            The IDs that were added
+        """
+        vectors = self._normalize(embeddings)
+        if len(vectors) != len(documents):
+            raise ValueError("documents and embeddings must have the same length")
+
+        # Rows for an ID repeated within the batch would stay live next to the one it maps to
+        last = {doc_id: offset for offset, doc_id in enumerate(ids)}
+        if len(last) != len(ids):
+            keep = sorted(last.values())
+            vectors = np.ascontiguousarray(vectors[keep])
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            ids = [ids[i] for i in keep]
+
+        with self._lock:
+            if self._index is None:
+                self.dimension = vectors.shape[1]
+                self._index = self._create_index(self.dimension)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dimension}"
+                )
+
+            replaced = [self._id_to_position[doc_id] for doc_id in ids if doc_id in self._id_to_position]
+            if replaced:
+                self._live[replaced] = False
+                self._metadata_index.remove(replaced)
+
+            start = len(self._ids)
+            self._index.add(vectors)
+            self._ids.extend(ids)
+            self._documents.extend(documents)
+            self._metadatas.extend(metadatas)
+            for offset, doc_id in enumerate(ids):
+                self._id_to_position[doc_id] = start + offset
+            self._append_live(len(ids))
+            self._metadata_index.add(range(start, start + len(ids)), metadatas)
+
+            self._maybe_compact()
+            self._autosave()
+
+        return ids
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Delete documents by ID.
+
+        Args:
+            ids: IDs to delete; unknown IDs are ignored
+
+        Returns:
+            Number of documents deleted
+        """
+        with self._lock:
+            positions = [self._id_to_position.pop(doc_id) for doc_id in ids if doc_id in self._id_to_position]
+            if not positions:
+                return 0
+            self._live[positions] = False
+            self._metadata_index.remove(positions)
+            self._maybe_compact()
+            self._autosave()
+            return len(positions)
+
+    def search(
+        self,
+        query_embedding,
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Search for the nearest documents to one query embedding."""
+        return self.batch_search([query_embedding], n_results, filter_metadata)[0]
+
+    def batch_search(
+        self,
+        query_embeddings,
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for the nearest documents to several query embeddings.
+
+        Args:
+            query_embeddings: Query embeddings, one per row
+            n_results: Number of results per query
+            filter_metadata: Chroma-style where filter, resolved through the
+                metadata bitmap index before the vector search
+
+        Returns:
+            One Chroma-style result dict (documents, metadatas, distances, ids) per query
+        """
+        queries = self._normalize(query_embeddings)
+
+        with self._lock:
+            if self._index is None or not self._live.any():
+                return [self._empty_result() for _ in range(len(queries))]
+
+            allowed = self._live
+            if filter_metadata:
+                allowed = allowed & self._filter_mask(filter_metadata)
+            num_allowed = int(allowed.sum())
+            k = min(n_results, num_allowed)
+            if k == 0:
+                return [self._empty_result() for _ in range(len(queries))]
+
+            if num_allowed == len(allowed):
+                scores, positions = self._index.search(queries, k, params=self._search_params(k))
+            elif num_allowed <= self.exact_search_threshold:
+                scores, positions = self._exact_search(queries, np.flatnonzero(allowed), k)
+            else:
+                bitmap = np.packbits(allowed, bitorder="little")
+                selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+                scores, positions = self._index.search(queries, k, params=self._search_params(k, selector))
+
+            return [self._format_result(row_scores, row_positions)
+                    for row_scores, row_positions in zip(scores, positions)]
+
+    def _search_params(self, k: int, selector=None):
+        """Build per-query search parameters."""
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.ef_search, k))
+        return faiss.SearchParameters(sel=selector)
+
+    def _exact_search(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        """Score a small candidate set exactly against the stored vectors."""
+        vectors = self._index.reconstruct_batch(candidates.astype(np.int64))
+        similarities = queries @ vectors.T
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top_scores, order, axis=1), candidates[np.take_along_axis(top, order, axis=1)]
+
+    def _filter_mask(self, filter_metadata: Dict[str, Any]) -> np.ndarray:
+        """Mark stored documents whose metadata matches the filter."""
+        return self._metadata_index.mask(filter_metadata)
+
+    def _format_result(self, scores: np.ndarray, positions: np.ndarray) -> Dict[str, Any]:
+        """Convert FAISS output into the Chroma-style result dict."""
+        result = self._empty_result()
+        for score, position in zip(scores, positions):
+            # Graph search pads with -1 when it finds fewer than k neighbours
+            if position < 0:
+                continue
+            result["documents"].append(self._documents[position])
+            result["metadatas"].append(self._metadatas[position])
+            result["distances"].append(float(1.0 - score))
+            result["ids"].append(self._ids[position])
+        return result
+
+    @staticmethod
+    def _empty_result() -> Dict[str, Any]:
+        return {"documents": [], "metadatas": [], "distances": [], "ids": []}
+
+    def _maybe_compact(self):
+        """Rebuild the index once tombstones exceed the compaction threshold."""
+        num_dead = len(self._live) - int(self._live.sum())
+        if num_dead and num_dead > self.compaction_threshold * len(self._live):
+            self.compact()
+
+    def compact(self):
+        """Rebuild the index without tombstoned vectors."""
+        with self._lock:
+            if self._index is None:
+                return
+            keep = np.flatnonzero(self._live)
+            vectors = self._index.reconstruct_batch(keep.astype(np.int64)) if len(keep) else None
+
+            self._index = self._create_index(self.dimension)
+            if vectors is not None:
+                self._index.add(vectors)
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._id_to_position = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._reset_live(np.ones(len(keep), dtype=bool))
+            self._metadata_index.clear()
+            self._metadata_index.add(range(len(keep)), self._metadatas)
+            logger.info(f"Compacted FAISS index to {len(keep)} vectors")
+
+    def _autosave(self):
+        """Save once enough writes or time have accumulated since the last save."""
+        if not self.persist_directory:
+            return
+        self._pending_writes += 1
+        due = self.autosave_every and self._pending_writes >= self.autosave_every
+        if self.autosave_interval is not None:
+            due = due or time.monotonic() - self._last_save >= self.autosave_interval
+        if due:
+            self.save()
+
+    def flush(self):
+        """Save writes made since the last save, if any."""
+        if self.persist_directory and self._pending_writes:
+            self.save()
+
+    def close(self):
+        """Persist outstanding writes."""
+        self.flush()
+
+    def save(self):
+        """Write the index and its sidecar to the persist directory."""
+        if not self.persist_directory:
+            raise ValueError("No persist directory configured")
+
+        with self._lock:
+            self._pending_writes = 0
+            self._last_save = time.monotonic()
+            if self._index is None:
+                return
+            os.makedirs(self.persist_directory, exist_ok=True)
+
+            # The pair is written under a new version and only becomes current
+            # when the manifest is replaced, so a crash leaves the old pair intact
+            version = self._version + 1
+            faiss.write_index(self._index, self._index_path(version))
+            sidecar = {
+                "dimension": self.dimension,
+                "index_type": self.index_type,
+                "ids": self._ids,
+                "documents": self._documents,
+                "metadatas": self._metadatas,
+                "deleted": np.flatnonzero(~self._live).tolist()
+            }
+            with open(self._sidecar_path(version), "w", encoding="utf-8") as f:
+                json.dump(sidecar, f)
+
+            with open(self._manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"version": version}, f)
+            os.replace(self._manifest_path + ".tmp", self._manifest_path)
+            self._version = version
+            self._remove_stale_versions()
+
+    def _remove_stale_versions(self):
+        """Delete index files from versions other than the current one."""
+        pattern = re.compile(rf"{re.escape(self.collection_name)}\.(\d+)\.(faiss|json)")
+        for name in os.listdir(self.persist_directory):
+            match = pattern.fullmatch(name)
+            if match and int(match.group(1)) != self._version:
+                try:
+                    os.remove(os.path.join(self.persist_directory, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove stale index file {name}: {e}")
+
+    def load(self):
+        """Load the index and its sidecar from the persist directory."""
+        with self._lock:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                version = json.load(f)["version"]
+            with open(self._sidecar_path(version), "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+
+            self._index = faiss.read_index(self._index_path(version))
+            self._version = version
+            self.dimension = sidecar["dimension"]
+            self.index_type = sidecar["index_type"]
+            if self.index_type == "hnsw":
+                self._index.hnsw.efSearch = self.ef_search
+            self._ids = sidecar["ids"]
+            self._documents = sidecar["documents"]
+            self._metadatas = sidecar["metadatas"]
+            self._reset_live(np.ones(len(self._ids), dtype=bool))
+            self._live[sidecar["deleted"]] = False
+            self._metadata_index.clear()
+            self._metadata_index.add(range(len(self._ids)), self._metadatas)
+            self._metadata_index.remove(sidecar["deleted"])
+            self._id_to_position = {
+                doc_id: i for i, doc_id in enumerate(self._ids) if self._live[i]
+            }
+            logger.info(f"Loaded FAISS index with {self.count()} vectors from {self.persist_directory}")
+
+    def count(self) -> int:
+        """Number of live documents."""
+        return int(self._live.sum())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics."""
+        return {
+            "count": self.count(),
+            "stored_vectors": len(self._live),
+            "dimension": self.dimension,
+            "index_type": self.index_type,
+            "ef_search": self.ef_search,
+            "version": self._version,
+            "unsaved_writes": self._pending_writes
+        }
@@ -0,0 +1,898 @@
+"""
+Memory-mapped embedding store with exact blocked top-k search.
+
+Embeddings live in an append-only float32 or float16 file that every process
+maps read-only, so uvicorn workers share one copy through the OS page cache
+instead of each holding the matrix in RAM.  IDs, documents, metadata and
+tombstones live in a SQLite sidecar; writers serialize on a SQLite write
+transaction and bump a version counter that readers check, inside a snapshot
+read transaction, before every search.  Compaction writes a new generation
+of files and leaves the one it replaced on disk until the next compaction,
+for readers that still map it.
+
+With compression enabled, int8 or product-quantized codes are kept in a
+parallel file and scanned instead of the floats; only a shortlist of rows is
+then re-scored exactly from the float file.  The quantizer is trained, outside
+the write lock, once the store holds enough rows for a representative sample
+(searches are exact until then), and retrained on the live rows at every
+compaction.  Each
+training gets a new quantizer version with its own code file, recorded in
+the sidecar, so readers never pair codes with the wrong codebooks.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple
+import numpy as np
+import logging
+
+from .metadata_index import MetadataIndex
+from .quantization import QUANTIZERS, create_quantizer, save_quantizer, load_quantizer, recall_at_k
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+class _Snapshot(NamedTuple):
+    """Search state of one store version; _refresh replaces these objects and never mutates them."""
+    generation: int
+    num_rows: int
+    dimension: int
+    dtype: Any
+    matrix: Any
+    codes: Any
+    quantizer: Any
+    live: np.ndarray
+
+
+class MemmapVectorStore:
+    """Exact cosine search over a memory-mapped embedding matrix."""
+
+    def __init__(
+        self,
+        persist_directory: str,
+        collection_name: str = "documents",
+        dtype: str = "float32",
+        block_size: int = 65536,
+        compression: Optional[str] = None,
+        refine_factor: int = 4,
+        pq_subvectors: int = 16,
+        min_training_rows: int = 10000,
+        max_training_rows: int = 100000
+    ):
+        """
+        Open or create a memory-mapped store.
+
+        Args:
+            persist_directory: Directory holding the vector file and the SQLite sidecar
+            collection_name: Base name of the store files
+            dtype: Storage precision for new stores, 'float32' or 'float16';
+                an existing store keeps the precision it was created with
+            block_size: Rows scored per matrix multiply during search
+            compression: None, 'int8' or 'pq'; like dtype, only applies to a new store
+            refine_factor: With compression, re-score n_results * refine_factor
+                candidates exactly; 0 returns the code scores as they are
+            pq_subvectors: Bytes per code for product quantization
+            min_training_rows: With compression, rows stored before the
+                quantizer is trained on them; searches are exact until then
+            max_training_rows: Largest random sample of stored rows the
+                quantizer is trained on
+        """
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported storage dtype: {dtype}")
+        if compression is not None and compression not in QUANTIZERS:
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.block_size = block_size
+        self.refine_factor = refine_factor
+        self.pq_subvectors = pq_subvectors
+        self.min_training_rows = min_training_rows
+        self.max_training_rows = max_training_rows
+        os.makedirs(persist_directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(persist_directory, f"{collection_name}.sqlite"),
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS entries (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS entries_id ON entries (id);
+        """)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO store_meta (key, value) VALUES ('dtype', ?), ('generation', '0'), ('version', '0')",
+            (dtype,)
+        )
+        # Another handle opened without compression must not switch it off for the store
+        meta = self._read_meta()
+        if "compression" not in meta or (compression and "dimension" not in meta):
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('compression', ?)",
+                (compression or "",)
+            )
+            meta["compression"] = compression or ""
+        if compression == "pq" and "dimension" in meta:
+            self._check_dimension(meta, int(meta["dimension"]))
+
+        # Snapshot of the shared state, refreshed whenever the stored version changes
+        self._version = None
+        self._generation = None
+        self.dtype = None
+        self.dimension: Optional[int] = None
+        self._num_rows = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._matrix = None
+        self.compression: Optional[str] = None
+        self.quantizer = None
+        self._quantizer_version: Optional[int] = None
+        # Quantizers by version, shared by readers and writers; versions are never rewritten
+        self._quantizers: Dict[int, Any] = {}
+        self._codes = None
+        # Built on the first filtered search and extended as rows are appended
+        self._metadata_index: Optional[MetadataIndex] = None
+        self._indexed_generation = None
+        self._read_transaction()
+        self._conn.execute("COMMIT")
+
+    def _vector_path(self, generation: int) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.{generation}.vectors")
+
+    def _codes_path(self, generation: int, quantizer_version: int) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.{generation}.q{quantizer_version}.codes")
+
+    def _quantizer_path(self, quantizer_version: int) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.q{quantizer_version}.quantizer.npz")
+
+    @staticmethod
+    def _stored_quantizer_version(meta: Dict[str, str]) -> Optional[int]:
+        return int(meta["quantizer"]) if meta.get("quantizer") else None
+
+    def _load_quantizer(self, quantizer_version: int):
+        if quantizer_version not in self._quantizers:
+            self._quantizers = {quantizer_version: load_quantizer(self._quantizer_path(quantizer_version))}
+        return self._quantizers[quantizer_version]
+
+    def _read_meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM store_meta"))
+
+    def _check_dimension(self, meta: Dict[str, str], dimension: int):
+        """Fail before any row is stored if product quantization could never train on this dimension."""
+        if meta.get("compression") == "pq" and dimension % self.pq_subvectors:
+            raise ValueError(
+                f"Dimension {dimension} is not divisible by {self.pq_subvectors} PQ sub-vectors; "
+                f"choose pq_subvectors that divides it"
+            )
+
+    def _record_dimension(self, meta: Dict[str, str], dimension: int, label: str = "Embedding"):
+        """Record the store dimension on the first write, or check it against the recorded one."""
+        if "dimension" in meta:
+            if int(meta["dimension"]) != dimension:
+                raise ValueError(
+                    f"{label} dimension {dimension} does not match store dimension {meta['dimension']}"
+                )
+            return
+        self._check_dimension(meta, dimension)
+        meta["dimension"] = str(dimension)
+        self._conn.execute("INSERT INTO store_meta (key, value) VALUES ('dimension', ?)", (meta["dimension"],))
+
+    def _bump_version(self):
+        """Mark a write so other connections reload their snapshot."""
+        self._conn.execute("UPDATE store_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def _refresh(self):
+        """
+        Re-read the sidecar and remap the vector file if another writer changed it.
+
+        Must run inside a read transaction so the snapshot stays consistent with
+        the rows later fetched for the results.
+        """
+        version = self._conn.execute("SELECT value FROM store_meta WHERE key = 'version'").fetchone()[0]
+        if version == self._version:
+            return
+
+        meta = self._read_meta()
+        num_rows = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+        deleted = [row[0] for row in self._conn.execute("SELECT position FROM entries WHERE deleted = 1")]
+
+        generation = int(meta["generation"])
+        dtype = STORAGE_DTYPES[meta["dtype"]]
+        dimension = int(meta["dimension"]) if "dimension" in meta else None
+        quantizer_version = self._stored_quantizer_version(meta)
+        retrained = quantizer_version != self._quantizer_version
+        quantizer = self.quantizer
+        if retrained:
+            quantizer = self._load_quantizer(quantizer_version) if quantizer_version else None
+
+        # Map everything before touching the snapshot, so a missing file leaves it as it was
+        matrix, codes = self._matrix, self._codes
+        if num_rows == 0:
+            matrix = None
+            codes = None
+        elif generation != self._generation or num_rows != self._num_rows or matrix is None or retrained:
+            matrix = np.memmap(
+                self._vector_path(generation),
+                dtype=dtype,
+                mode="r",
+                shape=(num_rows, dimension)
+            )
+            codes = None
+            if quantizer is not None:
+                codes = np.memmap(
+                    self._codes_path(generation, quantizer_version),
+                    dtype=quantizer.code_dtype,
+                    mode="r",
+                    shape=(num_rows, quantizer.code_size)
+                )
+
+        self.dtype = dtype
+        self.dimension = dimension
+        self.compression = meta.get("compression") or None
+        self.quantizer = quantizer
+        self._quantizer_version = quantizer_version
+        self._matrix = matrix
+        self._codes = codes
+        self._live = np.ones(num_rows, dtype=bool)
+        self._live[deleted] = False
+        self._num_rows = num_rows
+        self._generation = generation
+        self._version = version
+
+    def _read_transaction(self):
+        """Open a snapshot read transaction and bring the local state up to date."""
+        for attempt in range(3):
+            self._conn.execute("BEGIN")
+            try:
+                self._refresh()
+                return
+            except FileNotFoundError:
+                # A compaction committed and removed the files of the snapshot just
+                # taken; a new snapshot names the files that replaced them
+                self._conn.execute("ROLLBACK")
+                if attempt == 2:
+                    raise
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add(
+        self,
+        documents: List[str],
+        embeddings,
+        metadatas: List[Dict[str, Any]],
+        ids: List[str]
+    ) -> List[str]:
+        """
+        Append documents; an existing ID is tombstoned and replaced.
+
+        Args:
+            documents: Document texts
+            embeddings: One embedding per document
+            metadatas: One metadata dict per document
+            ids: One ID per document; if an ID repeats, its last entry wins
+
+        Returns:
+            The IDs that were added
+        """
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+        if len(vectors) != len(documents):
+            raise ValueError("documents and embeddings must have the same length")
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        # Tombstoning only covers earlier batches, so drop repeats within this one here
+        last = {doc_id: offset for offset, doc_id in enumerate(ids)}
+        if len(last) != len(ids):
+            keep = sorted(last.values())
+            vectors = vectors[keep]
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            ids = [ids[i] for i in keep]
+
+        with self._lock:
+            # BEGIN IMMEDIATE takes the database write lock, serializing writers across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._read_meta()
+                self._record_dimension(meta, vectors.shape[1])
+                generation = int(meta["generation"])
+                start = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+
+                self._write_rows(self._vector_path(generation), start, vectors.astype(STORAGE_DTYPES[meta["dtype"]]))
+                quantizer_version = self._stored_quantizer_version(meta)
+                if quantizer_version:
+                    quantizer = self._load_quantizer(quantizer_version)
+                    self._write_rows(self._codes_path(generation, quantizer_version), start, quantizer.encode(vectors))
+                train = bool(meta.get("compression")) and not quantizer_version \
+                    and start + len(vectors) >= self.min_training_rows
+
+                self._conn.executemany(
+                    "UPDATE entries SET deleted = 1 WHERE id = ? AND deleted = 0",
+                    ((doc_id,) for doc_id in ids)
+                )
+                self._conn.executemany(
+                    "INSERT INTO entries (position, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    (
+                        (start + offset, doc_id, document, json.dumps(metadata))
+                        for offset, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                    )
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if train:
+            # The rows are committed; searches stay exact until the quantizer is installed
+            try:
+                self._train_first_quantizer()
+            except Exception as e:
+                logger.warning(f"Quantizer training failed, searches stay exact: {e}")
+
+        return ids
+
+    def _train_first_quantizer(self):
+        """
+        Train the first quantizer on the stored rows and install it.
+
+        k-means runs outside any write transaction so other writers are not
+        blocked; the install step re-reads the sidecar and encodes every row
+        stored by then, or does nothing if another writer installed one first.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                meta = self._read_meta()
+                num_rows = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+                if self._stored_quantizer_version(meta) or num_rows < self.min_training_rows:
+                    return
+                sample = self._training_sample(meta, int(meta["generation"]), np.arange(num_rows))
+            finally:
+                self._conn.execute("COMMIT")
+
+        quantizer = self._train(meta["compression"], sample)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._read_meta()
+                if self._stored_quantizer_version(meta):
+                    self._conn.execute("ROLLBACK")
+                    return
+                generation = int(meta["generation"])
+                num_rows = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+                self._install_quantizer(meta, generation, np.arange(num_rows), quantizer)
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _write_rows(path: str, start: int, rows: np.ndarray):
+        """
+        Write rows at their offset in a row-major file.
+
+        Writing at the offset rather than appending means a torn tail left by a
+        crashed writer is simply overwritten.
+        """
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(start * rows.shape[1] * rows.dtype.itemsize)
+            f.write(np.ascontiguousarray(rows).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _float_rows(self, meta: Dict[str, str], generation: int, num_rows: int) -> np.memmap:
+        return np.memmap(
+            self._vector_path(generation),
+            dtype=STORAGE_DTYPES[meta["dtype"]],
+            mode="r",
+            shape=(num_rows, int(meta["dimension"]))
+        )
+
+    def _training_sample(self, meta: Dict[str, str], generation: int, positions: np.ndarray) -> np.ndarray:
+        """Random sample of up to max_training_rows stored rows, as normalized float32."""
+        if len(positions) > self.max_training_rows:
+            rng = np.random.default_rng(0)
+            positions = np.sort(rng.choice(positions, self.max_training_rows, replace=False))
+        rows = self._float_rows(meta, generation, int(positions[-1]) + 1)
+        return np.asarray(rows[positions], dtype=np.float32)
+
+    def _install_quantizer(
+        self,
+        meta: Dict[str, str],
+        generation: int,
+        positions: np.ndarray,
+        quantizer,
+        code_generation: Optional[int] = None
+    ):
+        """
+        Install a trained quantizer as a new version and encode the given rows with it.
+
+        Runs inside a write transaction. The quantizer and code file are written
+        under the new version before the sidecar points at it, so readers switch
+        to both together on their next refresh.
+
+        Args:
+            meta: Store metadata read in this transaction
+            generation: Generation whose float file holds ``positions``
+            positions: Rows to encode, in the order they are stored in the code file
+            quantizer: Trained quantizer
+            code_generation: Generation the code file belongs to; ``generation`` by default
+        """
+        version = (self._stored_quantizer_version(meta) or 0) + 1
+        save_quantizer(quantizer, self._quantizer_path(version))
+        self._quantizers = {version: quantizer}
+        code_generation = generation if code_generation is None else code_generation
+        rows = self._float_rows(meta, generation, int(positions[-1]) + 1) if len(positions) else None
+        with open(self._codes_path(code_generation, version), "wb") as f:
+            for start in range(0, len(positions), self.block_size):
+                block = np.asarray(rows[positions[start:start + self.block_size]], dtype=np.float32)
+                f.write(np.ascontiguousarray(quantizer.encode(block)).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        del rows
+
+        self._conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('quantizer', ?)", (str(version),)
+        )
+        meta["quantizer"] = str(version)
+        logger.info(f"Installed {meta['compression']} quantizer version {version} for {len(positions)} rows")
+
+    def _train(self, kind: str, sample: np.ndarray):
+        """Train a quantizer of the given kind on normalized float32 vectors."""
+        kwargs = {"num_subvectors": self.pq_subvectors} if kind == "pq" else {}
+        quantizer = create_quantizer(kind, sample.shape[1], **kwargs)
+        quantizer.train(sample)
+        logger.info(f"Trained {kind} quantizer on {len(sample)} vectors")
+        return quantizer
+
+    def _files_of(self, generation: int, quantizer_version: Optional[int]) -> set:
+        """Names of the vector, code and quantizer files one snapshot maps."""
+        names = {os.path.basename(self._vector_path(generation))}
+        if quantizer_version:
+            names.add(os.path.basename(self._quantizer_path(quantizer_version)))
+            names.add(os.path.basename(self._codes_path(generation, quantizer_version)))
+        return names
+
+    def _remove_stale_files(self, keep: set):
+        """
+        Delete vector, code and quantizer files other than ``keep``.
+
+        Callers keep the files of the state they replaced as well as the new
+        one: a reader that took its snapshot just before the commit still maps
+        them, and on Windows a mapped file cannot be removed anyway.
+        """
+        pattern = re.compile(
+            rf"{re.escape(self.collection_name)}\.(\d+\.vectors|\d+\.q\d+\.codes|q\d+\.quantizer\.npz)"
+        )
+        for name in os.listdir(self.persist_directory):
+            if pattern.fullmatch(name) and name not in keep:
+                try:
+                    os.remove(os.path.join(self.persist_directory, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove stale store file {name}: {e}")
+
+    def train_quantizer(self, sample_embeddings):
+        """
+        Train the quantizer on a representative sample instead of the stored rows.
+
+        Rows already stored are re-encoded with the new quantizer.
+
+        Args:
+            sample_embeddings: Sample embeddings, one per row
+        """
+        sample = np.array(sample_embeddings, dtype=np.float32, ndmin=2)
+        sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            meta = self._read_meta()
+        if not meta.get("compression"):
+            raise ValueError("Store was not created with compression")
+        self._check_dimension(meta, sample.shape[1])
+        # Train before taking the write lock; the sidecar is re-checked below
+        quantizer = self._train(meta["compression"], sample)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._read_meta()
+                self._record_dimension(meta, sample.shape[1], label="Sample")
+                generation = int(meta["generation"])
+                replaced = self._files_of(generation, self._stored_quantizer_version(meta))
+                num_rows = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM entries").fetchone()[0]
+                self._install_quantizer(meta, generation, np.arange(num_rows), quantizer)
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._remove_stale_files(replaced | self._files_of(generation, self._stored_quantizer_version(meta)))
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Tombstone documents by ID.
+
+        Args:
+            ids: IDs to delete; unknown IDs are ignored
+
+        Returns:
+            Number of documents deleted
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = 0
+                for doc_id in ids:
+                    deleted += self._conn.execute(
+                        "UPDATE entries SET deleted = 1 WHERE id = ? AND deleted = 0", (doc_id,)
+                    ).rowcount
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return deleted
+
+    def compact(self):
+        """Rewrite the vector file without tombstoned rows."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._read_meta()
+                generation = int(meta["generation"])
+                quantizer_version = self._stored_quantizer_version(meta)
+                replaced = self._files_of(generation, quantizer_version)
+                rows = self._conn.execute(
+                    "SELECT position FROM entries WHERE deleted = 0 ORDER BY position"
+                ).fetchall()
+                keep = np.array([row[0] for row in rows], dtype=np.int64)
+
+                # Readers keep their mapping of the old generation until they refresh
+                new_generation = generation + 1
+                if len(keep):
+                    old = self._float_rows(meta, generation, int(keep[-1]) + 1)
+                    with open(self._vector_path(new_generation), "wb") as f:
+                        for start in range(0, len(keep), self.block_size):
+                            f.write(np.ascontiguousarray(old[keep[start:start + self.block_size]]).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    del old
+
+                    # Retrain on the live rows once there are enough, else keep the current codebooks
+                    if meta.get("compression") and len(keep) >= self.min_training_rows:
+                        # Compaction is explicit maintenance, so training may hold the write lock here
+                        quantizer = self._train(meta["compression"], self._training_sample(meta, generation, keep))
+                        self._install_quantizer(meta, generation, keep, quantizer, code_generation=new_generation)
+                    elif quantizer_version:
+                        quantizer = self._load_quantizer(quantizer_version)
+                        old = self._float_rows(meta, generation, int(keep[-1]) + 1)
+                        with open(self._codes_path(new_generation, quantizer_version), "wb") as f:
+                            for start in range(0, len(keep), self.block_size):
+                                block = np.asarray(old[keep[start:start + self.block_size]], dtype=np.float32)
+                                f.write(np.ascontiguousarray(quantizer.encode(block)).tobytes())
+                            f.flush()
+                            os.fsync(f.fileno())
+                        del old
+
+                self._conn.execute("DELETE FROM entries WHERE deleted = 1")
+                self._conn.execute("UPDATE entries SET position = -1 - position")
+                self._conn.executemany(
+                    "UPDATE entries SET position = ? WHERE position = ?",
+                    ((new_position, -1 - int(old_position)) for new_position, old_position in enumerate(keep))
+                )
+                self._conn.execute(
+                    "UPDATE store_meta SET value = ? WHERE key = 'generation'", (str(new_generation),)
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            # The replaced generation stays on disk until the next compaction
+            self._remove_stale_files(replaced | self._files_of(new_generation, self._stored_quantizer_version(meta)))
+            logger.info(f"Compacted memmap store to {len(keep)} vectors")
+
+    def search(
+        self,
+        query_embedding,
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Search for the nearest documents to one query embedding."""
+        return self.batch_search([query_embedding], n_results, filter_metadata)[0]
+
+    def batch_search(
+        self,
+        query_embeddings,
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for several query embeddings.
+
+        Uncompressed stores are searched exactly; compressed stores scan the
+        codes and re-score a shortlist exactly unless refine_factor is 0.
+
+        Args:
+            query_embeddings: Query embeddings, one per row
+            n_results: Number of results per query
+            filter_metadata: Chroma-style where filter, resolved through the
+                metadata bitmap index before any row is scored
+
+        Returns:
+            One Chroma-style result dict (documents, metadatas, distances, ids) per query
+        """
+        queries = np.array(query_embeddings, dtype=np.float32, ndmin=2)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # The lock is held only to take a snapshot and to fetch the winning rows, so
+        # searches in this process score in parallel and writers are not held up
+        while True:
+            with self._lock:
+                self._read_transaction()
+                try:
+                    if self._matrix is None:
+                        return [self._empty_result() for _ in range(len(queries))]
+                    snapshot = self._snapshot()
+                    candidates = self._filter_positions(filter_metadata) if filter_metadata else None
+                finally:
+                    self._conn.execute("COMMIT")
+
+            use_codes = snapshot.codes is not None
+            scores, positions = self._search_positions(
+                snapshot, queries, n_results, candidates, use_codes, refine=use_codes and self.refine_factor > 0
+            )
+
+            with self._lock:
+                self._read_transaction()
+                try:
+                    # Compaction renumbered the rows in between; score the new generation
+                    if self._generation != snapshot.generation:
+                        continue
+                    return self._fetch_results(scores, positions)
+                finally:
+                    self._conn.execute("COMMIT")
+
+    def _snapshot(self) -> _Snapshot:
+        """Current search state. Caller holds the lock inside a read transaction."""
+        return _Snapshot(
+            self._generation, self._num_rows, self.dimension, self.dtype,
+            self._matrix, self._codes, self.quantizer, self._live
+        )
+
+    def _search_positions(
+        self,
+        snapshot: _Snapshot,
+        queries: np.ndarray,
+        k: int,
+        candidates: Optional[np.ndarray],
+        use_codes: bool,
+        refine: bool
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k scores and row positions, from floats or codes with optional refinement."""
+        shortlist = k * self.refine_factor if refine else k
+        if candidates is not None:
+            scores, positions = self._score_candidates(snapshot, queries, candidates, shortlist, use_codes)
+        else:
+            scores, positions = self._score_blocks(snapshot, queries, shortlist, use_codes)
+        if refine:
+            scores, positions = self._refine(snapshot, queries, scores, positions, k)
+        return scores, positions
+
+    def _score_blocks(
+        self, snapshot: _Snapshot, queries: np.ndarray, k: int, use_codes: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Blocked scoring over the whole store keeping a running top-k."""
+        best_scores, best_positions = [], []
+        # float16 rows are widened into one reused buffer so BLAS does the multiply;
+        # float32 rows are multiplied straight from the map
+        buffer = None
+        if not use_codes and snapshot.dtype != np.float32:
+            buffer = np.empty((min(self.block_size, snapshot.num_rows), snapshot.dimension), dtype=np.float32)
+
+        for start in range(0, snapshot.num_rows, self.block_size):
+            end = min(start + self.block_size, snapshot.num_rows)
+            if use_codes:
+                similarities = snapshot.quantizer.score(queries, np.asarray(snapshot.codes[start:end]))
+            elif buffer is None:
+                similarities = queries @ snapshot.matrix[start:end].T
+            else:
+                block = buffer[:end - start]
+                np.copyto(block, snapshot.matrix[start:end])
+                similarities = queries @ block.T
+            dead = ~snapshot.live[start:end]
+            if dead.any():
+                similarities[:, dead] = -np.inf
+
+            positions = np.broadcast_to(np.arange(start, end), similarities.shape)
+            block_scores, block_positions = self._top_k(similarities, positions, k)
+            best_scores.append(block_scores)
+            best_positions.append(block_positions)
+
+        return self._top_k(np.concatenate(best_scores, axis=1), np.concatenate(best_positions, axis=1), k)
+
+    def _score_candidates(
+        self, snapshot: _Snapshot, queries: np.ndarray, candidates: np.ndarray, k: int, use_codes: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score only the given rows, reading them from the map in position order."""
+        if len(candidates) == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty, empty.astype(np.int64)
+
+        best_scores, best_positions = [], []
+        for start in range(0, len(candidates), self.block_size):
+            rows = candidates[start:start + self.block_size]
+            if use_codes:
+                similarities = snapshot.quantizer.score(queries, np.asarray(snapshot.codes[rows]))
+            else:
+                similarities = queries @ np.asarray(snapshot.matrix[rows], dtype=np.float32).T
+            best_scores.append(similarities)
+            best_positions.append(np.broadcast_to(rows, similarities.shape))
+        return self._top_k(np.concatenate(best_scores, axis=1), np.concatenate(best_positions, axis=1), k)
+
+    def _refine(
+        self, snapshot: _Snapshot, queries: np.ndarray, scores: np.ndarray, positions: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-score each query's shortlist against the float vectors."""
+        refined_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        refined_positions = np.zeros((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = np.unique(positions[i][np.isfinite(scores[i])])
+            if not len(rows):
+                continue
+            exact = np.asarray(snapshot.matrix[rows], dtype=np.float32) @ query
+            top_scores, top_positions = self._top_k(exact[None, :], rows[None, :], k)
+            refined_scores[i, :top_scores.shape[1]] = top_scores[0]
+            refined_positions[i, :top_positions.shape[1]] = top_positions[0]
+        return refined_scores, refined_positions
+
+    def evaluate_compression(self, query_embeddings, k: int = 10) -> Dict[str, Any]:
+        """
+        Measure recall@k of compressed search against exact float search.
+
+        Args:
+            query_embeddings: Evaluation queries, one per row
+            k: Cutoff
+
+        Returns:
+            Recall@k with and without the exact refine pass, per-query latencies
+            in milliseconds and bytes scanned per vector
+        """
+        queries = np.array(query_embeddings, dtype=np.float32, ndmin=2)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            self._read_transaction()
+            try:
+                if self._codes is None:
+                    raise ValueError("Store has no compressed codes to evaluate")
+
+                report: Dict[str, Any] = {"compression": self.compression, "k": k}
+                runs = {
+                    "exact": (False, False),
+                    "codes": (True, False),
+                    "refined": (True, self.refine_factor > 0)
+                }
+                rankings = {}
+                snapshot = self._snapshot()
+                for name, (use_codes, refine) in runs.items():
+                    started = time.perf_counter()
+                    scores, positions = self._search_positions(snapshot, queries, k, None, use_codes, refine)
+                    rankings[name] = [row[np.isfinite(row_scores)] for row_scores, row in zip(scores, positions)]
+                    report[f"{name}_ms_per_query"] = (time.perf_counter() - started) * 1000 / len(queries)
+
+                report["recall_at_k_codes"] = recall_at_k(rankings["codes"], rankings["exact"], k)
+                report["recall_at_k_refined"] = recall_at_k(rankings["refined"], rankings["exact"], k)
+                report["code_bytes_per_vector"] = self.quantizer.code_size * np.dtype(self.quantizer.code_dtype).itemsize
+                report["float_bytes_per_vector"] = self.dimension * np.dtype(self.dtype).itemsize
+                return report
+            finally:
+                self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the k best columns per row, sorted by descending score."""
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            positions = np.take_along_axis(positions, top, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(positions, order, axis=1)
+
+    def _filter_positions(self, filter_metadata: Dict[str, Any]) -> np.ndarray:
+        """Live rows whose metadata matches the filter."""
+        if self._metadata_index is None or self._indexed_generation != self._generation:
+            # Compaction renumbers rows, so a new generation starts a new index
+            self._metadata_index = MetadataIndex()
+            self._indexed_generation = self._generation
+
+        indexed = self._metadata_index.size
+        if indexed < self._num_rows:
+            rows = self._conn.execute(
+                "SELECT position, metadata FROM entries WHERE position >= ? AND position < ? ORDER BY position",
+                (indexed, self._num_rows)
+            ).fetchall()
+            self._metadata_index.add([row[0] for row in rows], [json.loads(row[1]) for row in rows])
+
+        mask = self._metadata_index.mask(filter_metadata)[:self._num_rows]
+        return np.flatnonzero(mask & self._live[:len(mask)])
+
+    def _fetch_results(self, scores: np.ndarray, positions: np.ndarray) -> List[Dict[str, Any]]:
+        """Load documents and metadata for the selected rows."""
+        wanted = sorted({int(p) for row_scores, row in zip(scores, positions)
+                         for score, p in zip(row_scores, row) if np.isfinite(score)})
+        entries = {}
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            query = (
+                "SELECT position, id, document, metadata FROM entries "
+                f"WHERE deleted = 0 AND position IN ({','.join('?' * len(chunk))})"
+            )
+            for position, doc_id, document, metadata in self._conn.execute(query, chunk):
+                entries[position] = (doc_id, document, json.loads(metadata))
+
+        results = []
+        for row_scores, row_positions in zip(scores, positions):
+            result = self._empty_result()
+            for score, position in zip(row_scores, row_positions):
+                # Tombstoned rows score -inf and only surface when too few rows are live;
+                # rows deleted after the snapshot was scored are skipped as well
+                if not np.isfinite(score) or int(position) not in entries:
+                    continue
+                doc_id, document, metadata = entries[int(position)]
+                result["documents"].append(document)
+                result["metadatas"].append(metadata)
+                result["distances"].append(float(1.0 - score))
+                result["ids"].append(doc_id)
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _empty_result() -> Dict[str, Any]:
+        return {"documents": [], "metadatas": [], "distances": [], "ids": []}
+
+    def count(self) -> int:
+        """Number of live documents."""
+        with self._lock:
+            self._read_transaction()
+            self._conn.execute("COMMIT")
+            return int(self._live.sum())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store statistics."""
+        with self._lock:
+            self._read_transaction()
+            self._conn.execute("COMMIT")
+            return {
+                "count": int(self._live.sum()),
+                "stored_vectors": self._num_rows,
+                "dimension": self.dimension,
+                "dtype": np.dtype(self.dtype).name if self.dtype else None,
+                "compression": self.compression,
+                "refine_factor": self.refine_factor if self.compression else None,
+                "quantizer_version": self._quantizer_version,
+                "generation": self._generation
+            }
+
+    def close(self):
+        """Release the map and the sidecar connection."""
+        with self._lock:
+            self._matrix = None
+            self._codes = None
+            self._conn.close()
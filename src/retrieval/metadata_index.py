@@ -0,0 +1,341 @@
+"""
+Secondary index over document metadata.
+
+Each (field, value) pair owns a posting of row positions: a sorted position
+array while the value is rare and a packed bitmap once it covers enough rows
+that the bitmap is smaller, so memory tracks the number of (row, field)
+entries rather than distinct values times rows.  Numbers and strings are also
+kept in a sorted (value, row) array per field, so range filters are answered
+with ``searchsorted`` however many distinct values there are.  Filters use
+the Chroma ``where`` syntax: ``{"field": value}``, operator dicts (``$eq``,
+``$ne``, ``$in``, ``$nin``, ``$gt``, ``$gte``, ``$lt``, ``$lte``) and the
+``$and``, ``$or`` and ``$not`` combinators, evaluated as AND/OR/NOT over
+packed bitmaps.
+"""
+
+import threading
+from numbers import Number
+from typing import List, Dict, Any, Optional, Sequence, Hashable, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+# A posting becomes a bitmap once its position array (8 bytes per row) would
+# outgrow a bitmap over every row (1 bit per row)
+DENSE_FRACTION = 1 / 64
+
+
+def _set_bits(bitmap: np.ndarray, positions: np.ndarray):
+    np.bitwise_or.at(bitmap, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+
+
+def _clear_bits(bitmap: np.ndarray, positions: np.ndarray):
+    np.bitwise_and.at(bitmap, positions >> 3, ~(1 << (positions & 7)).astype(np.uint8))
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """Room for ``size`` items, doubling capacity to amortize appends."""
+    if len(array) >= size:
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class _Posting:
+    """Rows holding one (field, value): sorted positions while sparse, a bitmap once dense."""
+
+    __slots__ = ("rows", "count", "bitmap")
+
+    def __init__(self):
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self.bitmap: Optional[np.ndarray] = None
+
+    def add(self, positions: np.ndarray, num_rows: int):
+        """Add sorted positions; ``num_rows`` is the index size after the add."""
+        nbytes = (num_rows + 7) // 8
+        if self.bitmap is None and self.count + len(positions) > num_rows * DENSE_FRACTION:
+            self.bitmap = np.zeros(nbytes, dtype=np.uint8)
+            _set_bits(self.bitmap, self.rows[:self.count])
+            self.rows = None
+        if self.bitmap is not None:
+            self.bitmap = _grow(self.bitmap, nbytes)
+            _set_bits(self.bitmap, positions)
+            return
+
+        if not self.count:
+            self.rows = positions.copy()
+            self.count = len(positions)
+        elif positions[0] <= self.rows[self.count - 1]:
+            merged = np.union1d(self.rows[:self.count], positions)
+            self.rows = _grow(self.rows, len(merged))
+            self.rows[:len(merged)] = merged
+            self.count = len(merged)
+        else:
+            self.rows = _grow(self.rows, self.count + len(positions))
+            self.rows[self.count:self.count + len(positions)] = positions
+            self.count += len(positions)
+
+    def to_bitmap(self, nbytes: int) -> np.ndarray:
+        """Fresh packed bitmap of ``nbytes`` bytes."""
+        bitmap = np.zeros(nbytes, dtype=np.uint8)
+        if self.bitmap is not None:
+            size = min(nbytes, len(self.bitmap))
+            bitmap[:size] = self.bitmap[:size]
+        else:
+            _set_bits(bitmap, self.rows[:self.count])
+        return bitmap
+
+    @property
+    def nbytes(self) -> int:
+        return self.bitmap.nbytes if self.bitmap is not None else self.rows.nbytes
+
+
+class _RangeColumn:
+    """Sorted (value, row) pairs of one field and kind; appends are merged in on the next query."""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.values = np.zeros(0, dtype=dtype)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def add(self, values: List[Any], rows: List[int]):
+        self._pending.append((np.asarray(values, dtype=self.dtype), np.asarray(rows, dtype=np.int64)))
+
+    def sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._pending:
+            values = np.concatenate([self.values] + [values for values, _ in self._pending])
+            rows = np.concatenate([self.rows] + [rows for _, rows in self._pending])
+            # Stable sort keeps the already-sorted prefix cheap to merge
+            order = np.argsort(values, kind="stable")
+            self.values, self.rows = values[order], rows[order]
+            self._pending = []
+        return self.values, self.rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.rows.nbytes + sum(v.nbytes + r.nbytes for v, r in self._pending)
+
+
+class MetadataIndex:
+    """Index from metadata (field, value) pairs and value ranges to row positions."""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Hashable, _Posting]] = {}
+        self._ranges: Dict[Tuple[str, str], _RangeColumn] = {}
+        self._live = np.zeros(0, dtype=np.uint8)
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        """Number of row positions covered, including removed ones."""
+        return self._size
+
+    @staticmethod
+    def _key(value: Any) -> Hashable:
+        # Keep True distinct from 1 and False from 0
+        return ("bool", value) if isinstance(value, bool) else value
+
+    @staticmethod
+    def _kind(value: Any) -> Optional[str]:
+        """Comparable kind of a value for range queries."""
+        if isinstance(value, (bool, tuple)):
+            return None
+        if isinstance(value, Number):
+            return "number"
+        if isinstance(value, str):
+            return "string"
+        return None
+
+    def _nbytes(self) -> int:
+        return (self._size + 7) // 8
+
+    def add(self, positions: Sequence[int], metadatas: Sequence[Dict[str, Any]]):
+        """
+        Index rows.
+
+        Args:
+            positions: Row positions, usually increasing from the current size
+            metadatas: Metadata dict for each row
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return
+
+        with self._lock:
+            self._size = max(self._size, int(positions.max()) + 1)
+
+            # Group positions by (field, value) so each posting is updated once per batch
+            groups: Dict[Tuple[str, Hashable], List[int]] = {}
+            ranged: Dict[Tuple[str, str], Tuple[List[Any], List[int]]] = {}
+            for position, metadata in zip(positions.tolist(), metadatas):
+                for field, value in (metadata or {}).items():
+                    try:
+                        groups.setdefault((field, self._key(value)), []).append(position)
+                    except TypeError:
+                        # Unhashable values (lists, dicts) are not indexed
+                        continue
+                    kind = self._kind(value)
+                    if kind:
+                        values, rows = ranged.setdefault((field, kind), ([], []))
+                        values.append(value)
+                        rows.append(position)
+
+            for (field, key), group in groups.items():
+                posting = self._postings.setdefault(field, {}).get(key)
+                if posting is None:
+                    posting = self._postings[field][key] = _Posting()
+                group = np.asarray(group, dtype=np.int64)
+                if len(group) > 1 and not np.all(group[1:] > group[:-1]):
+                    group = np.unique(group)
+                posting.add(group, self._size)
+
+            for (field, kind), (values, rows) in ranged.items():
+                column = self._ranges.get((field, kind))
+                if column is None:
+                    column = self._ranges[(field, kind)] = _RangeColumn(np.float64 if kind == "number" else np.str_)
+                column.add(values, rows)
+
+            self._live = _grow(self._live, self._nbytes())
+            _set_bits(self._live, positions)
+
+    def remove(self, positions: Sequence[int]):
+        """Exclude rows from every future result."""
+        positions = np.asarray(positions, dtype=np.int64)
+        with self._lock:
+            positions = positions[positions < self._size]
+            if len(positions):
+                _clear_bits(self._live, positions)
+
+    def clear(self):
+        """Drop every indexed row."""
+        with self._lock:
+            self._postings = {}
+            self._ranges = {}
+            self._live = np.zeros(0, dtype=np.uint8)
+            self._size = 0
+
+    def evaluate(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Evaluate a filter to a packed bitmap over live rows.
+
+        Args:
+            where: Chroma-style filter
+
+        Returns:
+            Packed little-endian bitmap of matching positions
+        """
+        with self._lock:
+            return self._evaluate(where) & self._live[:self._nbytes()]
+
+    def mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean mask of length ``size`` marking matching rows."""
+        bitmap = self.evaluate(where)
+        return np.unpackbits(bitmap, bitorder="little", count=self._size).astype(bool)
+
+    def positions(self, where: Dict[str, Any]) -> np.ndarray:
+        """Sorted positions of matching rows."""
+        return np.flatnonzero(self.mask(where))
+
+    def count(self, where: Dict[str, Any]) -> int:
+        """Number of matching rows."""
+        return int(np.unpackbits(self.evaluate(where)).sum())
+
+    def _empty(self) -> np.ndarray:
+        return np.zeros(self._nbytes(), dtype=np.uint8)
+
+    def _evaluate(self, where: Dict[str, Any]) -> np.ndarray:
+        """Evaluate a filter clause without masking removed rows."""
+        if not where:
+            return ~self._empty()
+
+        result = None
+        for field, condition in where.items():
+            if field == "$and":
+                bitmap = ~self._empty()
+                for clause in condition:
+                    bitmap &= self._evaluate(clause)
+            elif field == "$or":
+                bitmap = self._empty()
+                for clause in condition:
+                    bitmap |= self._evaluate(clause)
+            elif field == "$not":
+                bitmap = ~self._evaluate(condition)
+            elif isinstance(condition, dict):
+                bitmap = ~self._empty()
+                for operator, operand in condition.items():
+                    bitmap &= self._evaluate_operator(field, operator, operand)
+            else:
+                bitmap = self._equals(field, condition)
+            result = bitmap if result is None else result & bitmap
+        return result
+
+    def _equals(self, field: str, value: Any) -> np.ndarray:
+        try:
+            posting = self._postings.get(field, {}).get(self._key(value))
+        except TypeError:
+            posting = None
+        return self._empty() if posting is None else posting.to_bitmap(self._nbytes())
+
+    def _evaluate_operator(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        if operator == "$eq":
+            return self._equals(field, operand)
+        if operator == "$ne":
+            return ~self._equals(field, operand)
+        if operator == "$in":
+            bitmap = self._empty()
+            for value in operand:
+                bitmap |= self._equals(field, value)
+            return bitmap
+        if operator == "$nin":
+            bitmap = self._empty()
+            for value in operand:
+                bitmap |= self._equals(field, value)
+            return ~bitmap
+        if operator in RANGE_OPERATORS:
+            return self._range(field, operator, operand)
+        raise ValueError(f"Unsupported filter operator: {operator}")
+
+    def _range(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        """Mark the rows whose value satisfies a comparison, found by binary search."""
+        kind = self._kind(operand)
+        if kind is None:
+            raise ValueError(f"Range filter on '{field}' needs a number or string, got {operand!r}")
+
+        bitmap = self._empty()
+        column = self._ranges.get((field, kind))
+        if column is None:
+            return bitmap
+        values, rows = column.sorted()
+
+        if operator == "$gt":
+            selected = rows[np.searchsorted(values, operand, side="right"):]
+        elif operator == "$gte":
+            selected = rows[np.searchsorted(values, operand, side="left"):]
+        elif operator == "$lt":
+            selected = rows[:np.searchsorted(values, operand, side="left")]
+        else:
+            selected = rows[:np.searchsorted(values, operand, side="right")]
+
+        _set_bits(bitmap, selected)
+        return bitmap
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics."""
+        with self._lock:
+            postings = [posting for values in self._postings.values() for posting in values.values()]
+            return {
+                "rows": self._size,
+                "live_rows": int(np.unpackbits(self._live[:self._nbytes()]).sum()),
+                "fields": len(self._postings),
+                "postings": len(postings),
+                "bitmap_postings": sum(posting.bitmap is not None for posting in postings),
+                "posting_bytes": sum(posting.nbytes for posting in postings),
+                "range_bytes": sum(column.nbytes for column in self._ranges.values())
+            }
@@ -0,0 +1,292 @@
+"""
+ONNX Runtime inference for sentence-transformer embedding models.
+
+The transformer is exported once to an ONNX graph, optionally quantized to
+int8 weights with dynamic activation quantization, and served by ONNX
+Runtime on CPU.  Pooling and normalization follow the source model's
+configuration, and the export records a cosine parity check against the
+float model so a degraded graph is never used silently.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, Any, Optional, Sequence
+import numpy as np
+import logging
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+    logging.warning("onnxruntime not available. Install with: pip install onnxruntime onnx")
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "embedder_config.json"
+FLOAT_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model_int8.onnx"
+DEFAULT_OPSET = 14
+
+PARITY_SENTENCES = [
+    "How do I reset my password?",
+    "The quarterly revenue grew by twelve percent compared to last year.",
+    "Retrieval-augmented generation combines search with language models.",
+    "Install the package with pip and import it in your project.",
+    "A short one.",
+    "The patient was prescribed a lower dose after the follow-up appointment, "
+    "and the physician noted that symptoms had improved considerably over three weeks."
+]
+
+
+def _pooling_config(model) -> Dict[str, Any]:
+    """Read pooling mode and normalization from a SentenceTransformer's modules."""
+    pooling = "mean"
+    normalize = False
+    for module in model:
+        name = type(module).__name__
+        if name == "Pooling":
+            if getattr(module, "pooling_mode_cls_token", False):
+                pooling = "cls"
+            elif getattr(module, "pooling_mode_max_tokens", False):
+                pooling = "max"
+        elif name == "Normalize":
+            normalize = True
+    return {"pooling": pooling, "normalize": normalize}
+
+
+def export_onnx_model(
+    model,
+    output_dir: str,
+    quantize: bool = True,
+    opset: int = DEFAULT_OPSET,
+    parity_texts: Optional[Sequence[str]] = None,
+    parity_tolerance: float = 0.99,
+    source_model: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Export a SentenceTransformer to ONNX and check it against the float model.
+
+    Args:
+        model: Loaded SentenceTransformer
+        output_dir: Directory for the graph, tokenizer and config
+        quantize: Also write an int8 dynamically quantized graph and serve it
+        opset: ONNX opset version
+        parity_texts: Texts for the parity check; a built-in sample by default
+        parity_tolerance: Minimum cosine similarity to the float embeddings
+        source_model: Model name recorded so a stale export can be detected
+
+    Returns:
+        The written embedder config, including the parity report
+    """
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    class _EncoderOutput(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if token_type_ids is not None:
+                inputs["token_type_ids"] = token_type_ids
+            return self.encoder(**inputs)[0]
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask"] + (["token_type_ids"] if "token_type_ids" in sample else [])
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    float_path = os.path.join(output_dir, FLOAT_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _EncoderOutput(transformer),
+            tuple(sample[name] for name in input_names),
+            float_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+
+    model_file = FLOAT_MODEL_FILE
+    if quantize:
+        quantize_dynamic(float_path, os.path.join(output_dir, INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+        model_file = INT8_MODEL_FILE
+
+    tokenizer.save_pretrained(output_dir)
+    config = {
+        "source_model": source_model,
+        "quantize": quantize,
+        "opset": opset,
+        "model_file": model_file,
+        "input_names": input_names,
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        **_pooling_config(model)
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    embedder = OnnxEmbedder(output_dir)
+    config["parity"] = check_parity(model, embedder, parity_texts or PARITY_SENTENCES, parity_tolerance)
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    logger.info(
+        f"Exported {model_file} to {output_dir} "
+        f"(min cosine {config['parity']['min_cosine']:.4f}, passed={config['parity']['passed']})"
+    )
+    return config
+
+
+def check_parity(reference_model, embedder, texts: Sequence[str], tolerance: float = 0.99) -> Dict[str, Any]:
+    """
+    Compare embeddings from two models text by text.
+
+    Args:
+        reference_model: Model whose embeddings are treated as correct
+        embedder: Model under test
+        texts: Texts to embed with both
+        tolerance: Minimum cosine similarity every text must reach
+
+    Returns:
+        Minimum and mean cosine similarity and whether the tolerance was met
+    """
+    expected = np.asarray(reference_model.encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+    actual = np.asarray(embedder.encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+    cosines = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1) + 1e-12
+    )
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "tolerance": tolerance,
+        "passed": bool(cosines.min() >= tolerance)
+    }
+
+
+class OnnxEmbedder:
+    """Sentence embedder running an exported graph on ONNX Runtime, loaded on first use."""
+
+    def __init__(self, model_dir: str, num_threads: Optional[int] = None):
+        """
+        Read the export config; the session and tokenizer load lazily.
+
+        Args:
+            model_dir: Directory written by export_onnx_model
+            num_threads: ONNX Runtime intra-op threads; runtime default if None
+        """
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError("onnxruntime is required for ONNX embeddings")
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.model_dir = model_dir
+        self.num_threads = num_threads
+        self.max_seq_length = self.config["max_seq_length"]
+        self._session = None
+        self._tokenizer = None
+        # encode may be called from several threads; only one of them builds the session
+        self._load_lock = threading.Lock()
+
+    @property
+    def runtime(self) -> str:
+        """Runtime and precision tag, e.g. 'onnx-int8'; embeddings differ slightly between them."""
+        return "onnx-int8" if self.config.get("quantize") else "onnx-fp32"
+
+    def matches(self, source_model: str, quantize: bool, opset: int = DEFAULT_OPSET) -> bool:
+        """Whether the export was made from this model with these settings."""
+        return (
+            self.config.get("source_model") == source_model
+            and self.config.get("quantize") == quantize
+            and self.config.get("opset") == opset
+        )
+
+    @property
+    def parity(self) -> Optional[Dict[str, Any]]:
+        """Parity report recorded at export time."""
+        return self.config.get("parity")
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._load_lock:
+                if self._tokenizer is None:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        return self._tokenizer
+
+    def _load(self):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self._session = ort.InferenceSession(
+            os.path.join(self.model_dir, self.config["model_file"]),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        logger.info(f"Loaded ONNX embedding model from {self.model_dir}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.config["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = mask[:, :, None].astype(hidden.dtype)
+        if self.config["pooling"] == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        """
+        Embed texts; mirrors the SentenceTransformer.encode arguments used in this package.
+
+        Args:
+            texts: Texts to embed
+            batch_size: Texts per inference call
+            show_progress_bar: Accepted for compatibility; ignored
+            convert_to_numpy: Accepted for compatibility; results are always numpy
+
+        Returns:
+            Float32 embedding matrix
+        """
+        if self._session is None:
+            with self._load_lock:
+                if self._session is None:
+                    self._load()
+
+        texts = list(texts)
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.config["input_names"]}
+            hidden = self._session.run(None, feeds)[0]
+            pooled = self._pool(hidden, encoded["attention_mask"])
+            if self.config["normalize"]:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.append(pooled.astype(np.float32))
+
+        if not embeddings:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.vstack(embeddings)
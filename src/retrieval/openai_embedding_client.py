@@ -0,0 +1,287 @@
+"""
+Concurrent, rate-limited client for the OpenAI embeddings endpoint.
+
+Batches are sent through a bounded concurrency window and paced by a
+tokens-per-minute bucket, so a large backfill runs at the provider quota
+without tripping it.  Rate limits and transient errors are retried with
+jittered exponential backoff; a batch that still fails raises
+``EmbeddingRequestError`` rather than being replaced by zero vectors.
+
+Each event loop gets one long-lived HTTP client, so keep-alive connections
+are reused across calls; synchronous calls all run on one background loop.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+import httpx
+import logging
+
+from .tokenization import get_encoding
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class EmbeddingRequestError(Exception):
+    """Raised when embedding batches fail after all retries."""
+
+    def __init__(self, message: str, failed_indices: Sequence[int], status_code: Optional[int] = None):
+        super().__init__(message)
+        self.failed_indices = list(failed_indices)
+        self.status_code = status_code
+
+
+class TokenRateLimiter:
+    """
+    Token bucket refilled continuously at a tokens-per-minute rate.
+
+    Safe to share between threads and event loops: each caller reserves its
+    tokens under a lock, letting the balance go negative, then sleeps until
+    the refill covers its reservation, so callers are served in arrival order.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """Spend ``tokens`` now and return the seconds to wait before using them."""
+        # A single request larger than the bucket waits for a full bucket
+        tokens = min(float(tokens), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, tokens: int):
+        """Wait until ``tokens`` can be spent."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncOpenAIEmbeddingClient:
+    """Async embedding client with a concurrency window, TPM pacing and retries."""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "text-embedding-3-small",
+        base_url: str = "https://api.openai.com/v1",
+        batch_size: int = 256,
+        max_concurrency: int = 8,
+        tokens_per_minute: int = 1_000_000,
+        max_retries: int = 6,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 60.0
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            api_key: OpenAI API key
+            model: Embedding model name
+            base_url: API base URL; point it at a stub server in tests
+            batch_size: Texts per request
+            max_concurrency: Requests in flight at once
+            tokens_per_minute: Token quota the requests are paced to
+            max_retries: Retries per batch after the first attempt
+            backoff_base: First backoff ceiling in seconds, doubled per retry
+            backoff_max: Upper bound on a single backoff
+            timeout: Per-request timeout in seconds
+        """
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute)
+
+        # HTTP client and concurrency window per event loop; both are bound to the loop
+        self._sessions: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]] = {}
+        self._sessions_lock = threading.Lock()
+        # Background loop serving embed_sync
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_thread: Optional[threading.Thread] = None
+
+        # None without tiktoken or offline; token counts are then estimated from length
+        self._encoding = get_encoding(model)
+
+        self.stats = {"requests": 0, "retries": 0, "failed_batches": 0, "tokens": 0}
+
+    def _count_tokens(self, texts: Sequence[str]) -> int:
+        if self._encoding is not None:
+            return sum(len(tokens) for tokens in self._encoding.encode_batch(list(texts)))
+        return sum(len(text) // 4 + 1 for text in texts)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than a Retry-After header."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _session(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """Client and semaphore of the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        with self._sessions_lock:
+            # Clients of loops closed without aclose() cannot be used or closed any more
+            for stale in [other for other in self._sessions if other.is_closed()]:
+                del self._sessions[stale]
+            if loop not in self._sessions:
+                limits = httpx.Limits(
+                    max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency
+                )
+                client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    limits=limits,
+                    timeout=self.timeout
+                )
+                self._sessions[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+            return self._sessions[loop]
+
+    async def _post_batch(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        texts: List[str],
+        indices: List[int]
+    ) -> np.ndarray:
+        """Embed one batch, retrying rate limits and transient failures."""
+        tokens = self._count_tokens(texts)
+        last_error = None
+        status_code = None
+
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(tokens)
+            async with semaphore:
+                self.stats["requests"] += 1
+                try:
+                    response = await client.post(
+                        "/embeddings", json={"model": self.model, "input": texts}
+                    )
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    last_error, status_code, retry_after = f"{type(e).__name__}: {e}", None, None
+                else:
+                    if response.status_code == 200:
+                        data = sorted(response.json()["data"], key=lambda item: item["index"])
+                        self.stats["tokens"] += tokens
+                        return np.asarray([item["embedding"] for item in data], dtype=np.float32)
+
+                    last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    status_code = response.status_code
+                    retry_after = response.headers.get("retry-after")
+                    if status_code not in RETRYABLE_STATUS_CODES:
+                        break
+
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"Embedding batch failed ({last_error}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        self.stats["failed_batches"] += 1
+        raise EmbeddingRequestError(
+            f"Embedding batch of {len(texts)} texts failed: {last_error}", indices, status_code
+        )
+
+    async def embed(self, texts: Sequence[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Embed texts concurrently.
+
+        Args:
+            texts: Texts to embed
+            batch_size: Texts per request, overriding the client default
+
+        Returns:
+            Float32 embedding matrix in the order of ``texts``
+
+        Raises:
+            EmbeddingRequestError: If any batch fails; ``failed_indices`` lists
+                the affected positions in ``texts``
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        client, semaphore = self._session()
+        batch_size = batch_size or self.batch_size
+        batches = [list(range(start, min(start + batch_size, len(texts))))
+                   for start in range(0, len(texts), batch_size)]
+
+        results = await asyncio.gather(
+            *(self._post_batch(client, semaphore, [texts[i] for i in batch], batch) for batch in batches),
+            return_exceptions=True
+        )
+
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            failed_indices = [i for result, batch in zip(results, batches) if isinstance(result, Exception) for i in batch]
+            raise EmbeddingRequestError(
+                f"{len(failures)} of {len(batches)} embedding batches failed; first error: {failures[0]}",
+                failed_indices,
+                getattr(failures[0], "status_code", None)
+            )
+        return np.vstack(results)
+
+    def _sync_runner(self) -> asyncio.AbstractEventLoop:
+        """Background event loop shared by every embed_sync call."""
+        with self._sessions_lock:
+            if self._sync_loop is None:
+                self._sync_loop = asyncio.new_event_loop()
+                self._sync_thread = threading.Thread(
+                    target=self._sync_loop.run_forever, name="openai-embeddings", daemon=True
+                )
+                self._sync_thread.start()
+            return self._sync_loop
+
+    def embed_sync(self, texts: Sequence[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Blocking wrapper around embed, usable from any thread, including inside a running event loop.
+
+        Calls run on one background loop, so they share its connection pool,
+        concurrency window and keep-alive connections.
+        """
+        return asyncio.run_coroutine_threadsafe(self.embed(texts, batch_size), self._sync_runner()).result()
+
+    async def aclose(self):
+        """Close the HTTP client of the running event loop."""
+        with self._sessions_lock:
+            session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session[0].aclose()
+
+    def close(self):
+        """Close the client used by embed_sync and stop its background loop."""
+        with self._sessions_lock:
+            loop, thread = self._sync_loop, self._sync_thread
+            self._sync_loop = self._sync_thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get client statistics."""
+        return dict(self.stats, model=self.model, max_concurrency=self.max_concurrency)
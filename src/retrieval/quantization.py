@@ -0,0 +1,263 @@
+"""
+Embedding compression with scalar int8 and product quantization.
+
+Quantizers are trained on a sample of unit-length embeddings, encode vectors
+to compact codes and score float queries directly against those codes
+(asymmetric distance), so a search only has to decode a short list of
+candidates at full precision.
+"""
+
+import os
+from typing import List, Dict, Any, Optional, Sequence
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUANTIZERS = ("int8", "pq")
+
+
+class ScalarQuantizer:
+    """Per-dimension 8-bit scalar quantization."""
+
+    kind = "int8"
+    code_dtype = np.int8
+
+    def __init__(self, dimension: int):
+        """
+        Initialize the quantizer.
+
+        Args:
+            dimension: Embedding dimension
+        """
+        self.dimension = dimension
+        self.code_size = dimension
+        self.vmin: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.vmin is not None
+
+    def train(self, vectors: np.ndarray):
+        """Learn the per-dimension value range from a sample."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.vmin = vectors.min(axis=0)
+        spread = vectors.max(axis=0) - self.vmin
+        self.scale = np.where(spread > 0, spread / 255.0, 1.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode vectors to int8 codes, clipping values outside the trained range."""
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.vmin) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate vectors from codes."""
+        return self.vmin + (codes.astype(np.float32) + 128.0) * self.scale
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products between float queries and encoded vectors.
+
+        Args:
+            queries: Query matrix of shape (num_queries, dimension)
+            codes: Code matrix of shape (num_vectors, code_size)
+
+        Returns:
+            Score matrix of shape (num_queries, num_vectors)
+        """
+        # q . (vmin + (c + 128) * scale) = q . (vmin + 128 * scale) + (q * scale) . c
+        bias = queries @ (self.vmin + 128.0 * self.scale)
+        return (queries * self.scale) @ codes.astype(np.float32).T + bias[:, None]
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"vmin": self.vmin, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.vmin = state["vmin"]
+        self.scale = state["scale"]
+
+
+class ProductQuantizer:
+    """Product quantization with one 8-bit codebook per sub-vector."""
+
+    kind = "pq"
+    code_dtype = np.uint8
+
+    def __init__(
+        self,
+        dimension: int,
+        num_subvectors: int = 16,
+        num_centroids: int = 256,
+        num_iterations: int = 20,
+        seed: int = 0
+    ):
+        """
+        Initialize the quantizer.
+
+        Args:
+            dimension: Embedding dimension; must be divisible by num_subvectors
+            num_subvectors: Number of sub-vectors, i.e. bytes per code
+            num_centroids: Centroids per codebook (at most 256)
+            num_iterations: k-means iterations when training
+            seed: Seed for centroid initialization
+        """
+        if dimension % num_subvectors:
+            raise ValueError(f"Dimension {dimension} is not divisible by {num_subvectors} sub-vectors")
+        if not 1 <= num_centroids <= 256:
+            raise ValueError("num_centroids must be between 1 and 256")
+
+        self.dimension = dimension
+        self.num_subvectors = num_subvectors
+        self.num_centroids = num_centroids
+        self.num_iterations = num_iterations
+        self.seed = seed
+        self.code_size = num_subvectors
+        self.subvector_size = dimension // num_subvectors
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Reshape to (num_subvectors, num_vectors, subvector_size)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors.reshape(len(vectors), self.num_subvectors, self.subvector_size).transpose(1, 0, 2)
+
+    @staticmethod
+    def _assign(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Index of the nearest centroid for each point."""
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * points @ centroids.T
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        """Learn one k-means codebook per sub-vector space."""
+        subspaces = self._split(vectors)
+        num_vectors = subspaces.shape[1]
+        num_centroids = min(self.num_centroids, num_vectors)
+        rng = np.random.default_rng(self.seed)
+
+        codebooks = np.zeros((self.num_subvectors, self.num_centroids, self.subvector_size), dtype=np.float32)
+        for j, points in enumerate(subspaces):
+            centroids = points[rng.choice(num_vectors, num_centroids, replace=False)].copy()
+            for _ in range(self.num_iterations):
+                assignment = self._assign(points, centroids)
+                counts = np.bincount(assignment, minlength=num_centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, points)
+                # Empty clusters keep their previous centroid
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks[j, :num_centroids] = centroids
+            # Unused slots repeat real centroids so every code decodes to something sensible
+            codebooks[j, num_centroids:] = centroids[0]
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode vectors to one centroid index per sub-vector."""
+        subspaces = self._split(vectors)
+        codes = np.empty((subspaces.shape[1], self.num_subvectors), dtype=np.uint8)
+        for j, points in enumerate(subspaces):
+            codes[:, j] = self._assign(points, self.codebooks[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate vectors from codes."""
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.num_subvectors)]
+        return np.concatenate(parts, axis=1)
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products using per-query lookup tables.
+
+        Args:
+            queries: Query matrix of shape (num_queries, dimension)
+            codes: Code matrix of shape (num_vectors, code_size)
+
+        Returns:
+            Score matrix of shape (num_queries, num_vectors)
+        """
+        # A lookup costs num_subvectors gathers per vector and query, decoding costs
+        # dimension gathers per vector once; decode when the query batch is large
+        if len(queries) > self.subvector_size:
+            return queries @ self.decode(codes).T
+
+        # tables[j, q, c] = inner product of query q's j-th sub-vector with centroid c
+        tables = np.einsum("jqd,jcd->jqc", self._split(queries), self.codebooks)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        # Gathering from contiguous per-sub-vector code rows is several times faster;
+        # transposing in cache-sized chunks keeps that transpose cheap
+        for start in range(0, len(codes), 4096):
+            codes_by_subvector = np.ascontiguousarray(codes[start:start + 4096].T)
+            chunk = scores[:, start:start + 4096]
+            for j in range(self.num_subvectors):
+                chunk += np.take(tables[j], codes_by_subvector[j], axis=1)
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.codebooks = state["codebooks"]
+
+
+def create_quantizer(kind: str, dimension: int, **kwargs):
+    """
+    Create an untrained quantizer.
+
+    Args:
+        kind: 'int8' for scalar quantization or 'pq' for product quantization
+        dimension: Embedding dimension
+        **kwargs: Extra ProductQuantizer arguments
+
+    Returns:
+        ScalarQuantizer or ProductQuantizer
+    """
+    if kind == "int8":
+        return ScalarQuantizer(dimension)
+    if kind == "pq":
+        return ProductQuantizer(dimension, **kwargs)
+    raise ValueError(f"Unsupported quantizer: {kind}")
+
+
+def save_quantizer(quantizer, path: str):
+    """Atomically write a trained quantizer to an .npz file."""
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, kind=quantizer.kind, dimension=quantizer.dimension, **quantizer.state())
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path: str):
+    """Load a quantizer written by save_quantizer."""
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files}
+    kind = str(state.pop("kind"))
+    dimension = int(state.pop("dimension"))
+    if kind == "pq":
+        codebooks = state["codebooks"]
+        quantizer = ProductQuantizer(dimension, num_subvectors=codebooks.shape[0], num_centroids=codebooks.shape[1])
+    else:
+        quantizer = create_quantizer(kind, dimension)
+    quantizer.load_state(state)
+    return quantizer
+
+
+def recall_at_k(approximate_ids: Sequence[Sequence[Any]], exact_ids: Sequence[Sequence[Any]], k: int) -> float:
+    """
+    Mean fraction of the exact top-k found in the approximate top-k.
+
+    Args:
+        approximate_ids: Approximate result IDs per query
+        exact_ids: Exact result IDs per query
+        k: Cutoff
+
+    Returns:
+        Recall@k averaged over queries
+    """
+    recalls: List[float] = []
+    for approximate, exact in zip(approximate_ids, exact_ids):
+        truth = set(list(exact)[:k])
+        if truth:
+            recalls.append(len(truth & set(list(approximate)[:k])) / len(truth))
+    return float(np.mean(recalls)) if recalls else 0.0
@@ -0,0 +1,129 @@
+"""
+Cross-request micro-batching for cross-encoder reranking.
+
+Concurrent requests each hold only a handful of (query, document) pairs,
+which leaves the model running many small forward passes.  The batcher
+collects pairs from all callers for a short window, runs them through the
+model together (padded to the longest pair in the batch) and hands each
+caller back its own scores.
+"""
+
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RerankBatcher:
+    """Background thread that merges concurrent rerank requests into shared forward passes."""
+
+    def __init__(self, reranker, max_wait_ms: float = 3.0, max_batch_size: int = 64):
+        """
+        Start the batching thread.
+
+        Args:
+            reranker: Object with a ``_process_pairs(queries, documents)`` method
+                returning one score per pair, e.g. Reranker
+            max_wait_ms: How long the first request in a batch waits for others
+            max_batch_size: Maximum pairs per forward pass
+        """
+        self.reranker = reranker
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.stats = {"requests": 0, "pairs": 0, "forward_passes": 0}
+
+        self._requests: "queue.Queue[Optional[Tuple[str, List[str], Future]]]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, documents: List[str]) -> Future:
+        """Queue a request; the future resolves to one score per document."""
+        future: Future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Rerank batcher is closed"))
+        elif not documents:
+            future.set_result([])
+        else:
+            self._requests.put((query, list(documents), future))
+        return future
+
+    def score(self, query: str, documents: List[str], timeout: Optional[float] = None) -> List[float]:
+        """Score documents for a query, blocking until its batch has run."""
+        return self.submit(query, documents).result(timeout)
+
+    async def ascore(self, query: str, documents: List[str]) -> List[float]:
+        """Score documents for a query without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(query, documents))
+
+    def _collect(self, first) -> List[Tuple[str, List[str], Future]]:
+        """Gather requests arriving within the window after the first, up to the batch size."""
+        batch = [first]
+        pairs = len(first[1])
+        deadline = time.monotonic() + self.max_wait
+        while pairs < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+            pairs += len(request[1])
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+
+            queries = [query for query, documents, _ in batch for _ in documents]
+            documents = [document for _, docs, _ in batch for document in docs]
+            try:
+                scores: List[float] = []
+                for start in range(0, len(documents), self.max_batch_size):
+                    scores.extend(self.reranker._process_pairs(
+                        queries[start:start + self.max_batch_size],
+                        documents[start:start + self.max_batch_size]
+                    ))
+                    self.stats["forward_passes"] += 1
+            except Exception as e:
+                logger.error(f"Error in batched reranking: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.stats["requests"] += len(batch)
+            self.stats["pairs"] += len(documents)
+            offset = 0
+            for _, docs, future in batch:
+                future.set_result(scores[offset:offset + len(docs)])
+                offset += len(docs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics."""
+        passes = self.stats["forward_passes"]
+        return {
+            **self.stats,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "mean_pairs_per_pass": self.stats["pairs"] / passes if passes else 0.0
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Stop the batching thread after queued requests are served."""
+        if not self._closed:
+            self._closed = True
+            self._requests.put(None)
+            self._thread.join(timeout)
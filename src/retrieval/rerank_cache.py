@@ -0,0 +1,171 @@
+"""
+Score cache for cross-encoder reranking.
+
+Scores are keyed by a hash of the normalized query and the chunk's ID and
+text digest, so repeated and paginated queries reuse earlier forward passes
+while an edited chunk can never return a stale score.  Entries expire after
+a TTL, the cache is bounded by entry count in LRU order, and every score for
+a chunk ID can be dropped explicitly when the chunk is updated or deleted.
+"""
+
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query."""
+    return _WHITESPACE.sub(" ", query).strip().lower()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """Thread-safe LRU of (query, chunk) relevance scores with a TTL."""
+
+    def __init__(self, max_entries: int = 100000, ttl_seconds: Optional[float] = 3600.0, namespace: str = ""):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached scores
+            ttl_seconds: Lifetime of a score; None keeps scores until evicted
+            namespace: Prefix mixed into query hashes, e.g. the model name, so
+                scores from different models never collide
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, float]]" = OrderedDict()
+        self._keys_by_chunk: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def _query_key(self, query: str) -> str:
+        return _digest(f"{self.namespace}\x00{normalize_query(query)}")
+
+    @staticmethod
+    def _chunk_keys(documents: Sequence[str], chunk_ids: Optional[Sequence[Optional[str]]]) -> List[Tuple[str, str]]:
+        ids = chunk_ids if chunk_ids is not None else [None] * len(documents)
+        return [(str(chunk_id) if chunk_id is not None else "", _digest(document))
+                for chunk_id, document in zip(ids, documents)]
+
+    def get_many(
+        self,
+        query: str,
+        documents: Sequence[str],
+        chunk_ids: Optional[Sequence[Optional[str]]] = None
+    ) -> Dict[int, float]:
+        """
+        Look up scores for a query against several chunks.
+
+        Args:
+            query: Search query
+            documents: Chunk texts
+            chunk_ids: Optional chunk IDs aligned with documents
+
+        Returns:
+            Mapping from index in ``documents`` to its cached score
+        """
+        query_key = self._query_key(query)
+        now = time.monotonic()
+        found: Dict[int, float] = {}
+        with self._lock:
+            for i, (chunk_id, text_digest) in enumerate(self._chunk_keys(documents, chunk_ids)):
+                key = (query_key, chunk_id, text_digest)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                score, expires_at = entry
+                if expires_at < now:
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[i] = score
+            self.hits += len(found)
+            self.misses += len(documents) - len(found)
+        return found
+
+    def put_many(
+        self,
+        query: str,
+        documents: Sequence[str],
+        scores: Sequence[float],
+        chunk_ids: Optional[Sequence[Optional[str]]] = None
+    ):
+        """Store scores for a query against several chunks."""
+        query_key = self._query_key(query)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else float("inf")
+        with self._lock:
+            for (chunk_id, text_digest), score in zip(self._chunk_keys(documents, chunk_ids), scores):
+                key = (query_key, chunk_id, text_digest)
+                self._entries[key] = (float(score), expires_at)
+                self._entries.move_to_end(key)
+                if chunk_id:
+                    self._keys_by_chunk.setdefault(chunk_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str, str]):
+        self._entries.pop(key, None)
+        chunk_id = key[1]
+        if chunk_id:
+            keys = self._keys_by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_chunk[chunk_id]
+
+    def invalidate_chunks(self, chunk_ids: Sequence[str]) -> int:
+        """
+        Drop every cached score for the given chunks.
+
+        Args:
+            chunk_ids: IDs of updated or deleted chunks
+
+        Returns:
+            Number of scores removed
+        """
+        removed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                for key in list(self._keys_by_chunk.get(str(chunk_id), ())):
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        """Drop every cached score."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_chunk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
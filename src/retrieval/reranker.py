@@ -2,14 +2,127 @@
 Reranking module for improving retrieval quality.
 """
 
+import math
 import torch
 import numpy as np
-from typing import List, Dict, Any, Optional, Union
+from scipy import stats
+from typing import List, Dict, Any, Optional, Union, Sequence, Tuple
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 import logging
 
+from .rerank_cache import RerankScoreCache
+from .rerank_batcher import RerankBatcher
+
 logger = logging.getLogger(__name__)
 
+# Queries with candidates of mixed relevance, used to compare int8 and fp32 rankings
+PARITY_SAMPLES = [
+    ("How do I reset my password?", [
+        "To reset your password, open Settings, choose Security and click Reset password.",
+        "Passwords must be at least twelve characters long and include a number.",
+        "Our office is closed on public holidays.",
+        "If you forgot your username, contact support with your account email.",
+        "The quarterly report is published on the first Monday of each month."
+    ]),
+    ("What are the side effects of ibuprofen?", [
+        "Common side effects of ibuprofen include stomach pain, nausea and heartburn.",
+        "Ibuprofen is a nonsteroidal anti-inflammatory drug used to treat pain and fever.",
+        "Take the tablets with food or milk to reduce stomach upset.",
+        "Paris is the capital and most populous city of France.",
+        "The library extends its opening hours during exam season."
+    ]),
+    ("How does retrieval-augmented generation work?", [
+        "Retrieval-augmented generation retrieves relevant passages and gives them to a language model as context.",
+        "A vector database stores embeddings and returns the nearest neighbours of a query.",
+        "Language models can hallucinate facts that are not in their training data.",
+        "Install the package with pip and import it in your project.",
+        "The recipe calls for two cups of flour and a pinch of salt."
+    ])
+]
+
+
+def configure_torch_threads(intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+    """
+    Set torch's CPU thread pools.
+    
+    Args:
+        intra_op_threads: Threads used inside a single operator (matmuls)
+        inter_op_threads: Threads used to run independent operators concurrently;
+            torch only accepts this before its first parallel operation
+    """
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads to {inter_op_threads}: {e}")
+
+
+def suggest_max_length(
+    pair_lengths: Sequence[int],
+    percentile: float = 95.0,
+    multiple_of: int = 8,
+    upper_bound: int = 512
+) -> int:
+    """
+    Truncation length covering most query-chunk pairs.
+    
+    Args:
+        pair_lengths: Token counts of sample (query, chunk) pairs
+        percentile: Share of pairs that should fit untruncated
+        multiple_of: Round up to a multiple of this, which suits CPU kernels
+        upper_bound: Model's maximum sequence length
+        
+    Returns:
+        Suggested max_length
+    """
+    if not len(pair_lengths):
+        return upper_bound
+    length = int(math.ceil(np.percentile(pair_lengths, percentile) / multiple_of) * multiple_of)
+    return max(multiple_of, min(length, upper_bound))
+
+
+def rank_parity_report(
+    reference_scores: Sequence[Sequence[float]],
+    candidate_scores: Sequence[Sequence[float]],
+    min_rank_correlation: float = 0.95
+) -> Dict[str, Any]:
+    """
+    Compare per-query rankings from a reference and a candidate model.
+    
+    Args:
+        reference_scores: Per query, the reference model's candidate scores
+        candidate_scores: Per query, the candidate model's scores for the same candidates
+        min_rank_correlation: Mean Spearman correlation the candidate must reach
+        
+    Returns:
+        Spearman and Kendall correlations, top-1 agreement, the largest score
+        difference and whether the threshold was met
+    """
+    spearman, kendall, top1, max_diff = [], [], [], 0.0
+    for reference, candidate in zip(reference_scores, candidate_scores):
+        reference = np.asarray(reference, dtype=np.float64)
+        candidate = np.asarray(candidate, dtype=np.float64)
+        max_diff = max(max_diff, float(np.abs(reference - candidate).max()))
+        top1.append(int(np.argmax(reference)) == int(np.argmax(candidate)))
+        if len(reference) < 2 or np.ptp(reference) == 0 or np.ptp(candidate) == 0:
+            continue
+        spearman.append(stats.spearmanr(reference, candidate).correlation)
+        kendall.append(stats.kendalltau(reference, candidate).correlation)
+    
+    mean_spearman = float(np.mean(spearman)) if spearman else 1.0
+    return {
+        "queries": len(top1),
+        "mean_spearman": mean_spearman,
+        "min_spearman": float(np.min(spearman)) if spearman else 1.0,
+        "mean_kendall": float(np.mean(kendall)) if kendall else 1.0,
+        "top1_agreement": float(np.mean(top1)) if top1 else 1.0,
+        "max_abs_score_diff": max_diff,
+        "threshold": min_rank_correlation,
+        "passed": bool(mean_spearman >= min_rank_correlation)
+    }
+
 
 class Reranker:
     """Rerank search results using cross-encoder models."""
@@ -18,7 +131,16 @@ class Reranker:
         self, 
         model_name: str = "BAAI/bge-reranker-large",
         device: Optional[str] = None,
-        max_length: int = 512
+        max_length: int = 512,
+        score_cache_size: int = 100000,
+        score_cache_ttl: Optional[float] = 3600.0,
+        batch_window_ms: Optional[float] = None,
+        max_batch_pairs: int = 64,
+        quantize_int8: bool = False,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+        parity_samples: Optional[List[Tuple[str, List[str]]]] = None,
+        min_rank_correlation: float = 0.95
     ):
         """
         Initialize reranker.
@@ -26,10 +148,33 @@ class Reranker:
         Args:
             model_name: Name of the reranking model
             device: Device to run the model on (auto-detect if None)
-            max_length: Maximum sequence length
+            max_length: Maximum sequence length; pairs are truncated to it, see
+                tune_max_length to fit it to the corpus
+            score_cache_size: Maximum cached (query, chunk) scores; 0 disables the cache
+            score_cache_ttl: Seconds a cached score stays valid
+            batch_window_ms: If set, merge pairs from concurrent requests that
+                arrive within this window into shared forward passes
+            max_batch_pairs: Maximum pairs per merged forward pass
+            quantize_int8: On CPU, quantize linear layers to int8 with dynamic
+                activation quantization, kept only if rankings match fp32
+            intra_op_threads: Torch threads per operator; torch default if None
+            inter_op_threads: Torch threads across operators; torch default if None
+            parity_samples: (query, candidates) pairs for the int8 parity check;
+                a built-in sample by default
+            min_rank_correlation: Mean Spearman correlation with fp32 rankings
+                the int8 model must reach
         """
         self.model_name = model_name
         self.max_length = max_length
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.quantized = False
+        self.rank_parity = None
+        self.score_cache = None
+        if score_cache_size:
+            self.score_cache = RerankScoreCache(
+                max_entries=score_cache_size, ttl_seconds=score_cache_ttl, namespace=model_name
+            )
         
         # Auto-detect device if not specified
         if device is None:
@@ -37,6 +182,8 @@ class Reranker:
         else:
             self.device = device
         
+        configure_torch_threads(intra_op_threads, inter_op_threads)
+        
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
             self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
@@ -46,13 +193,78 @@ class Reranker:
         except Exception as e:
             logger.error(f"Error initializing reranker: {e}")
             raise
+        
+        if quantize_int8:
+            self._quantize_int8(parity_samples or PARITY_SAMPLES, min_rank_correlation)
+        
+        self.batcher = None
+        if batch_window_ms:
+            self.batcher = RerankBatcher(self, max_wait_ms=batch_window_ms, max_batch_size=max_batch_pairs)
+    
+    def _quantize_int8(self, parity_samples: List[Tuple[str, List[str]]], min_rank_correlation: float):
+        """Swap in a dynamically quantized int8 model if its rankings match the fp32 model."""
+        if self.device != "cpu":
+            logger.warning(f"int8 dynamic quantization runs on CPU only; keeping fp32 on {self.device}")
+            return
+        
+        float_model = self.model
+        int8_model = torch.quantization.quantize_dynamic(float_model, {torch.nn.Linear}, dtype=torch.qint8)
+        int8_model.eval()
+        
+        reference, candidate = [], []
+        for query, documents in parity_samples:
+            reference.append(self._process_pairs([query] * len(documents), documents, model=float_model))
+            candidate.append(self._process_pairs([query] * len(documents), documents, model=int8_model))
+        self.rank_parity = rank_parity_report(reference, candidate, min_rank_correlation)
+        
+        if self.rank_parity["passed"]:
+            self.model = int8_model
+            self.quantized = True
+            logger.info(
+                f"Reranker quantized to int8 (mean Spearman {self.rank_parity['mean_spearman']:.4f}, "
+                f"top-1 agreement {self.rank_parity['top1_agreement']:.2f})"
+            )
+        else:
+            logger.warning(
+                f"int8 reranker failed the rank parity check (mean Spearman "
+                f"{self.rank_parity['mean_spearman']:.4f} < {min_rank_correlation}); keeping fp32"
+            )
+    
+    def tune_max_length(
+        self,
+        documents: List[str],
+        queries: Optional[List[str]] = None,
+        percentile: float = 95.0
+    ) -> int:
+        """
+        Fit the truncation length to the corpus so padding stops at real chunk sizes.
+        
+        Args:
+            documents: Sample of indexed chunks
+            queries: Sample of typical queries; a short placeholder by default
+            percentile: Share of pairs that should fit untruncated
+            
+        Returns:
+            The new max_length
+        """
+        queries = queries or ["typical search query"]
+        lengths = [
+            len(self.tokenizer(query, document, truncation=False)["input_ids"])
+            for document in documents
+            for query in queries
+        ]
+        model_limit = getattr(self.tokenizer, "model_max_length", 512)
+        self.max_length = suggest_max_length(lengths, percentile, upper_bound=min(model_limit, 512))
+        logger.info(f"Reranker max_length tuned to {self.max_length} from {len(lengths)} pairs")
+        return self.max_length
     
     def rerank(
         self, 
         query: str, 
         documents: List[str], 
         top_k: int = 5,
-        batch_size: int = 32
+        batch_size: int = 32,
+        chunk_ids: Optional[List[Optional[str]]] = None
     ) -> List[Dict[str, Any]]:
         """
         Rerank documents based on query relevance.
@@ -62,6 +274,8 @@ class Reranker:
             documents: List of documents to rerank
             top_k: Number of top documents to return
             batch_size: Batch size for processing
+            chunk_ids: Optional chunk IDs aligned with documents, used to key
+                and invalidate cached scores
             
         Returns:
             List of reranked documents with scores
@@ -71,7 +285,7 @@ class Reranker:
         
         try:
             scores = self._calculate_relevance_scores(
-                query, documents, batch_size
+                query, documents, batch_size, chunk_ids
             )
             
             # Sort documents by relevance score
@@ -97,43 +311,69 @@ class Reranker:
         self, 
         query: str, 
         documents: List[str], 
-        batch_size: int
+        batch_size: int,
+        chunk_ids: Optional[List[Optional[str]]] = None
     ) -> np.ndarray:
-        """Calculate relevance scores for query-document pairs."""
-        scores = []
+        """Calculate relevance scores for query-document pairs, scoring only cache misses."""
+        scores = np.empty(len(documents))
+        cached = self.score_cache.get_many(query, documents, chunk_ids) if self.score_cache else {}
+        for i, score in cached.items():
+            scores[i] = score
+        missing = [i for i in range(len(documents)) if i not in cached]
+        
+        # Process in batches; the batcher does its own splitting across requests
+        if self.batcher is not None:
+            batch_size = max(1, len(missing))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            batch_docs = [documents[i] for i in batch]
+            try:
+                batch_scores = self._process_batch(query, batch_docs, raise_errors=True)
+            except Exception as e:
+                logger.error(f"Error processing batch: {e}")
+                # Neutral scores for a failed batch, and never cached
+                scores[batch] = 0.5
+                continue
+            scores[batch] = batch_scores
+            if self.score_cache:
+                batch_ids = [chunk_ids[i] for i in batch] if chunk_ids is not None else None
+                self.score_cache.put_many(query, batch_docs, batch_scores, batch_ids)
+        
+        return scores
+    
+    def _process_pairs(self, queries: List[str], documents: List[str], model=None) -> List[float]:
+        """Score query-document pairs in one forward pass, padded to the longest pair."""
+        model = model if model is not None else self.model
+        
+        # Tokenize query-document pairs
+        inputs = self.tokenizer(
+            queries,
+            documents,
+            return_tensors='pt',
+            truncation=True,
+            max_length=self.max_length,
+            padding=True
+        )
         
-        # Process in batches
-        for i in range(0, len(documents), batch_size):
-            batch_docs = documents[i:i + batch_size]
-            batch_scores = self._process_batch(query, batch_docs)
-            scores.extend(batch_scores)
+        # Move to device
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
-        return np.array(scores)
+        # Calculate scores
+        with torch.no_grad():
+            outputs = model(**inputs)
+            scores = torch.softmax(outputs.logits, dim=1)[:, 1].cpu().numpy()
+        
+        return scores.tolist()
     
-    def _process_batch(self, query: str, documents: List[str]) -> List[float]:
-        """Process a batch of query-document pairs."""
+    def _process_batch(self, query: str, documents: List[str], raise_errors: bool = False) -> List[float]:
+        """Process a batch of query-document pairs, through the cross-request batcher if enabled."""
         try:
-            # Tokenize query-document pairs
-            inputs = self.tokenizer(
-                [query] * len(documents),
-                documents,
-                return_tensors='pt',
-                truncation=True,
-                max_length=self.max_length,
-                padding=True
-            )
-            
-            # Move to device
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Calculate scores
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                scores = torch.softmax(outputs.logits, dim=1)[:, 1].cpu().numpy()
-            
-            return scores.tolist()
-            
+            if self.batcher is not None:
+                return self.batcher.score(query, documents)
+            return self._process_pairs([query] * len(documents), documents)
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Error processing batch: {e}")
             # Return neutral scores if processing fails
             return [0.5] * len(documents)
@@ -162,9 +402,13 @@ class Reranker:
         
         # Extract documents for reranking
         documents = [result.get("document", "") for result in search_results]
+        chunk_ids = [
+            result.get("id") or result.get("vector_id") or (result.get("metadata") or {}).get("chunk_id")
+            for result in search_results
+        ]
         
         # Rerank documents
-        reranked_docs = self.rerank(query, documents, top_k, batch_size)
+        reranked_docs = self.rerank(query, documents, top_k, batch_size, chunk_ids)
         
         # Create mapping from document to original result
         doc_to_result = {result.get("document", ""): result for result in search_results}
@@ -186,13 +430,259 @@ class Reranker:
         
         return reranked_results
     
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Drop cached scores for updated or deleted chunks."""
+        return self.score_cache.invalidate_chunks(chunk_ids) if self.score_cache else 0
+    
+    def close(self):
+        """Stop the cross-request batcher."""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the reranking model."""
         return {
             "model_name": self.model_name,
             "device": self.device,
             "max_length": self.max_length,
-            "model_type": "cross_encoder"
+            "model_type": "cross_encoder",
+            "quantized": self.quantized,
+            "rank_parity": self.rank_parity,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "score_cache": self.score_cache.get_stats() if self.score_cache else None,
+            "batcher": self.batcher.get_stats() if self.batcher is not None else None
+        }
+
+
+class CascadeReranker:
+    """
+    Two-stage reranking: a cheap scorer prunes candidates, the cross-encoder scores survivors.
+    
+    The first stage is the cosine between query and document embeddings, taken
+    from the vector leg's scores where a result has one, or a small distilled
+    cross-encoder. Survivors are the candidates whose normalized first-stage
+    score is within ``margin`` of the best one, so a query with a clear winner
+    sends only ``top_k`` pairs to the expensive model while an ambiguous query
+    keeps up to ``max_candidates``.
+    """
+    
+    def __init__(
+        self,
+        reranker: Reranker,
+        embedding_generator=None,
+        prefilter: Optional[Reranker] = None,
+        margin: float = 0.3,
+        min_extra: int = 2,
+        max_candidates: Optional[int] = None
+    ):
+        """
+        Initialize the cascade.
+        
+        Args:
+            reranker: Expensive cross-encoder reranker for the second stage
+            embedding_generator: Generator used to fetch document embeddings
+                for the cosine first stage
+            prefilter: Small cross-encoder used as the first stage when no
+                embeddings are available
+            margin: Width of the survivor band in min-max normalized first-stage scores
+            min_extra: Candidates kept beyond top_k even for easy queries
+            max_candidates: Upper bound on survivors; no bound if None
+        """
+        self.reranker = reranker
+        self.embedding_generator = embedding_generator
+        self.prefilter = prefilter
+        self.margin = margin
+        self.min_extra = min_extra
+        self.max_candidates = max_candidates
+        self.model_name = reranker.model_name
+        self.stats = {"queries": 0, "candidates": 0, "second_stage_pairs": 0}
+    
+    def _first_stage_scores(
+        self,
+        query: str,
+        documents: List[str],
+        query_embedding: Optional[np.ndarray],
+        document_embeddings: Optional[np.ndarray],
+        similarities: Optional[List[Optional[float]]] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Cheap relevance scores, or None when no first stage is available.
+        
+        Known similarities (from the vector leg) are used as they are; only the
+        remaining documents are embedded. Scores that cannot be computed are NaN.
+        """
+        if query_embedding is not None:
+            scores = np.full(len(documents), np.nan, dtype=np.float32)
+            if similarities is not None:
+                scores[:] = [np.nan if similarity is None else similarity for similarity in similarities]
+            missing = np.flatnonzero(np.isnan(scores))
+            if len(missing) and (document_embeddings is not None or self.embedding_generator is not None):
+                if document_embeddings is not None:
+                    matrix = np.asarray(document_embeddings, dtype=np.float32)[missing]
+                else:
+                    matrix = np.asarray(self.embedding_generator.generate_embeddings(
+                        [documents[i] for i in missing], show_progress=False
+                    ), dtype=np.float32).reshape(len(missing), -1)
+                query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+                norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+                scores[missing] = matrix @ query_vector / np.clip(norms, 1e-12, None)
+            if not np.isnan(scores).all():
+                return scores
+        if self.prefilter is not None:
+            return self.prefilter._calculate_relevance_scores(query, documents, batch_size=64)
+        return None
+    
+    def select_candidates(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Indices of candidates that go to the second stage, best first.
+        
+        Args:
+            scores: First-stage scores
+            top_k: Number of results the caller needs
+            
+        Returns:
+            Survivor indices ordered by first-stage score
+        """
+        order = np.argsort(-scores, kind="stable")
+        spread = scores.max() - scores.min()
+        normalized = (scores[order] - scores.min()) / spread if spread > 0 else np.ones(len(scores))
+        keep = int(np.sum(normalized >= 1.0 - self.margin))
+        keep = max(keep, top_k + self.min_extra)
+        if self.max_candidates is not None:
+            keep = min(keep, max(self.max_candidates, top_k))
+        return order[:keep]
+    
+    def _survivors(
+        self,
+        query: str,
+        documents: List[str],
+        top_k: int,
+        query_embedding: Optional[np.ndarray],
+        document_embeddings: Optional[np.ndarray],
+        similarities: Optional[List[Optional[float]]] = None
+    ) -> np.ndarray:
+        """
+        Run the first stage and pick survivors.
+        
+        All candidates survive if the first stage fails; candidates it could not
+        score always survive.
+        """
+        try:
+            scores = self._first_stage_scores(query, documents, query_embedding, document_embeddings, similarities)
+        except Exception as e:
+            logger.error(f"Error in first-stage reranking: {e}")
+            scores = None
+        
+        if scores is None:
+            survivors = np.arange(len(documents))
+        else:
+            scored = np.flatnonzero(~np.isnan(scores))
+            unscored = np.flatnonzero(np.isnan(scores))
+            survivors = np.concatenate([scored[self.select_candidates(scores[scored], top_k)], unscored])
+        self.stats["queries"] += 1
+        self.stats["candidates"] += len(documents)
+        self.stats["second_stage_pairs"] += len(survivors)
+        return survivors
+    
+    def rerank(
+        self,
+        query: str,
+        documents: List[str],
+        top_k: int = 5,
+        batch_size: int = 32,
+        chunk_ids: Optional[List[Optional[str]]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        document_embeddings: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rerank documents, scoring only first-stage survivors with the cross-encoder.
+        
+        Args:
+            query: Search query
+            documents: List of documents to rerank
+            top_k: Number of top documents to return
+            batch_size: Batch size for the cross-encoder
+            chunk_ids: Optional chunk IDs aligned with documents
+            query_embedding: Query embedding for the cosine first stage
+            document_embeddings: Document embeddings; fetched from the embedding
+                generator if omitted
+            
+        Returns:
+            List of reranked documents with scores
+        """
+        if not documents:
+            return []
+        
+        survivors = self._survivors(query, documents, top_k, query_embedding, document_embeddings)
+        return self.reranker.rerank(
+            query,
+            [documents[i] for i in survivors],
+            top_k=top_k,
+            batch_size=batch_size,
+            chunk_ids=[chunk_ids[i] for i in survivors] if chunk_ids is not None else None
+        )
+    
+    def rerank_with_metadata(
+        self,
+        query: str,
+        search_results: List[Dict[str, Any]],
+        top_k: int = 5,
+        batch_size: int = 32,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rerank search results while preserving metadata.
+        
+        Args:
+            query: Search query
+            search_results: List of search results with metadata
+            top_k: Number of top results to return
+            batch_size: Batch size for the cross-encoder
+            query_embedding: Query embedding for the cosine first stage; results
+                from the vector leg reuse their ``vector_score`` and only the
+                others are embedded
+            
+        Returns:
+            List of reranked results with preserved metadata
+        """
+        if not search_results:
+            return []
+        
+        documents = [result.get("document", "") for result in search_results]
+        # vector_score is the cosine distance reported by the vector store
+        similarities = [
+            1.0 - result["vector_score"] if result.get("vector_score") is not None else None
+            for result in search_results
+        ]
+        survivors = self._survivors(query, documents, top_k, query_embedding, None, similarities)
+        return self.reranker.rerank_with_metadata(
+            query, [search_results[i] for i in survivors], top_k=top_k, batch_size=batch_size
+        )
+    
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """Drop cached scores for updated or deleted chunks."""
+        return self.reranker.invalidate_chunks(chunk_ids)
+    
+    def close(self):
+        """Stop the batchers of both cross-encoder stages."""
+        self.reranker.close()
+        if self.prefilter is not None:
+            self.prefilter.close()
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """Get information about the reranking models."""
+        candidates = self.stats["candidates"]
+        return {
+            **self.reranker.get_model_info(),
+            "model_type": "cascade",
+            "first_stage": "embedding_cosine" if self.embedding_generator is not None else (
+                self.prefilter.model_name if self.prefilter is not None else None
+            ),
+            "margin": self.margin,
+            "stats": dict(self.stats),
+            "second_stage_fraction": self.stats["second_stage_pairs"] / candidates if candidates else 0.0
         }
 
 
@@ -0,0 +1,42 @@
+"""
+Shared tiktoken encodings.
+
+Both the embedding client, which sizes requests, and the context packer,
+which fills prompt budgets, count tokens with the same per-model encoding.
+Encodings are loaded once per process and fall back to length estimates
+when tiktoken or its encoding files are unavailable.
+"""
+
+from functools import lru_cache
+import logging
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str):
+    """
+    Tokenizer for a model, loaded once per process.
+
+    Returns:
+        A tiktoken encoding, or None when tiktoken or its encoding files are
+        unavailable, in which case token counts are estimated from length
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Non-OpenAI models: cl100k is a close enough proxy for budgeting
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; estimate from length when offline
+        logger.warning(f"Could not load tiktoken encoding for {model_name}: {e}")
+        return None
@@ -4,15 +4,20 @@ Vector store implementation supporting multiple backends.
 
 import os
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Sequence, Deque
 import numpy as np
 import chromadb
 from chromadb.config import Settings
 import pinecone
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import Distance, VectorParams, Batch
 import logging
 
+from .local_index import FaissIndex
+from .memmap_store import MemmapVectorStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,6 +42,10 @@ class VectorStore:
             self._init_pinecone(**kwargs)
         elif vector_db_type == "qdrant":
             self._init_qdrant(**kwargs)
+        elif vector_db_type == "faiss":
+            self._init_faiss(persist_directory, **kwargs)
+        elif vector_db_type == "memmap":
+            self._init_memmap(persist_directory, **kwargs)
         else:
             raise ValueError(f"Unsupported vector database type: {vector_db_type}")
     
@@ -96,6 +105,32 @@ class VectorStore:
                 logger.error(f"Error creating Qdrant collection: {create_error}")
                 raise
     
+    def _init_faiss(self, persist_directory: Optional[str], **index_kwargs):
+        """Initialize the in-process FAISS index."""
+        try:
+            self.collection = FaissIndex(
+                persist_directory=persist_directory,
+                collection_name=self.collection_name,
+                **index_kwargs
+            )
+            logger.info(f"FAISS index initialized with collection: {self.collection_name}")
+        except Exception as e:
+            logger.error(f"Error initializing FAISS index: {e}")
+            raise
+    
+    def _init_memmap(self, persist_directory: str, **store_kwargs):
+        """Initialize the memory-mapped embedding store."""
+        try:
+            self.collection = MemmapVectorStore(
+                persist_directory=persist_directory,
+                collection_name=self.collection_name,
+                **store_kwargs
+            )
+            logger.info(f"Memmap store initialized with collection: {self.collection_name}")
+        except Exception as e:
+            logger.error(f"Error initializing memmap store: {e}")
+            raise
+    
     def add_documents(
         self, 
         documents: List[str], 
@@ -113,64 +148,141 @@ class VectorStore:
         if metadatas is None:
             metadatas = [{} for _ in documents]
         
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        
         try:
             if self.vector_db_type == "chroma":
-                return self._add_to_chroma(documents, embeddings, metadatas, ids)
-            elif self.vector_db_type == "pinecone":
-                return self._add_to_pinecone(documents, embeddings, metadatas, ids)
-            elif self.vector_db_type == "qdrant":
-                return self._add_to_qdrant(documents, embeddings, metadatas, ids)
+                # Chroma takes the whole call at once
+                self._write_batch(ids, documents, embeddings, metadatas)
+            else:
+                batch_size = 100
+                for i in range(0, len(ids), batch_size):
+                    self._write_batch(
+                        ids[i:i + batch_size],
+                        documents[i:i + batch_size],
+                        embeddings[i:i + batch_size],
+                        metadatas[i:i + batch_size]
+                    )
+            return ids
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
             raise
     
+    def bulk_ingest(
+        self,
+        chunks: Iterable[Tuple[Optional[Sequence[str]], Sequence[str], np.ndarray, Optional[Sequence[Dict[str, Any]]]]],
+        batch_size: int = 256,
+        max_in_flight: int = 4
+    ) -> int:
+        """
+        Stream documents into the store with bounded pipelining.
+        
+        Chunks are consumed lazily and split into batches that are written
+        concurrently, with at most ``max_in_flight`` batches outstanding, so
+        peak memory stays flat however large the ingest is. Batches are
+        numpy views of each chunk's embedding matrix; the in-process
+        backends take them as they are and the remote backends convert only
+        one batch at a time for their wire format.
+        
+        Args:
+            chunks: Iterable of (ids, texts, embeddings, metadatas) chunks;
+                ids and metadatas may be None
+            batch_size: Documents per backend write
+            max_in_flight: Maximum number of batches being written at once
+            
+        Returns:
+            Number of documents written
+        """
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        in_flight: Deque[Future] = deque()
+        written = 0
+        
+        try:
+            for ids, documents, embeddings, metadatas in chunks:
+                if ids is None:
+                    ids = [str(uuid.uuid4()) for _ in documents]
+                if metadatas is None:
+                    metadatas = [{} for _ in documents]
+                # No copy when the producer already hands over float32
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+                if not (len(ids) == len(documents) == len(embeddings) == len(metadatas)):
+                    raise ValueError("ids, texts, embeddings and metadatas must have the same length")
+                
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    # Wait for the oldest batch before exceeding the in-flight window
+                    if len(in_flight) >= max_in_flight:
+                        written += in_flight.popleft().result()
+                    in_flight.append(executor.submit(
+                        self._write_batch,
+                        ids[start:end],
+                        documents[start:end],
+                        embeddings[start:end],
+                        metadatas[start:end]
+                    ))
+            
+            while in_flight:
+                written += in_flight.popleft().result()
+            self.flush()
+            
+            logger.info(f"Bulk ingested {written} documents into {self.vector_db_type}")
+            return written
+        except Exception as e:
+            for future in in_flight:
+                future.cancel()
+            logger.error(f"Error during bulk ingest after {written} documents: {e}")
+            raise
+        finally:
+            executor.shutdown(wait=True)
+    
+    def _write_batch(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: np.ndarray,
+        metadatas: Sequence[Dict[str, Any]]
+    ) -> int:
+        """Write one batch to the backend and return its size."""
+        if self.vector_db_type == "chroma":
+            self._add_to_chroma(documents, embeddings, metadatas, ids)
+        elif self.vector_db_type == "pinecone":
+            self._add_to_pinecone(documents, embeddings, metadatas, ids)
+        elif self.vector_db_type == "qdrant":
+            self._add_to_qdrant(documents, embeddings, metadatas, ids)
+        elif self.vector_db_type in ("faiss", "memmap"):
+            self.collection.add(list(documents), embeddings, list(metadatas), list(ids))
+        return len(ids)
+    
     def _add_to_chroma(self, documents, embeddings, metadatas, ids):
         """Add documents to ChromaDB."""
         self.collection.add(
-            documents=documents,
+            documents=list(documents),
             embeddings=embeddings.tolist(),
-            metadatas=metadatas,
-            ids=ids
+            # Chroma rejects empty metadata dicts but accepts None
+            metadatas=[metadata or None for metadata in metadatas],
+            ids=list(ids)
         )
         return ids
     
     def _add_to_pinecone(self, documents, embeddings, metadatas, ids):
-        """Add documents to Pinecone."""
-        vectors = []
-        for i, (doc, embedding, metadata, doc_id) in enumerate(zip(documents, embeddings, metadatas, ids)):
-            vectors.append({
-                "id": doc_id,
-                "values": embedding.tolist(),
-                "metadata": {**metadata, "text": doc}
-            })
-        
-        # Upsert in batches
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            self.collection.upsert(vectors=batch)
-        
+        """Add one batch of documents to Pinecone."""
+        vectors = [
+            (doc_id, values, {**metadata, "text": doc})
+            for doc, values, metadata, doc_id in zip(documents, embeddings.tolist(), metadatas, ids)
+        ]
+        self.collection.upsert(vectors=vectors)
         return ids
     
     def _add_to_qdrant(self, documents, embeddings, metadatas, ids):
-        """Add documents to Qdrant."""
-        points = []
-        for i, (doc, embedding, metadata, doc_id) in enumerate(zip(documents, embeddings, metadatas, ids)):
-            points.append(PointStruct(
-                id=doc_id,
-                vector=embedding.tolist(),
-                payload={**metadata, "text": doc}
-            ))
-        
-        # Insert in batches
-        batch_size = 100
-        for i in range(0, len(points), batch_size):
-            batch = points[i:i + batch_size]
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=batch
+        """Add one batch of documents to Qdrant."""
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=Batch(
+                ids=list(ids),
+                vectors=embeddings.tolist(),
+                payloads=[{**metadata, "text": doc} for doc, metadata in zip(documents, metadatas)]
             )
-        
+        )
         return ids
     
     def search(
@@ -180,6 +292,8 @@ class VectorStore:
         filter_metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Search for similar documents."""
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        
         try:
             if self.vector_db_type == "chroma":
                 return self._search_chroma(query_embedding, n_results, filter_metadata)
@@ -187,10 +301,40 @@ class VectorStore:
                 return self._search_pinecone(query_embedding, n_results, filter_metadata)
             elif self.vector_db_type == "qdrant":
                 return self._search_qdrant(query_embedding, n_results, filter_metadata)
+            elif self.vector_db_type in ("faiss", "memmap"):
+                return self.collection.search(query_embedding, n_results, filter_metadata)
         except Exception as e:
             logger.error(f"Error searching: {e}")
             raise
     
+    def batch_search(
+        self, 
+        query_embeddings: np.ndarray, 
+        n_results: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar documents for several queries in one round trip."""
+        query_embeddings = np.asarray(query_embeddings)
+        if len(query_embeddings) == 0:
+            return []
+        
+        try:
+            if self.vector_db_type == "chroma":
+                return self._batch_search_chroma(query_embeddings, n_results, filter_metadata)
+            elif self.vector_db_type == "qdrant":
+                return self._batch_search_qdrant(query_embeddings, n_results, filter_metadata)
+            elif self.vector_db_type in ("faiss", "memmap"):
+                return self.collection.batch_search(query_embeddings, n_results, filter_metadata)
+            else:
+                # Pinecone has no multi-vector query; fall back to one call per query
+                return [
+                    self.search(query_embedding, n_results, filter_metadata)
+                    for query_embedding in query_embeddings
+                ]
+        except Exception as e:
+            logger.error(f"Error in batch search: {e}")
+            raise
+    
     def _search_chroma(self, query_embedding, n_results, filter_metadata):
         """Search in ChromaDB."""
         where_clause = filter_metadata if filter_metadata else None
@@ -208,6 +352,26 @@ class VectorStore:
             "ids": results["ids"][0] if results["ids"] else []
         }
     
+    def _batch_search_chroma(self, query_embeddings, n_results, filter_metadata):
+        """Search in ChromaDB with all query embeddings in a single request."""
+        where_clause = filter_metadata if filter_metadata else None
+        
+        results = self.collection.query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_results,
+            where=where_clause
+        )
+        
+        batch_results = []
+        for i in range(len(query_embeddings)):
+            batch_results.append({
+                "documents": results["documents"][i] if results["documents"] else [],
+                "metadatas": results["metadatas"][i] if results["metadatas"] else [],
+                "distances": results["distances"][i] if results["distances"] else [],
+                "ids": results["ids"][i] if results["ids"] else []
+            })
+        return batch_results
+    
     def _search_pinecone(self, query_embedding, n_results, filter_metadata):
         """Search in Pinecone."""
         results = self.collection.query(
@@ -262,6 +426,56 @@ class VectorStore:
             "ids": ids
         }
     
+    def _batch_search_qdrant(self, query_embeddings, n_results, filter_metadata):
+        """Search in Qdrant with all query embeddings in a single request."""
+        # search_batch and SearchRequest were removed in newer clients in favour of the query API
+        if hasattr(self.client, "search_batch"):
+            from qdrant_client.models import SearchRequest
+            requests = [
+                SearchRequest(
+                    vector=query_embedding.tolist(),
+                    limit=n_results,
+                    filter=filter_metadata,
+                    with_payload=True
+                )
+                for query_embedding in query_embeddings
+            ]
+            batch = self.client.search_batch(
+                collection_name=self.collection_name,
+                requests=requests
+            )
+        else:
+            from qdrant_client.models import QueryRequest
+            requests = [
+                QueryRequest(
+                    query=query_embedding.tolist(),
+                    limit=n_results,
+                    filter=filter_metadata,
+                    with_payload=True
+                )
+                for query_embedding in query_embeddings
+            ]
+            batch = [
+                response.points
+                for response in self.client.query_batch_points(
+                    collection_name=self.collection_name,
+                    requests=requests
+                )
+            ]
+        
+        batch_results = []
+        for results in batch:
+            batch_results.append({
+                "documents": [result.payload.get("text", "") for result in results],
+                "metadatas": [
+                    {k: v for k, v in result.payload.items() if k != "text"}
+                    for result in results
+                ],
+                "distances": [1 - result.score for result in results],
+                "ids": [str(result.id) for result in results]
+            })
+        return batch_results
+    
     def delete_documents(self, ids: List[str]) -> bool:
         """Delete documents by IDs."""
         try:
@@ -274,11 +488,23 @@ class VectorStore:
                     collection_name=self.collection_name,
                     points_selector=ids
                 )
+            elif self.vector_db_type in ("faiss", "memmap"):
+                self.collection.delete(ids)
             return True
         except Exception as e:
             logger.error(f"Error deleting documents: {e}")
             return False
     
+    def flush(self):
+        """Persist buffered writes of the in-process FAISS index."""
+        if self.vector_db_type == "faiss":
+            self.collection.flush()
+    
+    def close(self):
+        """Persist outstanding writes and release in-process backends."""
+        if self.vector_db_type in ("faiss", "memmap"):
+            self.collection.close()
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection."""
         try:
@@ -291,6 +517,8 @@ class VectorStore:
             elif self.vector_db_type == "qdrant":
                 info = self.client.get_collection(self.collection_name)
                 return {"count": info.points_count, "type": "qdrant"}
+            elif self.vector_db_type in ("faiss", "memmap"):
+                return {**self.collection.get_stats(), "type": self.vector_db_type}
         except Exception as e:
             logger.error(f"Error getting collection info: {e}")
             return {"count": 0, "type": self.vector_db_type, "error": str(e)}
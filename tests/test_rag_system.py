@@ -6,21 +6,51 @@ import pytest
 import os
 import tempfile
 import shutil
-from unittest.mock import Mock, patch
+import time
+import threading
+import queue
+import json
+import asyncio
+import importlib.util
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, AsyncMock, patch
 import sys
 from pathlib import Path
 
-# Add src to path
-sys.path.append(str(Path(__file__).parent.parent / "src"))
+# Add the repository root to path so src is importable as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from generation.rag_generator import RAGGenerator
-from generation.llm_manager import LLMManager
-from generation.prompt_manager import PromptManager
-from retrieval.embedding_generator import EmbeddingGenerator
-from retrieval.vector_store import VectorStore
-from retrieval.hybrid_search import HybridRetriever
-from data_processing.document_processor import DocumentProcessor
-from evaluation.rag_evaluator import RAGEvaluator
+from src.generation.rag_generator import RAGGenerator
+from src.generation.llm_manager import LLMManager, CircuitBreaker
+from src.generation.prompt_manager import PromptManager
+from src.generation.semantic_cache import SemanticResponseCache
+from src.generation.context_packer import ContextPacker
+from src.retrieval.embedding_generator import EmbeddingGenerator, plan_token_batches
+from src.retrieval.embedding_pool import EmbeddingWorkerPool
+from src.retrieval.onnx_embedder import OnnxEmbedder, ONNXRUNTIME_AVAILABLE
+from src.retrieval.openai_embedding_client import AsyncOpenAIEmbeddingClient, EmbeddingRequestError, TokenRateLimiter
+from src.retrieval.vector_store import VectorStore
+from src.retrieval.hybrid_search import HybridRetriever
+from src.retrieval.bm25_index import BM25Index
+from src.retrieval.fusion import ResultFusion
+from src.retrieval.local_index import FaissIndex, FAISS_AVAILABLE
+from src.retrieval.memmap_store import MemmapVectorStore
+from src.retrieval.quantization import ScalarQuantizer, ProductQuantizer, recall_at_k
+from src.retrieval.metadata_index import MetadataIndex
+from src.retrieval.rerank_cache import RerankScoreCache
+from src.retrieval.rerank_batcher import RerankBatcher
+from src.retrieval.reranker import Reranker, CascadeReranker, rank_parity_report
+from src.retrieval.dimension_reduction import PCAReducer, MatryoshkaReducer, recall_vs_dimension, choose_dimension
+from src.retrieval.embedding_cache import SegmentedLRUCache, PersistentEmbeddingCache
+from src.data_processing.document_processor import DocumentProcessor
+from src.evaluation.rag_evaluator import RAGEvaluator
+
+# Exporting needs onnx and torch on top of onnxruntime
+ONNX_EXPORT_AVAILABLE = ONNXRUNTIME_AVAILABLE and all(
+    importlib.util.find_spec(name) is not None for name in ("onnx", "torch")
+)
 
 
 class TestDocumentProcessor:
@@ -103,6 +133,312 @@ class TestEmbeddingGenerator:
         assert "cache_size" in stats
         assert "max_cache_size" in stats
         assert "model_name" in stats
+    
+    def test_memory_cache_is_bounded_by_bytes_only(self):
+        """Test that the in-memory cache has no entry cap unless one is set."""
+        assert self.embedding_generator.cache.max_entries is None
+        
+        generator = EmbeddingGenerator(model_name="all-MiniLM-L6-v2", cache_max_bytes=1 << 20)
+        texts = [f"Sentence {i}" for i in range(2000)]
+        generator.generate_embeddings(texts, show_progress=False)
+        
+        assert len(generator.cache) == 2000
+        assert generator.cache.nbytes <= 1 << 20
+
+    def test_failed_encode_is_not_cached(self):
+        """Test that zero-vector fallbacks from a failed encode are retried on the next call."""
+        text = "Transient failure"
+        with patch.object(self.embedding_generator, "_encode_batches", side_effect=RuntimeError("boom")):
+            assert not self.embedding_generator.generate_embeddings(text).any()
+
+        assert len(self.embedding_generator.cache) == 0
+        assert self.embedding_generator.generate_embeddings(text).any()
+
+    def test_mixed_lengths_and_duplicates_keep_order(self):
+        """Test that token-budget batching returns embeddings in input order."""
+        texts = ["Short.", "A much longer sentence " * 20, "Short.", "Medium length sentence here."]
+        embeddings = self.embedding_generator.generate_embeddings(texts)
+        
+        assert np.allclose(embeddings[0], embeddings[2])
+        for text, embedding in zip(texts, embeddings):
+            single = self.embedding_generator.model.encode([text], convert_to_numpy=True)[0]
+            assert np.allclose(embedding, single, atol=1e-4)
+    
+    def test_plan_token_batches(self):
+        """Test that batches group similar lengths under the token budget."""
+        batches = plan_token_batches([5, 100, 20, 100, 3], token_budget=200, max_batch_size=3)
+        
+        assert [batch.tolist() for batch in batches] == [[1, 3], [2, 0, 4]]
+    
+    def test_unfitted_pca_keeps_full_width_until_fitted(self):
+        """Test that an unfitted PCA reducer is skipped, then saved and reloaded once fitted."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            reducer_path = os.path.join(temp_dir, "pca.npz")
+            generator = EmbeddingGenerator(
+                model_name="all-MiniLM-L6-v2", reduction_method="pca", reduced_dimension=2,
+                reducer_path=reducer_path
+            )
+            full_width = generator.get_embedding_dimension()
+            assert not generator.reducer_fitted
+            assert generator.generate_embeddings("Before fitting.").shape[1] == full_width
+            
+            texts = [f"Chunk {i} " + "word " * i for i in range(10)]
+            generator.fit_dimension_reducer(texts)
+            assert generator.generate_embeddings(texts).shape == (10, 2)
+            assert generator.get_embedding_dimension() == 2
+            
+            reloaded = EmbeddingGenerator(
+                model_name="all-MiniLM-L6-v2", reduction_method="pca", reducer_path=reducer_path
+            )
+            assert reloaded.reducer_fitted
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestEmbeddingWorkerPool:
+    """Test multi-process embedding generation."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.pool = EmbeddingWorkerPool("all-MiniLM-L6-v2", num_workers=2, threads_per_worker=1)
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        self.pool.close()
+    
+    def test_matches_in_process_encoding(self):
+        """Test that pooled embeddings match single-process ones in input order."""
+        texts = [f"Sentence number {i} about retrieval." for i in range(20)]
+        batches = [np.arange(10, 20), np.arange(0, 10)]
+        
+        pooled = self.pool.encode(texts, batches=batches)
+        expected = EmbeddingGenerator(model_name="all-MiniLM-L6-v2").model.encode(texts, convert_to_numpy=True)
+        
+        assert pooled.shape == expected.shape
+        assert np.allclose(pooled, expected, atol=1e-4)
+        assert self.pool.get_stats()["encoded_texts"] == 20
+    
+    def test_concurrent_calls_and_dead_worker_replacement(self):
+        """Test that calls from several threads complete and a killed worker is replaced."""
+        texts = [f"Sentence number {i} about retrieval." for i in range(40)]
+        expected = self.pool.encode(texts, batch_size=4)
+        
+        self.pool._processes[0].kill()
+        self.pool._processes[0].join()
+        deadline = time.monotonic() + 60
+        while self.pool.get_stats()["restarts"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        
+        results = [None] * 4
+        def encode(slot):
+            results[slot] = self.pool.encode(texts, batch_size=3)
+        threads = [threading.Thread(target=encode, args=(slot,)) for slot in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert all(np.allclose(result, expected, atol=1e-4) for result in results)
+        stats = self.pool.get_stats()
+        assert stats["restarts"] == 1 and stats["alive_workers"] == 2 and stats["failed"] is None
+    
+    def test_worker_death_fails_unclaimed_batches(self):
+        """Test that a batch whose claim never arrived is failed when a worker dies."""
+        waiter = queue.Queue()
+        with self.pool._lock:
+            self.pool._waiters[-1] = waiter
+        
+        self.pool._processes[0].kill()
+        
+        assert "exited" in waiter.get(timeout=30)
+        assert -1 not in self.pool._waiters
+    
+    def test_generator_falls_back_when_pool_fails(self):
+        """Test that a failed pool leaves encoding to the in-process model."""
+        generator = EmbeddingGenerator(model_name="all-MiniLM-L6-v2")
+        generator.worker_pool = self.pool
+        texts = ["first text", "second text"]
+        expected = generator.model.encode(texts, convert_to_numpy=True)
+        
+        self.pool.close()
+        
+        assert self.pool.get_stats()["failed"] == "pool closed"
+        assert np.allclose(generator.generate_embeddings(texts), expected, atol=1e-4)
+
+
+class _StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """OpenAI-style /embeddings stub: rate-limits each batch once, fails batches containing 'bad'."""
+    
+    seen = set()
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"]
+        if any("bad" in text for text in texts):
+            self._reply(500, {"error": {"message": "server error"}})
+        elif tuple(texts) not in self.seen:
+            self.seen.add(tuple(texts))
+            self._reply(429, {"error": {"message": "rate limited"}}, {"Retry-After": "0"})
+        else:
+            data = [{"index": i, "embedding": [float(len(text)), float(i)]} for i, text in enumerate(texts)]
+            self._reply(200, {"data": list(reversed(data))})
+    
+    def _reply(self, status, payload, headers=None):
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+    
+    def log_message(self, *args):
+        pass
+
+
+class TestOpenAIEmbeddingClient:
+    """Test the async OpenAI embedding client against a local stub server."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        _StubEmbeddingHandler.seen = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubEmbeddingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = AsyncOpenAIEmbeddingClient(
+            "test-key",
+            base_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+            batch_size=3,
+            max_concurrency=2,
+            max_retries=2,
+            backoff_base=0.01
+        )
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_embeds_in_order_after_rate_limits(self):
+        """Test that rate-limited batches are retried and results keep input order."""
+        texts = ["a" * n for n in range(1, 11)]
+        embeddings = asyncio.run(self.client.embed(texts))
+        
+        assert embeddings.shape == (10, 2)
+        assert embeddings[:, 0].tolist() == [float(n) for n in range(1, 11)]
+        assert self.client.get_stats()["retries"] == 4
+    
+    def test_failed_batches_raise(self):
+        """Test that a failing batch raises with its indices instead of returning zeros."""
+        texts = ["ok one", "ok two", "ok three", "bad four", "ok five"]
+        
+        with pytest.raises(EmbeddingRequestError) as error:
+            self.client.embed_sync(texts)
+        
+        assert error.value.failed_indices == [3, 4]
+        assert error.value.status_code == 500
+    
+    def test_rate_limiter_paces_tokens(self):
+        """Test that the token bucket delays requests beyond the per-minute quota."""
+        limiter = TokenRateLimiter(tokens_per_minute=600)
+        
+        async def spend():
+            await limiter.acquire(600)
+            start = time.monotonic()
+            await limiter.acquire(5)
+            return time.monotonic() - start
+        
+        assert asyncio.run(spend()) >= 0.4
+    
+    def test_rate_limiter_shared_across_threads(self):
+        """Test that concurrent reservations from several threads never overspend the bucket."""
+        limiter = TokenRateLimiter(tokens_per_minute=6000)
+        delays = []
+        threads = [threading.Thread(target=lambda: delays.append(limiter.reserve(100))) for _ in range(80)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 8000 tokens reserved from a full 6000 bucket: the last caller waits for 2000 tokens
+        assert max(delays) == pytest.approx(20.0, abs=0.5)
+        assert sorted(delays)[59] == pytest.approx(0.0, abs=0.5)
+    
+    def test_sync_calls_share_one_client(self):
+        """Test that sync calls from several threads and from a running loop reuse one HTTP client."""
+        texts = ["ok one", "ok two", "ok three"]
+        threads = [threading.Thread(target=self.client.embed_sync, args=(texts,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        async def from_running_loop():
+            return self.client.embed_sync(texts)
+        
+        assert asyncio.run(from_running_loop()).shape == (3, 2)
+        assert len(self.client._sessions) == 1
+        
+        self.client.close()
+        assert not self.client._sessions
+
+
+@pytest.mark.skipif(not ONNXRUNTIME_AVAILABLE, reason="onnxruntime not installed")
+class TestOnnxEmbedder:
+    """Test ONNX export and int8 inference of local embedding models."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir)
+    
+    def _write_export_config(self, **overrides):
+        config = {
+            "source_model": "all-MiniLM-L6-v2", "quantize": True, "opset": 14, "model_file": "model_int8.onnx",
+            "input_names": ["input_ids", "attention_mask"], "max_seq_length": 128, "dimension": 8,
+            "pooling": "mean", "normalize": True, "parity": {"passed": True, "min_cosine": 0.999}
+        }
+        config.update(overrides)
+        with open(os.path.join(self.temp_dir, "embedder_config.json"), "w") as f:
+            json.dump(config, f)
+    
+    def test_export_reused_only_with_matching_settings(self):
+        """Test that a changed quantize flag invalidates the export and the cache namespace follows the runtime."""
+        self._write_export_config()
+        generator = EmbeddingGenerator(model_name="all-MiniLM-L6-v2", onnx_model_dir=self.temp_dir)
+        assert isinstance(generator.model, OnnxEmbedder)
+        assert generator.cache_namespace == "all-MiniLM-L6-v2@onnx-int8"
+        
+        with patch("src.retrieval.embedding_generator.export_onnx_model", side_effect=RuntimeError("no onnx")) as export:
+            float_generator = EmbeddingGenerator(
+                model_name="all-MiniLM-L6-v2", onnx_model_dir=self.temp_dir, onnx_quantize=False
+            )
+        
+        assert export.call_args.kwargs["quantize"] is False
+        assert not isinstance(float_generator.model, OnnxEmbedder)
+        assert float_generator.cache_namespace == "all-MiniLM-L6-v2"
+    
+    @pytest.mark.skipif(not ONNX_EXPORT_AVAILABLE, reason="onnx and torch are needed to export")
+    def test_quantized_export_passes_parity(self):
+        """Test that the int8 graph stays within the cosine tolerance of the float model."""
+        generator = EmbeddingGenerator(model_name="all-MiniLM-L6-v2", onnx_model_dir=self.temp_dir)
+        
+        assert isinstance(generator.model, OnnxEmbedder)
+        assert generator.model.parity["passed"]
+        assert generator.get_cache_stats()["runtime"] == "onnx"
+        
+        texts = ["ONNX inference on CPU.", "A second, somewhat longer sentence for the same check."]
+        reference = EmbeddingGenerator(model_name="all-MiniLM-L6-v2").model.encode(texts, convert_to_numpy=True)
+        embeddings = generator.generate_embeddings(texts)
+        cosines = (embeddings * reference).sum(axis=1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        assert cosines.min() >= 0.99
 
 
 class TestVectorStore:
@@ -146,6 +482,43 @@ class TestVectorStore:
         assert "documents" in results
         assert "distances" in results
         assert len(results["documents"]) <= 2
+    
+    def test_bulk_ingest(self):
+        """Test streaming ingestion from a chunk generator."""
+        rng = np.random.default_rng(0)
+        
+        def chunks():
+            for c in range(3):
+                ids = [f"doc-{c}-{i}" for i in range(10)]
+                texts = [f"Document {c}-{i}" for i in range(10)]
+                yield ids, texts, rng.standard_normal((10, 3)).astype(np.float32), None
+        
+        written = self.vector_store.bulk_ingest(chunks(), batch_size=4, max_in_flight=2)
+        
+        assert written == 30
+        assert self.vector_store.get_collection_info()["count"] == 30
+    
+    def test_bulk_ingest_bounds_in_flight_batches(self):
+        """Test that no more than max_in_flight batches are written at once."""
+        active = []
+        peak = []
+        lock = threading.Lock()
+        
+        def slow_write(ids, documents, embeddings, metadatas):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+            return len(ids)
+        
+        chunks = [(None, ["text"] * 20, np.zeros((20, 3), dtype=np.float32), None)]
+        with patch.object(self.vector_store, "_write_batch", side_effect=slow_write):
+            written = self.vector_store.bulk_ingest(chunks, batch_size=2, max_in_flight=3)
+        
+        assert written == 20
+        assert max(peak) <= 3
 
 
 class TestHybridRetriever:
@@ -182,6 +555,61 @@ class TestHybridRetriever:
         assert len(results) <= 2
         assert all("document" in result for result in results)
     
+    def test_batch_hybrid_search(self):
+        """Test batched hybrid search returns one fused result list per query."""
+        self.vector_store.batch_search.return_value = [
+            {
+                "documents": ["Document 1"],
+                "distances": [0.1],
+                "metadatas": [{"source": "1"}],
+                "ids": ["id1"]
+            },
+            {
+                "documents": ["Document 3"],
+                "distances": [0.2],
+                "metadatas": [{"source": "3"}],
+                "ids": ["id3"]
+            }
+        ]
+        
+        results = self.hybrid_retriever.batch_hybrid_search(
+            queries=["Document 1", "Document 3"],
+            query_embeddings=[[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]],
+            k=2
+        )
+        
+        self.vector_store.batch_search.assert_called_once()
+        assert len(results) == 2
+        assert results[0][0]["document"] == "Document 1"
+        assert results[1][0]["document"] == "Document 3"
+    
+    def test_concurrent_search_survives_slow_leg(self):
+        """Test that a leg missing its deadline does not block fusion."""
+        def slow_search(**kwargs):
+            time.sleep(1.0)
+            return {"documents": ["Document 1"], "distances": [0.1], "metadatas": [{}], "ids": ["id1"]}
+        
+        self.vector_store.search.side_effect = slow_search
+        retriever = HybridRetriever(
+            vector_store=self.vector_store,
+            documents=self.documents,
+            concurrent_search=True,
+            vector_timeout=0.1
+        )
+        
+        start = time.time()
+        results = retriever.hybrid_search(
+            query="Document 2",
+            query_embedding=[0.1, 0.2, 0.3],
+            k=2
+        )
+        
+        assert time.time() - start < 0.9
+        assert results[0]["document"] == "Document 2"
+        assert retriever.leg_timeouts["vector"] == 1
+        assert retriever.get_stats()["abandoned_legs"]["vector"] == 1
+        retriever.close()
+    
     def test_update_documents(self):
         """Test document update functionality."""
         new_docs = ["New Document 1", "New Document 2"]
@@ -192,6 +620,754 @@ class TestHybridRetriever:
         assert len(self.hybrid_retriever.documents) == 5
 
 
+class TestBM25Index:
+    """Test incremental BM25 index functionality."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.tokenized_docs = [
+            "machine learning is a subset of artificial intelligence".split(),
+            "deep learning uses neural networks".split(),
+            "bm25 is a ranking function for search".split(),
+            "search engines rank documents".split(),
+            "neural networks learn representations".split()
+        ]
+    
+    def test_incremental_add_matches_bulk_add(self):
+        """Test that appending documents scores the same as indexing them at once."""
+        bulk = BM25Index()
+        bulk.add(self.tokenized_docs)
+        
+        incremental = BM25Index()
+        incremental.add(self.tokenized_docs[:1])
+        incremental.add(self.tokenized_docs[1:])
+        
+        query = ["learning", "search"]
+        assert (bulk.get_scores(query) == incremental.get_scores(query)).all()
+    
+    def test_delete_tombstones_document(self):
+        """Test that deleted documents no longer score."""
+        index = BM25Index()
+        index.add(self.tokenized_docs)
+        
+        assert index.delete([1]) == 1
+        scores = index.get_scores(["machine", "learning"])
+        
+        assert scores[1] == 0.0
+        assert scores[0] > 0.0
+        assert index.num_live_docs == 4
+    
+    def test_top_k_matches_dense_scores(self):
+        """Test that sparse top-k selection agrees with full scoring."""
+        index = BM25Index()
+        index.add(self.tokenized_docs)
+        
+        query = ["neural", "networks", "search"]
+        positions, scores = index.top_k(query, k=2)
+        dense_scores = index.get_scores(query)
+        
+        assert len(positions) == 2
+        assert list(scores) == sorted(scores, reverse=True)
+        assert scores[0] == dense_scores.max()
+        assert all(dense_scores[positions] == scores)
+    
+    def test_batch_top_k_matches_single_queries(self):
+        """Test that batched scoring agrees with scoring queries one by one."""
+        index = BM25Index()
+        index.add(self.tokenized_docs)
+        
+        queries = [["learning"], ["search", "rank"], ["unknown"]]
+        batch = index.batch_top_k(queries, k=3)
+        
+        for query, (positions, scores) in zip(queries, batch):
+            single_positions, single_scores = index.top_k(query, k=3)
+            assert list(positions) == list(single_positions)
+            assert list(scores) == list(single_scores)
+    
+    def test_empty_index(self):
+        """Test scoring against an empty index."""
+        index = BM25Index()
+        
+        assert len(index.get_scores(["anything"])) == 0
+
+
+class TestResultFusion:
+    """Test ID-keyed rank fusion."""
+    
+    def test_rrf_uses_k_constant(self):
+        """Test reciprocal rank fusion scores and ordering."""
+        fusion = ResultFusion(method="rrf", k=60.0)
+        fused = fusion.fuse([["a", "b", "c"], ["b", "d"]])
+        
+        assert fused.ids[0] == "b"
+        assert fused.scores[0] == pytest.approx(1 / 62 + 1 / 61)
+        assert set(fused.ids) == {"a", "b", "c", "d"}
+        assert list(fused.positions[0]) == [1, 0]
+        assert list(fused.positions[fused.ids.index("d")]) == [-1, 1]
+    
+    def test_distinct_ids_with_identical_text_stay_separate(self):
+        """Test that chunks are fused by ID rather than by content."""
+        fusion = ResultFusion(method="rrf", k=0.0)
+        fused = fusion.fuse([["chunk-1", "chunk-2"], ["chunk-2"]])
+        
+        assert fused.ids == ["chunk-2", "chunk-1"]
+    
+    def test_weighted_minmax_fusion(self):
+        """Test weighted fusion over min-max normalized scores."""
+        fusion = ResultFusion(method="weighted", normalization="minmax")
+        fused = fusion.fuse(
+            [["a", "b"], ["b", "a"]],
+            scores=[[0.9, 0.1], [12.0, 2.0]],
+            weights=[0.7, 0.3]
+        )
+        
+        assert fused.ids == ["a", "b"]
+        assert fused.scores[0] == pytest.approx(0.7)
+        assert fused.scores[1] == pytest.approx(0.3)
+    
+    def test_comb_sum_requires_scores(self):
+        """Test CombSUM fusion and its score requirement."""
+        fusion = ResultFusion(method="comb_sum", normalization=None)
+        fused = fusion.fuse([["a", "b"], ["b"]], scores=[[1.0, 0.5], [0.75]])
+        
+        assert fused.ids == ["b", "a"]
+        assert fused.scores[0] == pytest.approx(1.25)
+        
+        with pytest.raises(ValueError):
+            fusion.fuse([["a"]])
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason="faiss not installed")
+class TestFaissIndex:
+    """Test the in-process FAISS vector index."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((50, 16)).astype(np.float32)
+        self.documents = [f"Document {i}" for i in range(50)]
+        self.metadatas = [{"source": "even" if i % 2 == 0 else "odd"} for i in range(50)]
+        self.ids = [f"doc-{i}" for i in range(50)]
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_add_and_search(self):
+        """Test that a stored vector is its own nearest neighbour."""
+        index = FaissIndex()
+        index.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        
+        results = index.search(self.embeddings[7], n_results=3)
+        
+        assert results["ids"][0] == "doc-7"
+        assert results["documents"][0] == "Document 7"
+        assert results["distances"][0] == pytest.approx(0.0, abs=1e-5)
+        assert len(results["ids"]) == 3
+    
+    def test_filter_and_delete(self):
+        """Test metadata filters and tombstoned deletes."""
+        index = FaissIndex()
+        index.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        
+        results = index.search(self.embeddings[7], n_results=5, filter_metadata={"source": "even"})
+        assert all(metadata["source"] == "even" for metadata in results["metadatas"])
+        assert "doc-7" not in results["ids"]
+        
+        assert index.delete(["doc-7"]) == 1
+        assert "doc-7" not in index.search(self.embeddings[7], n_results=5)["ids"]
+        assert index.count() == 49
+
+    def test_repeated_id_in_batch_keeps_last_entry(self):
+        """Test that an ID repeated within one add leaves a single live row."""
+        index = FaissIndex()
+        index.add(["first", "second"], self.embeddings[:2], [{}, {}], ["dup", "dup"])
+
+        assert index.count() == 1
+        assert index.search(self.embeddings[0], n_results=5)["documents"] == ["second"]
+
+        index.delete(["dup"])
+        assert index.search(self.embeddings[1], n_results=5)["ids"] == []
+
+    def test_persistence(self):
+        """Test that the index reloads from disk."""
+        index = FaissIndex(persist_directory=self.temp_dir)
+        index.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        index.delete(["doc-3"])
+        index.close()
+        
+        reloaded = FaissIndex(persist_directory=self.temp_dir)
+        
+        assert reloaded.count() == 49
+        assert reloaded.search(self.embeddings[12], n_results=1)["ids"] == ["doc-12"]
+        assert "doc-3" not in reloaded.search(self.embeddings[3], n_results=5)["ids"]
+    
+    def test_batched_saves_keep_one_version(self):
+        """Test that writes are saved every N operations under a single current version."""
+        index = FaissIndex(persist_directory=self.temp_dir, autosave_every=3, autosave_interval=None)
+        for start in range(0, 50, 10):
+            end = start + 10
+            index.add(self.documents[start:end], self.embeddings[start:end],
+                      self.metadatas[start:end], self.ids[start:end])
+        
+        assert FaissIndex(persist_directory=self.temp_dir).count() == 30
+        assert index.get_stats()["unsaved_writes"] == 2
+        
+        index.close()
+        
+        assert FaissIndex(persist_directory=self.temp_dir).count() == 50
+        assert sorted(os.listdir(self.temp_dir)) == [
+            "documents.2.faiss", "documents.2.json", "documents.manifest.json"
+        ]
+
+
+class TestMemmapVectorStore:
+    """Test the memory-mapped embedding store."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((40, 16)).astype(np.float32)
+        self.documents = [f"Document {i}" for i in range(40)]
+        self.metadatas = [{"source": "even" if i % 2 == 0 else "odd"} for i in range(40)]
+        self.ids = [f"doc-{i}" for i in range(40)]
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_exact_search_across_blocks(self):
+        """Test that blocked search matches brute-force cosine ranking."""
+        store = MemmapVectorStore(self.temp_dir, block_size=7)
+        store.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        
+        query = self.embeddings[5] + 0.1
+        results = store.search(query, n_results=4)
+        
+        normalized = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:4]
+        assert results["ids"] == [f"doc-{i}" for i in expected]
+    
+    def test_filter_delete_and_float16(self):
+        """Test filters and deletes on half-precision storage."""
+        store = MemmapVectorStore(self.temp_dir, dtype="float16")
+        store.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        
+        results = store.search(self.embeddings[8], n_results=3, filter_metadata={"source": "odd"})
+        assert all(metadata["source"] == "odd" for metadata in results["metadatas"])
+        
+        assert store.delete(["doc-8"]) == 1
+        assert "doc-8" not in store.search(self.embeddings[8], n_results=3)["ids"]
+        assert store.count() == 39
+    
+    def test_second_process_view_sees_writes(self):
+        """Test that another handle on the same files sees appends, deletes and compaction."""
+        writer = MemmapVectorStore(self.temp_dir)
+        reader = MemmapVectorStore(self.temp_dir)
+        
+        writer.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        assert reader.search(self.embeddings[3], n_results=1)["ids"] == ["doc-3"]
+        
+        writer.delete(["doc-3"])
+        writer.compact()
+        assert reader.count() == 39
+        assert reader.search(self.embeddings[30], n_results=1)["ids"] == ["doc-30"]
+
+    def test_repeated_id_in_batch_and_retained_generation(self):
+        """Test that a repeated ID stays single and compaction keeps one previous generation."""
+        store = MemmapVectorStore(self.temp_dir)
+        store.add(["first", "second"], self.embeddings[:2], [{}, {}], ["dup", "dup"])
+        assert store.search(self.embeddings[0], n_results=5)["documents"] == ["second"]
+
+        store.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        store.compact()
+        assert sorted(name for name in os.listdir(self.temp_dir) if name.endswith(".vectors")) == [
+            "documents.0.vectors", "documents.1.vectors"
+        ]
+        store.compact()
+        assert sorted(name for name in os.listdir(self.temp_dir) if name.endswith(".vectors")) == [
+            "documents.1.vectors", "documents.2.vectors"
+        ]
+        assert store.count() == 41
+
+    def test_compaction_during_scoring_rescored(self):
+        """Test that a search scored before a compaction is scored again on the new rows."""
+        store = MemmapVectorStore(self.temp_dir)
+        store.add(self.documents, self.embeddings, self.metadatas, self.ids)
+        search_positions = store._search_positions
+        calls = []
+        
+        def compact_once(*args, **kwargs):
+            # Runs outside the store lock, as a writer thread would
+            if not calls:
+                store.delete(["doc-0"])
+                store.compact()
+            calls.append(1)
+            return search_positions(*args, **kwargs)
+        
+        store._search_positions = compact_once
+        results = store.search(self.embeddings[30], n_results=1)
+        assert len(calls) == 2
+        assert results["ids"] == ["doc-30"]
+
+
+class TestQuantization:
+    """Test int8 and product quantization."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((8, 32)).astype(np.float32)
+        self.embeddings = centers[rng.integers(0, 8, 400)] + 0.2 * rng.standard_normal((400, 32)).astype(np.float32)
+        self.queries = self.embeddings[:10] + 0.05
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_code_scores_match_decoded_vectors(self):
+        """Test that asymmetric scoring equals scoring the reconstructed vectors."""
+        for quantizer in (ScalarQuantizer(32), ProductQuantizer(32, num_subvectors=8, num_centroids=16)):
+            quantizer.train(self.embeddings)
+            codes = quantizer.encode(self.embeddings)
+            
+            assert codes.shape == (400, quantizer.code_size)
+            expected = self.queries[:1] @ quantizer.decode(codes).T
+            assert np.allclose(quantizer.score(self.queries[:1], codes), expected, atol=1e-4)
+    
+    def test_recall_at_k(self):
+        """Test recall@k against exact result lists."""
+        assert recall_at_k([["a", "b"], ["c", "x"]], [["a", "b"], ["c", "d"]], k=2) == pytest.approx(0.75)
+    
+    def test_compressed_store_refines_to_exact(self):
+        """Test that int8 search with an exact refine pass recovers the exact top-k."""
+        store = MemmapVectorStore(self.temp_dir, compression="int8", refine_factor=4, min_training_rows=100)
+        ids = [f"doc-{i}" for i in range(400)]
+        store.add([f"Document {i}" for i in range(400)], self.embeddings, [{} for _ in ids], ids)
+        
+        report = store.evaluate_compression(self.queries, k=5)
+        
+        assert report["recall_at_k_refined"] == pytest.approx(1.0)
+        assert report["code_bytes_per_vector"] * 4 == report["float_bytes_per_vector"]
+        assert store.search(self.embeddings[42], n_results=1)["ids"] == ["doc-42"]
+    
+    def test_quantizer_waits_for_sample_and_retrains_on_compact(self):
+        """Test that a small first batch stays exact and compaction retrains the codebooks."""
+        writer = MemmapVectorStore(self.temp_dir, compression="pq", pq_subvectors=8, min_training_rows=300)
+        reader = MemmapVectorStore(self.temp_dir)
+        ids = [f"doc-{i}" for i in range(400)]
+        documents = [f"Document {i}" for i in range(400)]
+        
+        writer.add(documents[:50], self.embeddings[:50], [{} for _ in range(50)], ids[:50])
+        assert reader.get_stats()["quantizer_version"] is None
+        assert reader.search(self.embeddings[7], n_results=1)["ids"] == ["doc-7"]
+        
+        writer.add(documents[50:], self.embeddings[50:], [{} for _ in range(350)], ids[50:])
+        assert reader.get_stats()["quantizer_version"] == 1
+        assert reader.search(self.embeddings[42], n_results=1)["ids"] == ["doc-42"]
+        
+        writer.delete(ids[:50])
+        writer.compact()
+        assert reader.get_stats()["quantizer_version"] == 2
+        assert reader.count() == 350
+        assert reader.search(self.embeddings[300], n_results=1)["ids"] == ["doc-300"]
+        assert reader.evaluate_compression(self.queries[5:], k=5)["recall_at_k_refined"] > 0.9
+        
+        stored = sorted(name for name in os.listdir(self.temp_dir) if name.endswith((".codes", ".npz")))
+        assert stored == [
+            "documents.0.q1.codes", "documents.1.q2.codes",
+            "documents.q1.quantizer.npz", "documents.q2.quantizer.npz"
+        ]
+    
+    def test_pq_dimension_is_checked_on_first_write(self):
+        """Test that a dimension PQ cannot split fails before any row is stored."""
+        store = MemmapVectorStore(self.temp_dir, compression="pq", pq_subvectors=16, min_training_rows=10)
+        rows = np.zeros((5, 100), dtype=np.float32)
+        rows[:, 0] = 1.0
+
+        with pytest.raises(ValueError, match="not divisible"):
+            store.add(["a"] * 5, rows, [{}] * 5, [f"doc-{i}" for i in range(5)])
+        assert store.count() == 0
+        assert store.get_stats()["dimension"] is None
+
+    def test_explicit_training_reencodes_stored_rows(self):
+        """Test that train_quantizer can run after rows were added."""
+        store = MemmapVectorStore(self.temp_dir, compression="int8")
+        ids = [f"doc-{i}" for i in range(400)]
+        store.add([f"Document {i}" for i in range(400)], self.embeddings, [{} for _ in ids], ids)
+        assert store.get_stats()["quantizer_version"] is None
+        
+        store.train_quantizer(self.embeddings)
+        
+        assert store.get_stats()["quantizer_version"] == 1
+        assert store.evaluate_compression(self.queries, k=5)["recall_at_k_refined"] == pytest.approx(1.0)
+
+
+class TestMetadataIndex:
+    """Test the metadata bitmap index."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.metadatas = [
+            {"tenant": "acme", "type": "chunk", "date": "2024-01-05", "public": True},
+            {"tenant": "acme", "type": "summary", "date": "2024-03-10", "public": False},
+            {"tenant": "globex", "type": "chunk", "date": "2024-02-20", "public": True},
+            {"tenant": "globex", "type": "chunk", "date": "2024-06-01"},
+            {"tenant": "initech", "type": "keywords", "date": "2023-12-31", "public": 1}
+        ]
+        self.index = MetadataIndex()
+        self.index.add(range(len(self.metadatas)), self.metadatas)
+    
+    def test_equality_and_boolean_algebra(self):
+        """Test equality, $and, $or and $not filters."""
+        assert list(self.index.positions({"tenant": "acme"})) == [0, 1]
+        assert list(self.index.positions({"tenant": "globex", "type": "chunk"})) == [2, 3]
+        assert list(self.index.positions({"$or": [{"type": "summary"}, {"tenant": "initech"}]})) == [1, 4]
+        assert list(self.index.positions({"$and": [{"type": "chunk"}, {"$not": {"tenant": "acme"}}]})) == [2, 3]
+        # True and 1 are different values
+        assert list(self.index.positions({"public": True})) == [0, 2]
+    
+    def test_operators_and_ranges(self):
+        """Test $in, $nin, $ne and range operators."""
+        assert list(self.index.positions({"type": {"$in": ["summary", "keywords"]}})) == [1, 4]
+        assert list(self.index.positions({"tenant": {"$nin": ["acme", "globex"]}})) == [4]
+        assert list(self.index.positions({"type": {"$ne": "chunk"}})) == [1, 4]
+        assert list(self.index.positions({"date": {"$gte": "2024-02-20", "$lt": "2024-06-01"}})) == [1, 2]
+        assert self.index.count({"date": {"$gt": "2025-01-01"}}) == 0
+    
+    def test_remove_and_append(self):
+        """Test that removed rows drop out and appended rows are indexed."""
+        self.index.remove([0])
+        self.index.add([5], [{"tenant": "acme", "type": "chunk"}])
+        
+        assert list(self.index.positions({"tenant": "acme"})) == [1, 5]
+        assert self.index.count({}) == 5
+    
+    def test_high_cardinality_field_stays_sparse(self):
+        """Test that unique values use position arrays and ranges use the sorted column."""
+        index = MetadataIndex()
+        num_rows = 20000
+        for start in range(0, num_rows, 1000):
+            rows = range(start, start + 1000)
+            index.add(rows, [{"timestamp": 1_700_000_000 + i, "tenant": "acme"} for i in rows])
+        
+        stats = index.get_stats()
+        assert stats["bitmap_postings"] <= 64 + 1
+        assert stats["posting_bytes"] < 64 * num_rows
+        assert index.count({"timestamp": {"$gte": 1_700_000_100, "$lt": 1_700_000_300}}) == 200
+        assert list(index.positions({"timestamp": 1_700_019_999})) == [num_rows - 1]
+        assert index.count({"tenant": "acme", "timestamp": {"$lt": 1_700_000_010}}) == 10
+
+
+class TestSegmentedLRUCache:
+    """Test the in-memory segmented LRU embedding cache."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.vector = np.zeros(16, dtype=np.float32)
+        self.cache = SegmentedLRUCache(max_bytes=10 * self.vector.nbytes)
+    
+    def test_byte_budget_and_counters(self):
+        """Test that the cache stays within its byte budget and counts lookups."""
+        for i in range(15):
+            self.cache.put(f"key-{i}", self.vector)
+        
+        assert self.cache.nbytes == 10 * self.vector.nbytes
+        assert self.cache.get("key-0") is None
+        assert self.cache.get("key-14") is not None
+        stats = self.cache.get_stats()
+        assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (10, 1, 1, 5)
+    
+    def test_hot_entries_survive_a_scan(self):
+        """Test that entries hit twice are not flushed by a stream of new keys."""
+        for i in range(3):
+            self.cache.put(f"hot-{i}", self.vector)
+            self.cache.get(f"hot-{i}")
+        
+        for i in range(100):
+            self.cache.put(f"ingest-{i}", self.vector)
+        
+        assert all(self.cache.get(f"hot-{i}") is not None for i in range(3))
+        assert len(self.cache) == 10
+
+
+class TestRerankScoreCache:
+    """Test the reranker score cache."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.cache = RerankScoreCache(max_entries=3, ttl_seconds=60.0)
+        self.documents = ["chunk a", "chunk b", "chunk c"]
+        self.ids = ["a", "b", "c"]
+    
+    def test_hits_ignore_query_case_and_whitespace(self):
+        """Test that normalized queries share cached scores."""
+        self.cache.put_many("What is RAG?", self.documents[:2], [0.9, 0.1], self.ids[:2])
+        
+        found = self.cache.get_many("  what is   rag? ", self.documents, self.ids)
+        
+        assert found == {0: pytest.approx(0.9), 1: pytest.approx(0.1)}
+        assert self.cache.get_stats()["misses"] == 1
+    
+    def test_changed_text_and_invalidation_miss(self):
+        """Test that edited or invalidated chunks are never served stale scores."""
+        self.cache.put_many("query", self.documents, [0.9, 0.5, 0.1], self.ids)
+        
+        assert self.cache.get_many("query", ["chunk a (edited)"], ["a"]) == {}
+        assert self.cache.invalidate_chunks(["b"]) == 1
+        assert sorted(self.cache.get_many("query", self.documents, self.ids)) == [0, 2]
+    
+    def test_ttl_and_size_bound(self):
+        """Test that entries expire after the TTL and the oldest are evicted."""
+        expiring = RerankScoreCache(max_entries=10, ttl_seconds=0.01)
+        expiring.put_many("query", self.documents, [0.9, 0.5, 0.1], self.ids)
+        time.sleep(0.02)
+        assert expiring.get_many("query", self.documents, self.ids) == {}
+        
+        self.cache.put_many("query", self.documents, [0.9, 0.5, 0.1], self.ids)
+        self.cache.put_many("query", ["chunk d"], [0.3], ["d"])
+        assert sorted(self.cache.get_many("query", self.documents + ["chunk d"], self.ids + ["d"])) == [1, 2, 3]
+        assert self.cache.get_stats()["evictions"] == 1
+
+
+class TestRerankBatcher:
+    """Test cross-request micro-batching of rerank pairs."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.model = Mock()
+        self.model._process_pairs = Mock(side_effect=lambda queries, docs: [len(q) + len(d) / 100 for q, d in zip(queries, docs)])
+        self.batcher = RerankBatcher(self.model, max_wait_ms=50.0, max_batch_size=16)
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        self.batcher.close()
+    
+    def test_concurrent_requests_share_forward_passes(self):
+        """Test that concurrent requests are merged and each gets its own scores."""
+        results = {}
+        
+        def request(i):
+            results[i] = self.batcher.score("q" * i, [f"doc {j}" for j in range(3)])
+        
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        for i in range(1, 5):
+            assert results[i] == [pytest.approx(i + 0.05)] * 3
+        assert self.model._process_pairs.call_count < 4
+        assert self.batcher.get_stats()["pairs"] == 12
+    
+    def test_oversized_requests_are_split_and_errors_propagate(self):
+        """Test the batch size cap and that model errors reach every caller."""
+        scores = self.batcher.score("q", [f"d{j}" for j in range(40)])
+        assert len(scores) == 40
+        assert max(len(call.args[1]) for call in self.model._process_pairs.call_args_list) <= 16
+        
+        self.model._process_pairs.side_effect = RuntimeError("model failure")
+        with pytest.raises(RuntimeError):
+            self.batcher.score("q", ["d"])
+
+
+class TestReranker:
+    """Test reranker scoring around the cross-encoder forward pass."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.reranker = Reranker.__new__(Reranker)
+        self.reranker.model_name = "test-reranker"
+        self.reranker.score_cache = RerankScoreCache(namespace="test-reranker")
+        self.reranker.batcher = None
+        self.reranker._process_batch = Mock(side_effect=lambda query, docs, raise_errors=False: [len(d) / 100 for d in docs])
+    
+    def test_only_cache_misses_are_scored(self):
+        """Test that a repeated query only sends new chunks to the model."""
+        documents = ["short", "a longer chunk", "mid chunk"]
+        first = self.reranker.rerank("query", documents, top_k=3, chunk_ids=["1", "2", "3"])
+        second = self.reranker.rerank("Query", documents + ["another new chunk"], top_k=4, chunk_ids=["1", "2", "3", "4"])
+        
+        assert [doc["document"] for doc in first] == ["a longer chunk", "mid chunk", "short"]
+        assert second[0]["document"] == "another new chunk"
+        assert self.reranker._process_batch.call_args_list[-1].args[1] == ["another new chunk"]
+    
+    def test_cascade_scores_only_survivors(self):
+        """Test that the cascade prunes by embedding margin before the cross-encoder."""
+        cascade = CascadeReranker(self.reranker, margin=0.2, min_extra=1)
+        query_embedding = np.array([1.0, 0.0])
+        easy = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [-0.2, 1.0], [-1.0, 0.1]])
+        hard = np.array([[1.0, 0.0], [0.95, 0.1], [0.97, 0.05], [0.96, 0.08], [0.0, 1.0]])
+        documents = [f"document {i}" for i in range(5)]
+        
+        cascade.rerank("easy", documents, top_k=1, query_embedding=query_embedding, document_embeddings=easy)
+        easy_pairs = cascade.stats["second_stage_pairs"]
+        cascade.rerank("hard", documents, top_k=1, query_embedding=query_embedding, document_embeddings=hard)
+        
+        assert easy_pairs == 2
+        assert cascade.stats["second_stage_pairs"] - easy_pairs == 4
+    
+    def test_cascade_reuses_vector_scores(self):
+        """Test that only results without a vector score are embedded for the first stage."""
+        embedding_generator = Mock()
+        embedding_generator.generate_embeddings.return_value = np.array([[0.0, 1.0]])
+        cascade = CascadeReranker(self.reranker, embedding_generator=embedding_generator, margin=0.2, min_extra=0)
+        search_results = [
+            {"document": "vector hit", "vector_score": 0.0},
+            {"document": "weak vector hit", "vector_score": 0.9},
+            {"document": "hybrid hit", "vector_score": 0.05, "bm25_score": 2.0},
+            {"document": "keyword hit", "bm25_score": 3.0}
+        ]
+        
+        cascade.rerank_with_metadata("query", search_results, top_k=1, query_embedding=np.array([1.0, 0.0]))
+        
+        embedding_generator.generate_embeddings.assert_called_once_with(["keyword hit"], show_progress=False)
+        assert self.reranker._process_batch.call_args.args[1] == ["vector hit", "hybrid hit"]
+    
+    def test_cascade_close_stops_inner_batcher(self):
+        """Test that closing the cascade stops the batcher of the wrapped reranker."""
+        batcher = Mock()
+        self.reranker.batcher = batcher
+        CascadeReranker(self.reranker).close()
+        
+        batcher.close.assert_called_once()
+        assert self.reranker.batcher is None
+    
+    def test_rank_parity_report(self):
+        """Test that the int8 parity check accepts reordered ties but rejects swapped rankings."""
+        reference = [[0.9, 0.6, 0.2, 0.1], [0.8, 0.3, 0.5]]
+        close = [[0.88, 0.61, 0.22, 0.09], [0.79, 0.31, 0.52]]
+        swapped = [[0.1, 0.6, 0.2, 0.9], [0.3, 0.8, 0.5]]
+        
+        passing = rank_parity_report(reference, close)
+        failing = rank_parity_report(reference, swapped)
+        
+        assert passing["passed"] and passing["mean_spearman"] == pytest.approx(1.0)
+        assert passing["top1_agreement"] == 1.0
+        assert not failing["passed"] and failing["top1_agreement"] == 0.0
+    
+    def test_tune_max_length_fits_chunk_sizes(self):
+        """Test that truncation is fitted to the token lengths of sample pairs."""
+        tokenizer = Mock(side_effect=lambda query, document, truncation=False: {"input_ids": [0] * (len(document.split()) + 5)})
+        tokenizer.model_max_length = 512
+        self.reranker.tokenizer = tokenizer
+        documents = ["word " * n for n in [20, 40, 60, 80, 1000]]
+        
+        assert self.reranker.tune_max_length(documents, percentile=75) == 88
+        assert self.reranker.max_length == 88
+
+
+class TestDimensionReduction:
+    """Test PCA and Matryoshka dimension reduction."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        rng = np.random.default_rng(0)
+        # 64-dimensional embeddings that mostly live in a 16-dimensional subspace
+        basis = rng.standard_normal((16, 64))
+        self.corpus = rng.standard_normal((500, 16)) @ basis + 0.01 * rng.standard_normal((500, 64))
+        self.queries = self.corpus[:20] + 0.1 * rng.standard_normal((20, 64))
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_pca_keeps_recall_and_roundtrips(self):
+        """Test that PCA to the intrinsic dimension keeps recall and survives save/load."""
+        reducer = PCAReducer(16).fit(self.corpus)
+        path = os.path.join(self.temp_dir, "pca.npz")
+        reducer.save(path)
+        loaded = PCAReducer.load(path)
+        
+        reduced = loaded.transform(self.corpus)
+        assert reduced.shape == (500, 16)
+        assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+        assert np.allclose(reduced, reducer.transform(self.corpus))
+        assert reducer.explained_variance_ratio > 0.99
+    
+    def test_matryoshka_truncates_and_normalizes(self):
+        """Test that Matryoshka reduction keeps the leading dimensions."""
+        reduced = MatryoshkaReducer(8).transform(self.corpus)
+        
+        expected = self.corpus[:, :8] / np.linalg.norm(self.corpus[:, :8], axis=1, keepdims=True)
+        assert np.allclose(reduced, expected, atol=1e-5)
+    
+    def test_recall_vs_dimension_report(self):
+        """Test that the report finds the smallest dimension meeting a recall target."""
+        report = recall_vs_dimension(self.corpus, self.queries, [4, 16, 32], method="pca", k=5)
+        
+        assert [row["dimension"] for row in report] == [4, 16, 32]
+        assert report[0]["recall_at_k"] < report[1]["recall_at_k"]
+        assert report[1]["recall_at_k"] >= 0.95
+        assert choose_dimension(report, min_recall=0.95) == 16
+
+
+class TestPersistentEmbeddingCache:
+    """Test the persistent embedding cache."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "embeddings.sqlite")
+        self.embeddings = np.random.default_rng(0).standard_normal((10, 8)).astype(np.float32)
+        self.texts = [f"Text {i}" for i in range(10)]
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_entries_survive_reopening(self):
+        """Test that embeddings written by one instance are read by another."""
+        cache = PersistentEmbeddingCache(self.path)
+        cache.put_many("model-a", self.texts, self.embeddings)
+        cache.close()
+        
+        reopened = PersistentEmbeddingCache(self.path)
+        found = reopened.get_many("model-a", ["Text 3", "Unknown", "Text 3"])
+        
+        assert sorted(found) == [0, 2]
+        assert np.array_equal(found[0], self.embeddings[3])
+        assert reopened.get_many("model-b", ["Text 3"]) == {}
+        stats = reopened.get_stats()
+        assert stats["entries"] == 10
+        assert stats["bytes"] == self.embeddings.nbytes
+        assert stats["hits"] == 2
+        reopened.close()
+    
+    def test_evicts_least_recently_used(self):
+        """Test that the byte budget evicts the entries read least recently."""
+        row_bytes = self.embeddings[0].nbytes
+        cache = PersistentEmbeddingCache(self.path, max_bytes=4 * row_bytes, evict_fraction=0.5)
+        cache.put_many("model-a", self.texts[:4], self.embeddings[:4])
+        time.sleep(0.01)
+        cache.get_many("model-a", ["Text 0"])
+        cache.put_many("model-a", self.texts[4:5], self.embeddings[4:5])
+        
+        remaining = cache.get_many("model-a", self.texts[:5])
+        
+        assert sorted(remaining) == [0, 4]
+        assert cache.get_stats()["bytes"] == 2 * row_bytes
+        cache.close()
+    
+    def test_reads_buffer_access_times(self):
+        """Test that hits do not write until enough access times are buffered."""
+        cache = PersistentEmbeddingCache(self.path, touch_flush_every=3)
+        cache.put_many("model-a", self.texts, self.embeddings)
+        writes = cache._conn.total_changes
+        
+        cache.get_many("model-a", self.texts[:2])
+        assert cache._conn.total_changes == writes
+        
+        cache.get_many("model-a", self.texts[2:3])
+        assert cache._conn.total_changes == writes + 3
+        cache.close()
+
+
 class TestPromptManager:
     """Test prompt management functionality."""
     
@@ -256,6 +1432,226 @@ class TestLLMManager:
             info = self.llm_manager.get_model_info(models[0])
             assert "name" in info
             assert "type" in info
+    
+    def _stub_model(self, name, delay, text):
+        def generate(prompt, **kwargs):
+            time.sleep(delay)
+            return Mock(generations=[[Mock(text=text)]])
+        self.llm_manager.models[name] = Mock(generate=Mock(side_effect=generate))
+    
+    def test_deadline_moves_on_to_fallback(self):
+        """Test that a hung primary is abandoned at its deadline and counted by its breaker."""
+        self._stub_model("gpt-4", 1.0, "primary")
+        self._stub_model("claude-3-sonnet-20240229", 0.0, "fallback")
+        self.llm_manager.model_deadlines = {"gpt-4": 0.1}
+        
+        start = time.perf_counter()
+        result = self.llm_manager.generate("question")
+        
+        assert result["model_used"] == "claude-3-sonnet-20240229"
+        assert time.perf_counter() - start < 0.5
+        assert self.llm_manager.breakers["gpt-4"].stats["failures"] == 1
+    
+    def test_queued_call_cancelled_without_breaker_failure(self):
+        """Test that a call still waiting for a worker at its deadline is cancelled, not charged."""
+        self._stub_model("gpt-4", 0.0, "primary")
+        self._stub_model("claude-3-sonnet-20240229", 0.0, "fallback")
+        self.llm_manager.model_deadlines = {"gpt-4": 0.1}
+        self.llm_manager._executor.shutdown()
+        self.llm_manager._executor = ThreadPoolExecutor(max_workers=1)
+        self.llm_manager._executor.submit(time.sleep, 0.3)
+        
+        result = self.llm_manager.generate("question")
+        
+        assert result["model_used"] == "claude-3-sonnet-20240229"
+        self.llm_manager.models["gpt-4"].generate.assert_not_called()
+        assert self.llm_manager.breakers["gpt-4"].stats["failures"] == 0
+        self.llm_manager._executor.shutdown()
+    
+    def test_hedged_request_wins_when_primary_is_slow(self):
+        """Test that hedging sends to the fallback after the hedge delay and takes the first answer."""
+        self._stub_model("gpt-4", 1.0, "primary")
+        self._stub_model("claude-3-sonnet-20240229", 0.0, "fallback")
+        self.llm_manager.hedge = True
+        self.llm_manager.hedge_delay = 0.05
+        
+        start = time.perf_counter()
+        result = self.llm_manager.generate("question")
+        
+        assert result["text"] == "fallback"
+        assert time.perf_counter() - start < 0.5
+        assert self.llm_manager.hedge_stats == {"hedged_requests": 1, "hedge_wins": 1}
+    
+    def test_async_path_skips_open_breaker(self):
+        """Test that the async path skips a model whose breaker is open."""
+        async def acomplete(model_name, prompt, **kwargs):
+            if model_name == "gpt-4":
+                raise RuntimeError("provider down")
+            return "fallback", 5
+        self.llm_manager._acomplete = acomplete
+        for breaker in self.llm_manager.breakers.values():
+            breaker.failure_threshold = 2
+        
+        results = [asyncio.run(self.llm_manager.agenerate("question")) for _ in range(3)]
+        
+        assert all(result["model_used"] == "claude-3-sonnet-20240229" for result in results)
+        assert self.llm_manager.breakers["gpt-4"].state == "open"
+        assert self.llm_manager.breakers["gpt-4"].stats["failures"] == 2
+        assert self.llm_manager.breakers["gpt-4"].stats["rejected"] == 1
+
+
+class TestCircuitBreaker:
+    """Test the per-model circuit breaker."""
+    
+    def test_opens_and_recovers_through_probe(self):
+        """Test that failures open the breaker and a successful probe closes it."""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        
+        assert breaker.state == "open" and not breaker.allow()
+        time.sleep(0.06)
+        probe = breaker.allow()
+        assert probe
+        assert not breaker.allow()  # only one probe while half-open
+        breaker.record_success(0.01, probe)
+        assert breaker.state == "closed" and breaker.allow()
+    
+    def test_only_the_probe_decides_a_half_open_breaker(self):
+        """Test that a call admitted while closed cannot close the breaker or free the probe slot."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        early = breaker.allow()
+        breaker.record_failure(breaker.allow())
+        time.sleep(0.06)
+        probe = breaker.allow()
+        
+        breaker.record_success(0.01, early)
+        assert breaker.state == "half_open" and not breaker.allow()
+        breaker.record_failure(early)
+        assert breaker.state == "half_open" and not breaker.allow()
+        
+        breaker.record_failure(probe)
+        assert breaker.state == "open" and breaker.stats["opened"] == 2
+    
+    def test_latency_slo_breaches_count_as_failures(self):
+        """Test that slow successes open the breaker and feed the latency percentile."""
+        breaker = CircuitBreaker(failure_threshold=3, latency_slo=1.0)
+        for latency in [0.2, 2.0, 3.0, 4.0]:
+            breaker.record_success(latency)
+        
+        assert breaker.state == "open"
+        assert breaker.stats["slow_calls"] == 3
+        assert breaker.latency_percentile(50, min_samples=4) == pytest.approx(2.5)
+        assert breaker.latency_percentile(50, min_samples=5) is None
+
+
+class _StubChatHandler(_StubEmbeddingHandler):
+    """OpenAI-style /chat/completions stub that upper-cases the prompt and tracks concurrency."""
+    
+    delay = 0.1
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        handler = type(self)
+        with handler.lock:
+            handler.active += 1
+            handler.peak = max(handler.peak, handler.active)
+        time.sleep(self.delay)
+        with handler.lock:
+            handler.active -= 1
+        
+        content = body["messages"][-1]["content"].upper()
+        base = {"id": "stub", "created": 0, "model": body["model"]}
+        if not body.get("stream"):
+            self._reply(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+            })
+            return
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in content.split():
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class TestLLMManagerAsync:
+    """Test async generation against a local OpenAI-style stub server."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        _StubChatHandler.active = _StubChatHandler.peak = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.env = patch.dict(os.environ, {"OPENAI_BASE_URL": f"http://127.0.0.1:{self.server.server_address[1]}"})
+        self.env.start()
+        self.llm_manager = LLMManager(
+            openai_api_key="test_key",
+            primary_model="gpt-3.5-turbo",
+            max_concurrency_per_model=4
+        )
+    
+    def teardown_method(self):
+        """Cleanup after each test."""
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_concurrency_is_bounded_per_model(self):
+        """Test that concurrent generations share the model's slots and report queue time."""
+        async def run():
+            try:
+                return await asyncio.gather(*(
+                    self.llm_manager.agenerate(f"question {i}", use_fallback=False) for i in range(12)
+                ))
+            finally:
+                await self.llm_manager.aclose()
+        
+        results = asyncio.run(run())
+        stats = self.llm_manager.get_queue_stats()["gpt-3.5-turbo"]
+        
+        assert all(result["success"] for result in results)
+        assert results[3]["text"] == "QUESTION 3"
+        assert _StubChatHandler.peak == 4
+        assert stats["requests"] == 12 and stats["in_flight"] == 0
+        # The last wave waited for two earlier waves of 100ms requests
+        assert stats["max_queue_ms"] >= 150
+    
+    def test_clients_are_kept_per_event_loop(self):
+        """Test that each event loop gets its own pooled client and aclose closes it."""
+        async def client_and_close():
+            client = self.llm_manager._async_client("openai")
+            assert self.llm_manager._async_client("openai") is client
+            await self.llm_manager.aclose()
+            return client
+        
+        first = asyncio.run(client_and_close())
+        second = asyncio.run(client_and_close())
+        
+        assert first is not second and first.is_closed() and second.is_closed()
+        assert self.llm_manager._loop_state == {}
+    
+    def test_astream_yields_chunks(self):
+        """Test that async streaming yields the completion piece by piece."""
+        async def run():
+            chunks = [chunk async for chunk in self.llm_manager.astream("hello async world")]
+            await self.llm_manager.aclose()
+            return chunks
+        
+        chunks = asyncio.run(run())
+        
+        assert len(chunks) == 3
+        assert "".join(chunks) == "HELLO ASYNC WORLD "
 
 
 class TestRAGEvaluator:
@@ -285,6 +1681,104 @@ class TestRAGEvaluator:
         assert overlap > 0  # Should have some overlap
 
 
+def _topic_embedding(text):
+    """Embed text by the topics it mentions, so paraphrases share a vector."""
+    topics = [("price", "pricing", "cost"), ("refund", "return"), ("password", "login")]
+    text = text.lower()
+    return np.array([[float(any(word in text for word in words)) for words in topics] + [0.1]])
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason="faiss not installed")
+class TestSemanticResponseCache:
+    """Test the semantic response cache."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.embedding_generator = Mock()
+        self.embedding_generator.generate_embeddings.side_effect = _topic_embedding
+        self.cache = SemanticResponseCache(self.embedding_generator, similarity_threshold=0.9, max_entries=2)
+        self.result = {"answer": "Plans start at $10 per month.", "sources": [{"id": 1}]}
+    
+    def test_paraphrase_hits_within_scope(self):
+        """Test that a paraphrase hits while other scopes and topics miss."""
+        self.cache.store("pricing?", "qa", "assistant", self.result, corpus_version=1)
+        
+        hit = self.cache.lookup("How much does it cost?", "qa", "assistant", corpus_version=1)
+        
+        assert hit["result"]["answer"] == self.result["answer"]
+        assert hit["query"] == "pricing?"
+        assert self.cache.lookup("How much does it cost?", "summarization", "assistant", corpus_version=1) is None
+        assert self.cache.lookup("How do I reset my password?", "qa", "assistant", corpus_version=1) is None
+        assert self.cache.get_stats()["hit_rate"] == pytest.approx(1 / 3)
+    
+    def test_corpus_version_change_invalidates(self):
+        """Test that a new corpus version drops cached answers."""
+        self.cache.store("pricing?", "qa", "assistant", self.result, corpus_version=1)
+        
+        assert self.cache.lookup("pricing?", "qa", "assistant", corpus_version=2) is None
+        assert self.cache.get_stats()["entries"] == 0
+    
+    def test_lru_eviction_and_false_hit_sampling(self):
+        """Test entry eviction and that a sampled hit with a different answer counts as false."""
+        self.cache.store("pricing?", "qa", "assistant", self.result)
+        self.cache.store("refund policy?", "qa", "assistant", {"answer": "Refunds within 30 days."})
+        self.cache.store("forgot my login", "qa", "assistant", {"answer": "Use the reset link."})
+        assert self.cache.lookup("pricing?", "qa", "assistant") is None
+        
+        hit = self.cache.lookup("can I return it?", "qa", "assistant")
+        assert self.cache.check_hit("can I return it?", hit, {"answer": "Reset your password from the login page."})
+        
+        stats = self.cache.get_stats()
+        assert stats["evictions"] == 1
+        assert stats["false_hit_rate"] == 1.0
+        assert stats["recent_false_hits"][0]["cached_query"] == "refund policy?"
+        assert stats["entries"] == 1
+        assert self.cache.lookup("refund policy?", "qa", "assistant") is None
+
+
+class TestContextPacker:
+    """Test token-budget context packing."""
+    
+    def setup_method(self):
+        """Setup for each test."""
+        self.packer = ContextPacker(token_budget=120, min_trim_tokens=8)
+        self.sentence = "Retrieval quality depends on chunk size and overlap settings."
+    
+    def test_fills_budget_and_truncates_last_passage(self):
+        """Test that passages fill the budget in order and the last one is cut at a sentence."""
+        documents = [
+            {"document": "Pricing starts at ten dollars per month for the basic plan."},
+            {"document": " ".join(f"Sentence {i} about embeddings." for i in range(40))},
+            {"document": "The refund window is thirty days from purchase."}
+        ]
+        
+        context, report = self.packer.pack(documents)
+        
+        assert report["tokens"] <= 120
+        assert report["sources"] == [1, 2]
+        assert report["truncated"]
+        assert report["over_budget_dropped"] == 1
+        assert context.startswith("Source 1:\nPricing")
+        assert context.rstrip().endswith("embeddings.")
+        assert "refund" not in context
+    
+    def test_drops_near_duplicates_and_keeps_source_numbers(self):
+        """Test that a near-duplicate passage is skipped without renumbering the rest."""
+        documents = [
+            {"document": self.sentence},
+            {"document": self.sentence.replace("settings.", "settings!")},
+            {"document": "Rerankers reorder candidates by cross-encoder relevance."}
+        ]
+        
+        context, report = self.packer.pack(documents)
+        
+        assert report["duplicates_dropped"] == 1
+        assert report["sources"] == [1, 3]
+        assert "Source 2:" not in context
+        assert "Source 3:\nRerankers" in context
+        assert self.packer.get_stats()["duplicates_dropped"] == 1
+
+
 class TestRAGGenerator:
     """Test RAG generator functionality."""
     
@@ -326,6 +1820,50 @@ class TestRAGGenerator:
         assert "sources" in result
         assert result["answer"] == "Test response"
     
+    def test_agenerate_answer(self):
+        """Test that the async path awaits the LLM manager and reports queue time."""
+        self.llm_manager.agenerate = AsyncMock(return_value={
+            **self.llm_manager.generate.return_value, "queue_time": 0.25
+        })
+        
+        result = asyncio.run(self.rag_generator.agenerate_answer("Test question"))
+        
+        assert result["answer"] == "Test response"
+        assert result["queue_time"] == 0.25
+        self.llm_manager.agenerate.assert_awaited_once()
+        self.llm_manager.generate.assert_not_called()
+    
+    @pytest.mark.skipif(not FAISS_AVAILABLE, reason="faiss not installed")
+    def test_semantic_cache_skips_generation_for_paraphrases(self):
+        """Test that a paraphrased query is answered from the semantic cache."""
+        embedder = Mock()
+        embedder.generate_embeddings.side_effect = _topic_embedding
+        self.rag_generator.response_cache = SemanticResponseCache(embedder, false_hit_sample_rate=0.0)
+        
+        first = self.rag_generator.generate_answer("pricing?")
+        second = self.rag_generator.generate_answer("How much does it cost?")
+        
+        assert second["answer"] == first["answer"] == "Test response"
+        assert second["cached"] and second["tokens_used"] == 0
+        assert self.llm_manager.generate.call_count == 1
+        assert self.hybrid_retriever.hybrid_search.call_count == 1
+    
+    @pytest.mark.skipif(not FAISS_AVAILABLE, reason="faiss not installed")
+    def test_semantic_cache_is_scoped_by_request_options(self):
+        """Test that a different model or retrieval depth is not served another request's answer."""
+        embedder = Mock()
+        embedder.generate_embeddings.side_effect = _topic_embedding
+        self.rag_generator.response_cache = SemanticResponseCache(embedder, false_hit_sample_rate=0.0)
+        
+        self.rag_generator.generate_answer("pricing?", model_name="gpt-4")
+        other_model = self.rag_generator.generate_answer("pricing?", model_name="claude-3-sonnet")
+        deeper = self.rag_generator.generate_answer("pricing?", top_k=10, model_name="gpt-4")
+        same = self.rag_generator.generate_answer("How much does it cost?", model_name="gpt-4")
+        
+        assert not other_model.get("cached") and not deeper.get("cached")
+        assert same["cached"]
+        assert self.llm_manager.generate.call_count == 3
+    
     def test_prepare_context(self):
         """Test context preparation."""
         documents = [